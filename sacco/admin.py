@@ -1,7 +1,53 @@
-from django.contrib import admin
-from .models import Member,Loan,Transaction
+from django.contrib import admin, messages
+
+from . import posting
+from .models import Member,Loan,Transaction,DividendRun,Journal,LedgerAccount,BatchRun,CheckoffFile,ArchiveSegment
 # Register your models here.
 
-admin.site.register(Member)
-admin.site.register(Loan)
-admin.site.register(Transaction)
+
+class MemberChoicesMixin:
+    """ Member.__str__ shows the username, so member dropdowns join the user in """
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == "member":
+            kwargs["queryset"] = Member.objects.select_related("user")
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+
+@admin.register(Member)
+class MemberAdmin(admin.ModelAdmin):
+    list_select_related = ("user",)
+
+
+@admin.register(Loan)
+class LoanAdmin(MemberChoicesMixin, admin.ModelAdmin):
+    list_select_related = ("member__user",)
+    actions = ["approve_loans", "reject_loans"]
+
+    def _decide(self, request, decisions, verb):
+        outcomes = posting.decide_loans(decisions, request.user)
+        skipped = [f"{outcome['loan']} ({outcome['message']})" for outcome in outcomes if outcome["status"] == "skipped"]
+        self.message_user(request, f"{len(outcomes) - len(skipped)} loans {verb}.")
+        if skipped:
+            self.message_user(request, f"Skipped loans: {', '.join(skipped)}", messages.WARNING)
+
+    @admin.action(description="Approve selected pending loans at their requested amount")
+    def approve_loans(self, request, queryset):
+        self._decide(request, [(loan_id, "approve", amount) for loan_id, amount in queryset.values_list("id", "amount")], "approved")
+
+    @admin.action(description="Reject selected pending loans")
+    def reject_loans(self, request, queryset):
+        self._decide(request, [(loan_id, "reject", None) for loan_id in queryset.values_list("id", flat=True)], "rejected")
+
+
+@admin.register(Transaction)
+class TransactionAdmin(MemberChoicesMixin, admin.ModelAdmin):
+    list_select_related = ("member__user",)
+
+
+admin.site.register(DividendRun)
+admin.site.register(LedgerAccount)
+admin.site.register(Journal)
+admin.site.register(BatchRun)
+admin.site.register(CheckoffFile)
+admin.site.register(ArchiveSegment)
@@ -0,0 +1,200 @@
+"""
+Vectorized amortization engine. Schedules and accruals for any number of loans
+are computed at once as NumPy arrays (one row per loan, one column per month),
+so the whole loan book is priced without a Python loop per loan.
+
+Loan.interest_rate is a monthly percentage, as in Loan.calculate_interest.
+"""
+from datetime import datetime
+from decimal import Decimal
+
+import numpy as np
+
+from .models import Loan
+
+METHODS = ("flat", "reducing", "annuity")
+DAYS_PER_YEAR = 365
+PORTFOLIO_CHUNK_SIZE = 10000
+
+
+class Schedule:
+    """ Repayment schedules for n loans as (n, months) arrays; months past a loan's term are zero """
+
+    def __init__(self, loan_ids, installment, principal, interest, balance, terms):
+        self.loan_ids = loan_ids
+        self.installment = installment
+        self.principal = principal
+        self.interest = interest
+        self.balance = balance
+        self.terms = terms
+
+    def __len__(self):
+        return len(self.loan_ids)
+
+    @property
+    def total_interest(self):
+        return self.interest.sum(axis=1)
+
+    @property
+    def total_repayable(self):
+        return self.installment.sum(axis=1)
+
+    def rows(self, index=0):
+        """ One loan's schedule as a list of dicts with Decimal amounts """
+        return [
+            {
+                "month": month + 1,
+                "installment": Decimal(f"{self.installment[index, month]:.2f}"),
+                "principal": Decimal(f"{self.principal[index, month]:.2f}"),
+                "interest": Decimal(f"{self.interest[index, month]:.2f}"),
+                "balance": Decimal(f"{self.balance[index, month]:.2f}"),
+            }
+            for month in range(int(self.terms[index]))
+        ]
+
+
+def _as_array(values, dtype=float):
+    return np.atleast_1d(np.asarray(values, dtype=dtype))
+
+
+def amortize(principal, monthly_rate, months, method="reducing", loan_ids=None):
+    """ Build schedules for many loans at once.
+
+    principal, monthly_rate (percent per month) and months are scalars or equal-length
+    sequences. Methods:
+      flat      - interest on the original principal every month, equal principal parts
+      reducing  - equal principal parts, interest on the outstanding balance
+      annuity   - equal installments (interest on the outstanding balance)
+    Balances are rounded to cents and principal parts taken as their differences,
+    so every schedule repays exactly its principal.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown amortization method '{method}'.")
+
+    principal = _as_array(principal)
+    rate = _as_array(monthly_rate) / 100
+    terms = _as_array(months, dtype=np.int64)
+    principal, rate, terms = np.broadcast_arrays(principal, rate, terms)
+    if (terms <= 0).any():
+        raise ValueError("Loan duration must be at least one month.")
+
+    width = int(terms.max()) if len(terms) else 0
+    k = np.arange(1, width + 1)  # month numbers, broadcast against one loan per row
+    active = k[None, :] <= terms[:, None]
+    P, r, n = principal[:, None], rate[:, None], terms[:, None]
+
+    if method == "annuity":
+        growth = (1 + r) ** k
+        with np.errstate(divide="ignore", invalid="ignore"):
+            payment = np.where(r > 0, P * r / (1 - (1 + r) ** -n), P / n)
+            balance = np.where(r > 0, P * growth - payment * (growth - 1) / np.where(r > 0, r, 1), P - payment * k)
+    else:
+        balance = P - P * k / n
+
+    balance = np.where(active, np.round(np.clip(balance, 0, None), 2), 0.0)
+    balance[np.arange(len(terms)), terms - 1] = 0.0  # the last installment clears the loan
+
+    opening = np.hstack([principal[:, None], balance[:, :-1]])
+    principal_part = np.where(active, opening - balance, 0.0)
+    if method == "flat":
+        interest = np.where(active, np.round(P * r, 2), 0.0)
+    else:
+        interest = np.where(active, np.round(opening * r, 2), 0.0)
+
+    if loan_ids is None:
+        loan_ids = np.arange(len(terms))
+    return Schedule(
+        loan_ids=_as_array(loan_ids, dtype=np.int64),
+        installment=np.round(principal_part + interest, 2),
+        principal=np.round(principal_part, 2),
+        interest=interest,
+        balance=balance,
+        terms=terms,
+    )
+
+
+def daily_accrual(balance, monthly_rate, days=1):
+    """ Interest accrued over `days` on outstanding balances (monthly rate annualized, actual/365) """
+    balance = _as_array(balance)
+    rate = _as_array(monthly_rate) / 100
+    return np.round(balance * rate * 12 / DAYS_PER_YEAR * days, 2)
+
+
+def loan_schedule(loan, method="reducing"):
+    """ The repayment schedule of one loan, as a list of dict rows """
+    return amortize(loan.amount, loan.interest_rate, loan.duration_months, method, [loan.pk]).rows()
+
+
+def loan_arrays(queryset, fields):
+    """ Read the given loan fields into one array per field with a single query """
+    rows = list(queryset.values_list(*fields))
+    if not rows:
+        return [np.empty(0) for _ in fields]
+    return [np.array(column, dtype=object if isinstance(column[0], datetime) else float) for column in zip(*rows)]
+
+
+def _chunks(queryset, chunk_size):
+    """ Yield querysets over pk ranges so a large book is never held in memory at once """
+    last_id = 0
+    while True:
+        ids = list(queryset.filter(id__gt=last_id).order_by("id").values_list("id", flat=True)[:chunk_size])
+        if not ids:
+            return
+        yield queryset.filter(id__gte=ids[0], id__lte=ids[-1])
+        last_id = ids[-1]
+
+
+def portfolio_schedules(queryset=None, method="reducing", chunk_size=PORTFOLIO_CHUNK_SIZE):
+    """ Yield a Schedule per chunk of loans (approved loans by default), ordered by id """
+    if queryset is None:
+        queryset = Loan.objects.filter(status="approved")
+    for chunk in _chunks(queryset, chunk_size):
+        ids, amount, rate, months = loan_arrays(chunk.order_by("id"), ["id", "amount", "interest_rate", "duration_months"])
+        yield amortize(amount, rate, months.astype(np.int64), method, ids)
+
+
+def portfolio_accrual(queryset=None, days=1, chunk_size=PORTFOLIO_CHUNK_SIZE):
+    """ Return (loan ids, accrued interest) arrays for every open loan's outstanding balance """
+    if queryset is None:
+        queryset = Loan.objects.filter(status="approved", repayment_status="ongoing", remaining_balance__gt=0)
+    ids, accrued = [], []
+    for chunk in _chunks(queryset, chunk_size):
+        chunk_ids, balance, rate = loan_arrays(chunk.order_by("id"), ["id", "remaining_balance", "interest_rate"])
+        ids.append(chunk_ids.astype(np.int64))
+        accrued.append(daily_accrual(balance, rate, days))
+    if not ids:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    return np.concatenate(ids), np.concatenate(accrued)
+
+
+def portfolio_projection(queryset=None, method="reducing", chunk_size=PORTFOLIO_CHUNK_SIZE):
+    """ Expected collections per calendar month across the book.
+
+    Returns a list of (year, month, installment, principal, interest) tuples, each
+    loan's schedule starting the month after it was created.
+    """
+    if queryset is None:
+        queryset = Loan.objects.filter(status="approved")
+    totals = {}
+    for chunk in _chunks(queryset, chunk_size):
+        ids, amount, rate, months, created = loan_arrays(
+            chunk.order_by("id"), ["id", "amount", "interest_rate", "duration_months", "created_at"]
+        )
+        schedule = amortize(amount, rate, months.astype(np.int64), method, ids)
+
+        # Month index (year * 12 + month - 1) of every installment, the first falling the month
+        # after creation; bincount then sums each amount column into its calendar month
+        starts = np.array([date.year * 12 + date.month for date in created], dtype=np.int64)
+        month_index = starts[:, None] + np.arange(schedule.installment.shape[1])[None, :]
+        base = int(month_index.min())
+        for name in ("installment", "principal", "interest"):
+            sums = np.bincount((month_index - base).ravel(), weights=getattr(schedule, name).ravel())
+            for offset, value in enumerate(sums):
+                row = totals.setdefault(base + offset, {"installment": 0.0, "principal": 0.0, "interest": 0.0})
+                row[name] += value
+
+    return [
+        (index // 12, index % 12 + 1, *(Decimal(f"{row[name]:.2f}") for name in ("installment", "principal", "interest")))
+        for index, row in sorted(totals.items())
+        if any(row.values())
+    ]
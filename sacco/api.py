@@ -0,0 +1,133 @@
+"""
+Versioned JSON API for mobile clients, mounted at /api/v1/.
+
+The views are async: served through sacco_management/asgi.py, a request that is
+waiting on the database does not hold a worker thread, so one process can keep
+many client connections open. Reads use the async ORM. Transfers go through the
+posting engine, whose atomic blocks are synchronous, via sync_to_async.
+
+Clients authenticate with the Django session (see the login view); POSTs need the
+CSRF token like any form. Amounts are returned as decimal strings.
+"""
+import json
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET, require_POST
+
+from . import archive, posting
+from .forms import FundTransferForm
+from .models import Loan, Member, Transaction
+
+STATEMENT_LENGTH = 10
+MAX_STATEMENT_LENGTH = 100
+LOAN_FIELDS = [
+    "id", "amount", "remaining_balance", "total_withdrawn", "interest_rate",
+    "duration_months", "status", "repayment_status", "created_at",
+]
+
+
+def _error(message, status):
+    return JsonResponse({"success": False, "message": message}, status=status)
+
+
+def member_required(view):
+    """ Pass the signed-in user's Member to the view; 401/404 as JSON instead of a login redirect """
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        user = await request.auser()
+        if not user.is_authenticated:
+            return _error("Authentication required.", 401)
+        try:
+            member = await Member.objects.aget(user=user)
+        except Member.DoesNotExist:
+            return _error("No member profile for this user.", 404)
+        return await view(request, member, *args, **kwargs)
+    return wrapper
+
+
+def _balances(member):
+    return {
+        "wallet_balance": member.balance,
+        "savings_balance": member.savings_balance,
+        "total_balance": member.balance + member.savings_balance,
+    }
+
+
+@require_GET
+@member_required
+async def balance(request, member):
+    return JsonResponse({"success": True, **_balances(member)})
+
+
+@require_GET
+@member_required
+async def statement(request, member):
+    """ The member's latest transactions (?limit=, default 10) """
+    try:
+        limit = min(int(request.GET.get("limit", STATEMENT_LENGTH)), MAX_STATEMENT_LENGTH)
+    except ValueError:
+        return _error("limit must be a number.", 400)
+
+    fields = ["id", "transaction_type", "amount", "description", "created_at"]
+    limit = max(limit, 0)
+    transactions = Transaction.objects.filter(member=member).order_by("-created_at", "-id").values(*fields)[:limit]
+    rows = [row async for row in transactions]
+    if len(rows) < limit:
+        # Older months may have been moved to the archive (see sacco/archive.py)
+        position = (rows[-1]["created_at"], rows[-1]["id"]) if rows else None
+        rows += await sync_to_async(archive.older_member_rows)(member.id, position, limit - len(rows), fields)
+    return JsonResponse({"success": True, "transactions": rows})
+
+
+@require_POST
+@member_required
+async def transfer(request, member):
+    """ Move funds between the member's wallet and savings (form-encoded or JSON body) """
+    if request.content_type == "application/json":
+        try:
+            data = json.loads(request.body)
+        except ValueError:
+            return _error("Invalid JSON body.", 400)
+        if not isinstance(data, dict):
+            return _error("JSON body must be an object.", 400)
+    else:
+        data = request.POST
+
+    form = FundTransferForm(data)
+    if not form.is_valid():
+        return JsonResponse({"success": False, "message": "Invalid transfer.", "errors": form.errors}, status=400)
+
+    try:
+        transaction = await sync_to_async(posting.transfer)(
+            member, form.cleaned_data["from_account"], form.cleaned_data["to_account"], form.cleaned_data["amount"]
+        )
+    except ValueError as e:
+        return _error(str(e), 400)
+
+    return JsonResponse({
+        "success": True,
+        "message": "Funds transferred successfully.",
+        "transaction_id": transaction.id,
+        "description": transaction.description,
+        "amount": transaction.amount,
+        **_balances(member),
+    })
+
+
+@require_GET
+@member_required
+async def loans(request, member):
+    """ Status of every loan the member has applied for, newest first """
+    rows = Loan.objects.filter(member=member).order_by("-created_at", "-id").values(*LOAN_FIELDS)
+    return JsonResponse({"success": True, "loans": [row async for row in rows]})
+
+
+@require_GET
+@member_required
+async def loan_status(request, member, loan_id):
+    loan = await Loan.objects.filter(member=member, id=loan_id).values(*LOAN_FIELDS).afirst()
+    if loan is None:
+        return _error("Loan not found.", 404)
+    return JsonResponse({"success": True, "loan": loan})
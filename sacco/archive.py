@@ -0,0 +1,287 @@
+"""
+Ledger archival: closed months of transactions move out of the hot Transaction
+table into gzip-compressed CSV segment files, one file per month, under
+settings.SACCO_ARCHIVE_DIR. The hot table keeps only the last SACCO_HOT_MONTHS
+months. Listings that only show recent rows (dashboard, transfers, history) stay
+small as the ledger grows.
+
+archive_month() writes the month's file, reads it back to check the row count,
+records an ArchiveSegment, and then deletes the month's hot rows a chunk at a
+time. A run interrupted during the deletes finishes them the next time, and rows
+that reach an archived month afterwards go into a further part file. Balances
+and statements are unaffected: they come from the journal, whose
+Journal.transaction link is simply cleared (SET_NULL). DailyFlow buckets of
+archived months are kept.
+
+Reads go across both stores. report_rows() (the CSV report and export) reads the
+segments that overlap a date range, then the hot table. ArchivePaginator
+(transaction history) and older_member_rows() (the API statement) page newest
+first through the hot table and then on into the segments.
+"""
+import csv
+import gzip
+import hashlib
+import os
+from collections import namedtuple
+from itertools import chain, groupby, islice
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection, transaction as db_transaction
+from django.db.models import Count, Max, Min, Sum
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from . import summary
+from .models import ArchiveSegment, Journal, Transaction
+from .pagination import KeysetPaginator
+from .reports import REPORT_CHUNK_SIZE, day_start, report_queryset
+from .search import text_matches
+
+ARCHIVE_CHUNK_SIZE = 5000
+HOT_MONTHS = 12
+COLUMNS = ["id", "member_id", "username", "amount", "transaction_type", "created_at", "description"]
+
+ArchivedTransaction = namedtuple("ArchivedTransaction", COLUMNS)
+
+
+def archive_dir():
+    return str(getattr(settings, "SACCO_ARCHIVE_DIR", os.path.join(settings.BASE_DIR, "archive")))
+
+
+def next_month(day):
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def hot_cutoff(today=None, hot_months=None):
+    """ First day of the oldest month kept in the hot table """
+    hot_months = getattr(settings, "SACCO_HOT_MONTHS", HOT_MONTHS) if hot_months is None else hot_months
+    month = (today or timezone.localdate()).replace(day=1)
+    index = month.year * 12 + month.month - 1 - hot_months
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def _month_rows(month):
+    return Transaction.objects.filter(created_at__gte=day_start(month), created_at__lt=day_start(next_month(month)))
+
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _write_segment(month, path, chunk_size, after_id=None):
+    """ Write the month's hot rows (past after_id) to a gzip CSV; returns (rows, total amount, first id, last id) """
+    rows, total, first_id, last_id = 0, Decimal(0), None, None
+    values = _month_rows(month)
+    if after_id is not None:
+        values = values.filter(id__gt=after_id)
+    values = values.order_by("id").values_list(
+        "id", "member_id", "member__user__username", "amount", "transaction_type", "created_at", "description"
+    )
+    with gzip.open(path, "wt", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(COLUMNS)
+        for row in values.iterator(chunk_size=chunk_size):
+            writer.writerow([*row[:5], row[5].isoformat(), row[6] or ""])
+            rows += 1
+            total += row[3]
+            first_id = first_id or row[0]
+            last_id = row[0]
+    return rows, total, first_id, last_id
+
+
+def _delete_hot(month, last_id, chunk_size):
+    """ Delete the month's archived rows (up to last_id) from the hot table a chunk at a time; returns rows deleted """
+    rows = _month_rows(month).filter(id__lte=last_id)
+    table = connection.ops.quote_name(Transaction._meta.db_table)
+    deleted = 0
+    while ids := list(rows.order_by("id").values_list("id", flat=True)[:chunk_size]):
+        with db_transaction.atomic():
+            Journal.objects.filter(transaction_id__in=ids).update(transaction=None)
+            # Raw DELETE: QuerySet.delete() would load every row to send post_delete
+            with connection.cursor() as cursor:
+                cursor.execute(f"DELETE FROM {table} WHERE id IN ({', '.join(['%s'] * len(ids))})", ids)
+        deleted += len(ids)
+    if deleted:
+        summary.invalidate("recent")
+    return deleted
+
+
+def archive_month(month, chunk_size=ARCHIVE_CHUNK_SIZE):
+    """ Move one month's hot transactions to a segment file; returns the new ArchiveSegment (None if nothing was left).
+
+    The first run writes part 1. Rows that reach an archived month later (backdated,
+    or committed after the run) are written to the next part by the following run,
+    so none stay behind in the hot table.
+    """
+    archived = ArchiveSegment.objects.filter(month=month).aggregate(last_id=Max("last_id"), parts=Count("id"))
+    if archived["last_id"] is not None:
+        # Finish the deletes of a run that stopped after writing its file
+        _delete_hot(month, archived["last_id"], chunk_size)
+
+    part = archived["parts"] + 1
+    os.makedirs(archive_dir(), exist_ok=True)
+    name = f"transactions-{month:%Y-%m}.csv.gz" if part == 1 else f"transactions-{month:%Y-%m}-part{part}.csv.gz"
+    path = os.path.join(archive_dir(), name)
+    rows, total, first_id, last_id = _write_segment(month, path + ".tmp", chunk_size, archived["last_id"])
+    if not rows:
+        os.remove(path + ".tmp")
+        return None
+    # Nothing is deleted until the file is complete and reads back whole
+    if sum(1 for _ in _read_file(path + ".tmp")) != rows:
+        raise IOError(f"{name} did not read back {rows} rows.")
+    os.replace(path + ".tmp", path)
+    segment = ArchiveSegment.objects.create(
+        month=month, part=part, path=name, rows=rows, total_amount=total, first_id=first_id, last_id=last_id,
+        sha256=_file_hash(path),
+    )
+    _delete_hot(month, last_id, chunk_size)
+    return segment
+
+
+def archive(hot_months=None, chunk_size=ARCHIVE_CHUNK_SIZE, progress=None):
+    """ Archive every month older than the hot window; returns the segments written """
+    cutoff = hot_cutoff(hot_months=hot_months)
+    oldest = Transaction.objects.filter(created_at__lt=day_start(cutoff)).aggregate(oldest=Min("created_at"))["oldest"]
+    segments = []
+    month = timezone.localdate(oldest).replace(day=1) if oldest else cutoff
+    while month < cutoff:
+        segment = archive_month(month, chunk_size)
+        if segment:
+            segments.append(segment)
+            if progress:
+                progress(segment)
+        month = next_month(month)
+    return segments
+
+
+def _read_file(path):
+    with gzip.open(path, "rt", newline="", encoding="utf-8") as file:
+        reader = csv.reader(file)
+        next(reader)  # header
+        yield from reader
+
+
+def read_segment(segment):
+    """ Yield a segment's rows as ArchivedTransaction tuples, oldest first """
+    for row in _read_file(os.path.join(archive_dir(), segment.path)):
+        yield ArchivedTransaction(
+            int(row[0]), int(row[1]), row[2], Decimal(row[3]), row[4], datetime.fromisoformat(row[5]), row[6] or None
+        )
+
+
+def _month_rows_archived(segments):
+    """ Yield (month, rows oldest first) for segments ordered by month and part.
+
+    A month with one part streams from its file; later parts can hold backdated
+    rows, so a month with several parts is read whole and sorted.
+    """
+    for month, parts in groupby(segments, key=lambda segment: segment.month):
+        parts = list(parts)
+        if len(parts) == 1:
+            yield month, read_segment(parts[0])
+        else:
+            yield month, sorted(chain.from_iterable(map(read_segment, parts)), key=lambda row: (row.created_at, row.id))
+
+
+def archived_transactions(start_date=None, end_date=None, member=None, transaction_type=None):
+    """ Archived rows in a date range (inclusive days), filtered like report_queryset() """
+    segments = ArchiveSegment.objects.order_by("month", "part")
+    if start_date:
+        segments = segments.filter(month__gte=start_date.replace(day=1))
+    if end_date:
+        segments = segments.filter(month__lte=end_date)
+    start = day_start(start_date) if start_date else None
+    end = day_start(end_date + timedelta(days=1)) if end_date else None
+
+    for _, rows in _month_rows_archived(segments):
+        for row in rows:
+            if (start and row.created_at < start) or (end and row.created_at >= end):
+                continue
+            if (member and row.username != member) or (transaction_type and row.transaction_type != transaction_type):
+                continue
+            yield row
+
+
+def report_rows(start_date=None, end_date=None, member=None, transaction_type=None, chunk_size=REPORT_CHUNK_SIZE):
+    """ report_queryset() rows across the archive and the hot table, oldest first """
+    for row in archived_transactions(start_date, end_date, member, transaction_type):
+        yield row.username, row.amount, row.transaction_type, row.created_at
+    yield from report_queryset(start_date, end_date, member, transaction_type).iterator(chunk_size=chunk_size)
+
+
+def _as_transaction(row):
+    """ An archived row as an unsaved Transaction, so templates and cursors treat it like a hot one """
+    return Transaction(
+        id=row.id, member_id=row.member_id, amount=row.amount, transaction_type=row.transaction_type,
+        created_at=row.created_at, description=row.description,
+    )
+
+
+def archived_history(newest_first=True, position=None, member_id=None, transaction_type=None, search=None):
+    """ Yield archived rows as Transactions ordered by (created_at, id), newest first unless told otherwise.
+
+    position=(created_at, id) starts past that key in the chosen direction, like a
+    keyset cursor. Only the months on that side of it are read.
+    """
+    segments = ArchiveSegment.objects.order_by(*(["-month", "part"] if newest_first else ["month", "part"]))
+    if position is not None:
+        month = timezone.localdate(position[0]).replace(day=1)
+        segments = segments.filter(**{"month__lte" if newest_first else "month__gte": month})
+
+    for _, rows in _month_rows_archived(segments):
+        rows = [
+            row for row in rows
+            if (member_id is None or row.member_id == member_id)
+            and (not transaction_type or row.transaction_type == transaction_type)
+            and (not search or text_matches(search, row.description))
+            and (position is None or ((row.created_at, row.id) < position if newest_first else (row.created_at, row.id) > position))
+        ]
+        for row in (reversed(rows) if newest_first else rows):
+            yield _as_transaction(row)
+
+
+class ArchivePaginator(KeysetPaginator):
+    """ KeysetPaginator over the hot table that pages on into the archive once its rows run out.
+
+    Archived months are all older than the hot ones, so newest first the archive
+    simply follows the queryset. `filters` (member_id, transaction_type, search)
+    must say in archive terms what the queryset filters on.
+    """
+
+    def __init__(self, queryset, per_page, count_limit=None, **filters):
+        super().__init__(queryset, per_page, count_limit)
+        self.filters = filters
+
+    @cached_property
+    def archived(self):
+        return ArchiveSegment.objects.exists()
+
+    def older_rows(self, position, count):
+        return list(islice(archived_history(True, position, **self.filters), count)) if self.archived else []
+
+    def newer_rows(self, position, count):
+        return list(islice(archived_history(False, position, **self.filters), count)) if self.archived else []
+
+    def approximate_count(self):
+        count, capped = super().approximate_count()
+        # Archived rows are not counted, so the total is only a lower bound once anything is archived
+        return count, capped or (count is not None and self.archived)
+
+
+def older_member_rows(member_id, position, count, fields):
+    """ Up to `count` of a member's archived rows past `position`, newest first, as dicts of `fields` (API statement) """
+    return [
+        {field: getattr(transaction, field) for field in fields}
+        for transaction in islice(archived_history(True, position, member_id=member_id), count)
+    ]
+
+
+def archived_totals():
+    """ Rows and amount held in segment files, for reporting """
+    return ArchiveSegment.objects.aggregate(rows=Sum("rows"), total_amount=Sum("total_amount"))
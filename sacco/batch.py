@@ -0,0 +1,273 @@
+"""
+Batch job framework for the nightly management commands.
+
+A job walks a queryset in id order, one chunk (an id range) at a time. After
+every wave of chunks the run's checkpoint (BatchRun.last_id) is saved, so a run
+that is interrupted resumes after the last finished wave the next time the same
+job is started with the same options. Chunks of a wave can be spread over a
+process pool. Jobs must be idempotent per chunk: a crash mid-wave replays it.
+"""
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction as db_transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import amortization, journal, statements
+from .models import BalanceDrift, BatchRun, DailyFlow, InterestAccrual, LedgerAccount, Loan, Member
+
+DEFAULT_CHUNK_SIZE = 5000
+JOBS = {}
+
+
+def register(job_class):
+    """ Class decorator adding a job to the registry worker processes look jobs up in """
+    JOBS[job_class.name] = job_class()
+    return job_class
+
+
+class BatchJob:
+    """ Base class: set `name` and implement queryset() and process_chunk() """
+    name = None
+    chunk_size = DEFAULT_CHUNK_SIZE
+
+    def queryset(self, params):
+        """ Rows the job walks through; must be orderable by id """
+        raise NotImplementedError
+
+    def process_chunk(self, first_id, last_id, params):
+        """ Process the rows with first_id <= id <= last_id; return how many were processed """
+        raise NotImplementedError
+
+
+def throughput(rows, seconds):
+    return f"{rows} rows in {seconds:.1f}s ({rows / seconds if seconds else 0:,.0f} rows/s)"
+
+
+def _open_run(job, params, restart):
+    """ Resume the job's unfinished run with the same params, or start a new one """
+    runs = BatchRun.objects.filter(job=job.name, status="running")
+    if restart:
+        runs.update(status="abandoned")
+    else:
+        for run in runs.order_by("-id"):
+            if run.params == params:
+                return run, True
+    return BatchRun.objects.create(job=job.name, params=params), False
+
+
+def _next_chunks(queryset, after_id, chunk_size, count):
+    """ The id ranges of the next `count` chunks after the checkpoint """
+    ids = list(queryset.filter(id__gt=after_id).order_by("id").values_list("id", flat=True)[:chunk_size * count])
+    return [(chunk[0], chunk[-1]) for chunk in (ids[i:i + chunk_size] for i in range(0, len(ids), chunk_size))]
+
+
+def init_worker():
+    """ Pool initializer: never share the parent's database connections """
+    import django
+    django.setup()
+    connections.close_all()
+
+
+def _process_in_worker(job_name, first_id, last_id, params):
+    job = JOBS[job_name]
+    with db_transaction.atomic():
+        return job.process_chunk(first_id, last_id, params)
+
+
+def run_job(job, params=None, chunk_size=None, workers=1, restart=False, progress=None):
+    """ Run (or resume) a job to completion; returns (BatchRun, rows processed by this call).
+
+    `progress(run, rows, seconds)` is called after every wave with the rows
+    processed by this invocation so far.
+    """
+    params = params or {}
+    chunk_size = chunk_size or job.chunk_size
+    run, _ = _open_run(job, params, restart)
+    queryset = job.queryset(params)
+    started = time.monotonic()
+    rows = 0
+
+    pool = None
+    if workers > 1:
+        connections.close_all()  # forked workers must not inherit open connections
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=init_worker)
+    try:
+        while True:
+            chunks = _next_chunks(queryset, run.last_id, chunk_size, workers)
+            if not chunks:
+                break
+
+            if pool:
+                futures = [pool.submit(_process_in_worker, job.name, first, last, params) for first, last in chunks]
+                processed = sum(future.result() for future in futures)
+            else:
+                processed = 0
+                for first, last in chunks:
+                    with db_transaction.atomic():
+                        processed += job.process_chunk(first, last, params)
+
+            # Checkpoint only once every chunk of the wave is done, so a resume never skips one
+            run.last_id = chunks[-1][1]
+            BatchRun.objects.filter(pk=run.pk).update(
+                last_id=run.last_id,
+                rows_processed=F("rows_processed") + processed,
+                chunks_processed=F("chunks_processed") + len(chunks),
+                updated_at=timezone.now(),
+            )
+            rows += processed
+            if progress:
+                progress(run, rows, time.monotonic() - started)
+    finally:
+        if pool:
+            pool.shutdown()
+
+    BatchRun.objects.filter(pk=run.pk).update(status="completed", completed_at=timezone.now())
+    run.refresh_from_db()
+    return run, rows
+
+
+@register
+class AccrueInterestJob(BatchJob):
+    """ Record one day's interest on every open loan's remaining balance """
+    name = "accrue_interest"
+
+    def queryset(self, params):
+        return Loan.objects.filter(status="approved", repayment_status="ongoing", remaining_balance__gt=0)
+
+    def process_chunk(self, first_id, last_id, params):
+        day = date.fromisoformat(params["day"])
+        loans = self.queryset(params).filter(id__gte=first_id, id__lte=last_id)
+        ids, balance, rate = amortization.loan_arrays(loans.order_by("id"), ["id", "remaining_balance", "interest_rate"])
+        accrued = amortization.daily_accrual(balance, rate)
+        # The unique (loan, day) constraint makes a replayed chunk a no-op
+        InterestAccrual.objects.bulk_create(
+            [
+                InterestAccrual(loan_id=int(loan_id), day=day, balance=f"{loan_balance:.2f}", amount=f"{amount:.2f}")
+                for loan_id, loan_balance, amount in zip(ids, balance, accrued)
+            ],
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+        return len(ids)
+
+
+@register
+class DailyFlowJob(BatchJob):
+    """ Rebuild the dashboard's daily flow rollup, one range of members at a time """
+    name = "daily_flows"
+
+    def queryset(self, params):
+        return Member.objects.all()
+
+    def process_chunk(self, first_id, last_id, params):
+        members = Member.objects.filter(id__gte=first_id, id__lte=last_id).values("id")
+        DailyFlow.rebuild(member_ids=members)
+        return members.count()
+
+
+@register
+class BalanceSnapshotJob(BatchJob):
+    """ Month-end balance snapshot of every member wallet and savings account """
+    name = "balance_snapshots"
+
+    def queryset(self, params):
+        return LedgerAccount.objects.filter(kind__in=statements.STATEMENT_ACCOUNTS, member__isnull=False)
+
+    def process_chunk(self, first_id, last_id, params):
+        accounts = self.queryset(params).filter(id__gte=first_id, id__lte=last_id).values_list("id", flat=True)
+        return statements.take_snapshots(date.fromisoformat(params["day"]), accounts)
+
+
+@register
+class MemberStatementJob(BatchJob):
+    """ Write every member's wallet and savings statements for a period to files """
+    name = "member_statements"
+    chunk_size = 500
+
+    def queryset(self, params):
+        return Member.objects.all()
+
+    def process_chunk(self, first_id, last_id, params):
+        start, end = date.fromisoformat(params["start"]), date.fromisoformat(params["end"])
+        members = list(Member.objects.filter(id__gte=first_id, id__lte=last_id).select_related("user"))
+        for statement in statements.member_statements(members, start, end):
+            statements.write_statement(statement, params["directory"], params["format"])
+        return len(members)
+
+
+class ReconcileJob(BatchJob):
+    """ Check a range of owners' projected balances against the journal, recording (and optionally repairing) drift """
+    model = None
+    kinds = ()
+
+    def queryset(self, params):
+        return self.model.objects.all()
+
+    def process_chunk(self, first_id, last_id, params):
+        day = date.fromisoformat(params["day"])
+        drifts = []
+        for kind in self.kinds:
+            drift = journal.reconcile(kind, first_id, last_id)
+            repaired = set(journal.repair(kind, drift)) if params.get("repair") else set()
+            drifts += [
+                BalanceDrift(day=day, kind=kind, owner_id=owner_id, recorded=recorded, expected=expected, repaired=owner_id in repaired)
+                for owner_id, recorded, expected in drift
+            ]
+        # The chunk's rows for the day are replaced: drift an earlier run found that has been fixed since
+        # must not stay on record as unrepaired, and a replayed chunk or later --repair run overwrites its own
+        with db_transaction.atomic():
+            BalanceDrift.objects.filter(day=day, kind__in=self.kinds, owner_id__gte=first_id, owner_id__lte=last_id).delete()
+            BalanceDrift.objects.bulk_create(drifts)
+        return self.queryset(params).filter(id__gte=first_id, id__lte=last_id).count()
+
+
+@register
+class ReconcileMembersJob(ReconcileJob):
+    name = "reconcile_members"
+    model = Member
+    kinds = LedgerAccount.MEMBER_KINDS
+
+
+@register
+class ReconcileLoansJob(ReconcileJob):
+    name = "reconcile_loans"
+    model = Loan
+    kinds = ("loan",)
+
+
+class BatchCommand(BaseCommand):
+    """ Base for commands that run a registered job: adds the shared chunking options """
+    job_name = None
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=None, help="Rows per chunk (default: the job's own).")
+        parser.add_argument("--workers", type=int, default=1, help="Processes to spread chunks over.")
+        parser.add_argument("--restart", action="store_true", help="Abandon an unfinished run instead of resuming it.")
+
+    def get_params(self, options):
+        """ Job options that identify a run; a run only resumes with identical params """
+        return {}
+
+    def handle(self, *args, **options):
+        job = JOBS[self.job_name]
+
+        def progress(run, rows, seconds):
+            self.stdout.write(f"{job.name}: checkpoint at id {run.last_id}, {throughput(rows, seconds)}")
+
+        started = time.monotonic()
+        run, rows = run_job(
+            job,
+            params=self.get_params(options),
+            chunk_size=options["chunk_size"],
+            workers=options["workers"],
+            restart=options["restart"],
+            progress=progress,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"{job.name} run {run.id} completed ({run.rows_processed} rows in total): "
+            f"{throughput(rows, time.monotonic() - started)} this time."
+        ))
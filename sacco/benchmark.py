@@ -0,0 +1,198 @@
+"""
+Load benchmarks for the core money flows: deposits, transfers, loan repayments
+and withdrawals, the dashboard and the transaction history.
+
+populate() builds a seeded synthetic dataset with the bulk posting paths. Each
+scenario is one request through the Django test client, or one model save. run()
+replays every scenario at several concurrency levels. Each level uses worker
+threads, and each thread has its own client, member and database connection. The
+result is p50/p95/p99 latency, throughput and queries per request for each
+scenario and level.
+
+Results are saved as JSON. compare() checks them against a saved baseline and
+flags scenarios whose p95 latency or query count went up. The benchmark
+management command does all of this in a throwaway test database.
+"""
+import random
+import threading
+import time
+from decimal import Decimal
+
+import numpy as np
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from . import journal, summary
+from .models import DailyFlow, Loan, LoanRepayment, Member, Share, Transaction
+
+LOAN_AMOUNT = Decimal("500000")
+SHARE_PRICE = Decimal("10")
+TOLERANCE = 0.25  # p95 may grow this much over the baseline before it is flagged
+NOISE_MS = 2.0  # and by at least this many milliseconds, so sub-millisecond jitter is ignored
+
+
+class Actor:
+    """ The member a worker thread acts as, with their open loan """
+
+    def __init__(self, member, loan):
+        self.member = member
+        self.user = member.user
+        self.loan = loan
+
+
+def _post_ok(response):
+    # Views answer a successful POST with a redirect (or JSON for transfers)
+    return response.status_code in (200, 302) and b'"success": false' not in response.content
+
+
+# Scenario name -> callable(client, actor) returning whether the request succeeded
+SCENARIOS = {
+    "dashboard": lambda client, actor: client.get(reverse("dashboard")).status_code == 200,
+    "transaction_history": lambda client, actor: client.get(reverse("transaction_history")).status_code == 200,
+    "make_transaction": lambda client, actor: _post_ok(client.post(reverse("make_transaction"), {"amount": "10"})),
+    "transfer_funds": lambda client, actor: _post_ok(
+        client.post(reverse("transfer_funds"), {"from_account": "wallet", "to_account": "savings", "amount": "1"})
+    ),
+    "repay_loan": lambda client, actor: _post_ok(
+        client.post(reverse("repay_loan"), {"loan": actor.loan.id, "amount_paid": "1", "account": "savings"})
+    ),
+    "withdraw_loan": lambda client, actor: _post_ok(client.post(reverse("withdraw_loan", args=[actor.loan.id]), {"amount": "1"})),
+    "transaction_save": lambda client, actor: bool(
+        Transaction.objects.create(member=actor.member, amount=Decimal("5"), transaction_type="deposit").pk
+    ),
+    "repayment_save": lambda client, actor: bool(LoanRepayment.objects.create(loan=actor.loan, amount_paid=Decimal("1")).pk),
+}
+
+
+def populate(members=200, transactions=20, seed=0):
+    """ Create `members` members with about `transactions` deposits each, one funded loan and a share holding.
+
+    Rows are bulk-inserted and balances posted with journal.post_many, so the
+    dataset passes the journal checks while taking seconds rather than minutes.
+    """
+    rng = random.Random(seed)
+    password = make_password(None)
+    users = User.objects.bulk_create(
+        [User(username=f"bench{i:06d}", email=f"bench{i:06d}@example.com", password=password) for i in range(members)],
+        batch_size=1000,
+    )
+    member_rows = Member.objects.bulk_create(
+        [Member(user=user, phone=f"07{i:08d}") for i, user in enumerate(users)], batch_size=1000
+    )
+
+    deposits, savings, holdings = [], [], []
+    for member in member_rows:
+        for _ in range(rng.randint(1, 2 * transactions - 1)):
+            deposits.append(Transaction(member=member, amount=Decimal(rng.randint(100, 5000)), transaction_type="deposit", description="Benchmark deposit"))
+        savings.append(("savings", member.id, Decimal(rng.randint(1000, 10000))))
+        holdings.append(Share(member=member, shares_owned=Decimal(rng.randint(1, 100))))
+
+    wallets = {}
+    for deposit in deposits:
+        wallets[deposit.member.id] = wallets.get(deposit.member.id, 0) + deposit.amount
+    journal.post_many("Benchmark deposits", [("wallet", member_id, amount) for member_id, amount in wallets.items()] + savings, counter_kind="cash")
+    DailyFlow.record_many(Transaction.objects.bulk_create(deposits, batch_size=1000))
+
+    Share.objects.bulk_create(holdings, batch_size=1000)
+    journal.post_many(
+        "Benchmark shares", [("share_capital", share.member.id, share.shares_owned * SHARE_PRICE) for share in holdings], counter_kind="cash"
+    )
+
+    # bulk_create skips Loan.save, so the loans are funded through the journal here
+    loans = Loan.objects.bulk_create(
+        [Loan(member=member, amount=LOAN_AMOUNT, interest_rate=Decimal("1.5"), duration_months=12, status="approved") for member in member_rows],
+        batch_size=1000,
+    )
+    journal.post_many("Benchmark loans", [("loan", loan.id, LOAN_AMOUNT) for loan in loans], counter_kind="loan_fund")
+    summary.invalidate()
+    return [Actor(member, loan) for member, loan in zip(member_rows, loans)]
+
+
+def _measure(scenario, client, actor, timings, queries, errors):
+    started = time.perf_counter()
+    try:
+        with CaptureQueriesContext(connection) as captured:
+            ok = scenario(client, actor)
+    except Exception:
+        ok = False
+    timings.append((time.perf_counter() - started) * 1000)
+    queries.append(len(captured.captured_queries))
+    if not ok:
+        errors.append(1)
+
+
+def run_scenario(name, actors, concurrency, requests):
+    """ Run `requests` calls of a scenario spread over `concurrency` threads; returns its stats dict """
+    scenario = SCENARIOS[name]
+    timings, queries, errors = [], [], []
+    ready = threading.Barrier(concurrency + 1)
+
+    def worker(index):
+        actor = actors[index % len(actors)]
+        try:
+            try:
+                client = Client()
+                client.force_login(actor.user)
+                ready.wait()
+            except Exception:
+                ready.abort()  # A failed login must not leave the other threads waiting
+                raise
+            for _ in range(requests // concurrency + (index < requests % concurrency)):
+                _measure(scenario, client, actor, timings, queries, errors)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    ready.wait()  # Logins are not timed
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - started
+
+    p50, p95, p99 = np.percentile(timings, [50, 95, 99]) if timings else (0.0, 0.0, 0.0)
+    return {
+        "scenario": name,
+        "concurrency": concurrency,
+        "requests": len(timings),
+        "errors": len(errors),
+        "mean_ms": round(float(np.mean(timings)), 3) if timings else 0.0,
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "throughput": round(len(timings) / seconds, 1) if seconds else 0.0,
+        "queries_mean": round(float(np.mean(queries)), 2) if queries else 0.0,
+        "queries_max": max(queries, default=0),
+    }
+
+
+def run(actors, scenarios=None, concurrency=(1, 4, 8), requests=200, progress=None):
+    """ Every scenario at every concurrency level, as {"<scenario>@<concurrency>": stats} """
+    results = {}
+    for name in scenarios or SCENARIOS:
+        for level in concurrency:
+            results[f"{name}@{level}"] = stats = run_scenario(name, actors, level, requests)
+            if progress:
+                progress(stats)
+    return results
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """ Return (key, metric, baseline value, current value) for every regression against a baseline's results """
+    regressions = []
+    for key, current in results.items():
+        before = baseline.get(key)
+        if before is None:
+            continue
+        if current["p95_ms"] > before["p95_ms"] * (1 + tolerance) and current["p95_ms"] - before["p95_ms"] > NOISE_MS:
+            regressions.append((key, "p95_ms", before["p95_ms"], current["p95_ms"]))
+        if current["queries_max"] > before["queries_max"]:
+            regressions.append((key, "queries_max", before["queries_max"], current["queries_max"]))
+        if current["errors"] > before["errors"]:
+            regressions.append((key, "errors", before["errors"], current["errors"]))
+    return regressions
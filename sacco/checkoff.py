@@ -0,0 +1,230 @@
+"""
+Employer check-off (payroll deduction) files: one CSV line per member with the
+amounts to credit to savings and to pay off their loan (columns: member,
+savings, loan_repayment; member is a phone number or a username).
+
+The file is read as a stream. Members are matched through an in-memory index
+built with one query, and each chunk of lines is posted in a single atomic
+transaction: one journal per leg type (see journal.post_many), bulk-created
+Transaction and LoanRepayment rows, the DailyFlow rollup and the file's
+checkpoint. A file is identified by the SHA-256 of its content, so posting the
+same file again is a no-op and an interrupted file resumes after its checkpoint.
+"""
+import csv
+import hashlib
+import io
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction as db_transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import journal, summary
+from .journal import InsufficientFunds
+from .models import CheckoffFile, DailyFlow, Loan, LoanRepayment, Member, Transaction
+from .tracing import trace
+
+COLUMNS = ["member", "savings", "loan_repayment"]
+CHECKOFF_CHUNK_SIZE = 5000
+HASH_BLOCK_SIZE = 1024 * 1024
+REPORT_HEADER = ["Line", "Member", "Savings", "Loan repayment", "Error"]
+CENT = Decimal("0.01")
+
+
+class CheckoffConflict(Exception):
+    """ Another process advanced the same file's checkpoint while this chunk was being posted """
+
+
+class CheckoffRow:
+    def __init__(self, line, member, savings, repayment):
+        self.line = line
+        self.member = member
+        self.savings = savings
+        self.repayment = repayment
+        self.member_id = None
+        self.loan_id = None
+        self.error = ""
+
+
+def file_hash(file):
+    """ SHA-256 of a binary file, read in blocks; the file is rewound afterwards """
+    digest = hashlib.sha256()
+    for block in iter(lambda: file.read(HASH_BLOCK_SIZE), b""):
+        digest.update(block)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def _amount(value):
+    value = (value or "").strip().replace(",", "")
+    if not value:
+        return Decimal(0)
+    amount = Decimal(value)
+    if amount < 0 or amount != amount.quantize(CENT):
+        raise InvalidOperation(value)
+    return amount
+
+
+def read_rows(file):
+    """ Yield a CheckoffRow per non-empty line of a binary CSV file, without loading it whole """
+    reader = csv.DictReader(io.TextIOWrapper(file, encoding="utf-8-sig", newline=""))
+    reader.fieldnames = [name.strip().lower() for name in reader.fieldnames or []]
+    missing = set(COLUMNS) - set(reader.fieldnames)
+    if missing:
+        raise ValueError(f"Check-off file is missing the column(s): {', '.join(sorted(missing))}.")
+
+    for record in reader:
+        line = reader.line_num
+        if not any((value or "").strip() for value in record.values()):
+            continue
+        member = (record["member"] or "").strip()
+        try:
+            row = CheckoffRow(line, member, _amount(record["savings"]), _amount(record["loan_repayment"]))
+        except InvalidOperation:
+            row = CheckoffRow(line, member, record["savings"], record["loan_repayment"])
+            row.error = "Amounts must be positive numbers with at most two decimals."
+        yield row
+
+
+class MemberIndex:
+    """ Username and phone -> member id, plus each member's oldest open loan, loaded once per file """
+
+    def __init__(self):
+        self.usernames, self.phones, ambiguous = {}, {}, set()
+        for member_id, username, phone in Member.objects.values_list("id", "user__username", "phone").iterator(chunk_size=10000):
+            self.usernames[username] = member_id
+            phone = phone.strip()
+            if phone in self.phones and self.phones[phone] != member_id:
+                ambiguous.add(phone)
+            self.phones[phone] = member_id
+        for phone in ambiguous:
+            self.phones[phone] = None  # Shared by several members: such lines must use the username
+
+        # member id -> [loan id, remaining balance]; newest first, so the oldest loan wins
+        self.loans = {}
+        open_loans = Loan.objects.filter(status="approved", repayment_status="ongoing", remaining_balance__gt=0)
+        for loan_id, member_id, remaining in open_loans.order_by("-id").values_list("id", "member_id", "remaining_balance").iterator(chunk_size=10000):
+            self.loans[member_id] = [loan_id, remaining]
+
+    def match(self, row):
+        """ Resolve the row's member and loan, setting row.error when it cannot be posted """
+        if row.error:
+            return
+        if row.member in self.usernames:
+            row.member_id = self.usernames[row.member]
+        elif row.member in self.phones:
+            row.member_id = self.phones[row.member]
+            if row.member_id is None:
+                row.error = "Phone number is shared by several members; use the username."
+                return
+        else:
+            row.error = "No member with this phone number or username."
+            return
+
+        if not row.savings and not row.repayment:
+            row.error = "Nothing to post."
+        elif row.repayment:
+            loan = self.loans.get(row.member_id)
+            if loan is None:
+                row.error = "Member has no ongoing loan to repay."
+            elif row.repayment > loan[1]:
+                row.error = f"Repayment exceeds the loan's remaining balance ({loan[1]})."
+            else:
+                row.loan_id = loan[0]
+                loan[1] -= row.repayment  # Later lines for the same member see what is left
+
+
+def _post(rows, description):
+    """ Post matched rows: balances via the journal, then the ledger rows and rollup in bulk """
+    savings = [row for row in rows if row.savings]
+    repayments = [row for row in rows if row.repayment]
+    if savings:
+        journal.post_many(description, [("savings", row.member_id, row.savings) for row in savings], counter_kind="cash")
+    if repayments:
+        # Guarded: a loan repaid elsewhere since the index was built raises InsufficientFunds
+        journal.post_many(description, [("loan", row.loan_id, -row.repayment) for row in repayments], counter_kind="loan_fund")
+        LoanRepayment.objects.bulk_create([LoanRepayment(loan_id=row.loan_id, amount_paid=row.repayment) for row in repayments], batch_size=1000)
+        Loan.objects.filter(pk__in={row.loan_id for row in repayments}, remaining_balance=0).update(repayment_status="completed")
+
+    # bulk_create skips Transaction.save, so the rollup is updated here instead
+    transactions = Transaction.objects.bulk_create(
+        [Transaction(member_id=row.member_id, amount=row.savings, transaction_type="deposit", description=description) for row in savings]
+        + [Transaction(member_id=row.member_id, amount=row.repayment, transaction_type="loan_repayment", description=description) for row in repayments],
+        batch_size=1000,
+    )
+    DailyFlow.record_many(transactions)
+
+
+def _post_chunk(checkoff, chunk, description):
+    """ Post one chunk and advance the file's checkpoint in the same transaction """
+    matched = [row for row in chunk if not row.error]
+    with db_transaction.atomic():
+        try:
+            with db_transaction.atomic():
+                _post(matched, description)
+        except InsufficientFunds:
+            # A loan balance moved since the index was built: post line by line to find the culprits
+            for row in matched:
+                try:
+                    with db_transaction.atomic():
+                        _post([row], description)
+                except InsufficientFunds:
+                    row.error = "Repayment exceeds the loan's remaining balance."
+
+        posted = [row for row in chunk if not row.error]
+        advanced = CheckoffFile.objects.filter(pk=checkoff.pk, last_line=checkoff.last_line).update(
+            last_line=chunk[-1].line,
+            rows_posted=F("rows_posted") + len(posted),
+            rows_rejected=F("rows_rejected") + len(chunk) - len(posted),
+            total_savings=F("total_savings") + sum(row.savings for row in posted),
+            total_repayments=F("total_repayments") + sum(row.repayment for row in posted),
+        )
+        if not advanced:
+            raise CheckoffConflict(f"{checkoff.filename} is being posted by another process.")
+    checkoff.last_line = chunk[-1].line
+    trace("checkoff.chunk", checkoff_id=checkoff.pk, last_line=checkoff.last_line, posted=len(posted), rejected=len(chunk) - len(posted))
+
+
+def process_file(file, filename, chunk_size=CHECKOFF_CHUNK_SIZE, progress=None):
+    """ Post a binary check-off file; returns (CheckoffFile, rejected CheckoffRows of this call).
+
+    A file that was already completed is not posted again: the rejected list is
+    then None. `progress(checkoff, lines, seconds)` is called after every chunk.
+    """
+    checkoff, _ = CheckoffFile.objects.get_or_create(sha256=file_hash(file), defaults={"filename": filename[-255:]})
+    if checkoff.status == "completed":
+        return checkoff, None
+
+    index = MemberIndex()
+    description = f"Check-off {checkoff.filename}"[:255]
+    started = time.monotonic()
+    rejected, chunk, lines = [], [], 0
+    for row in read_rows(file):
+        if row.line <= checkoff.last_line:
+            continue  # Posted before the previous run was interrupted
+        index.match(row)
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            _post_chunk(checkoff, chunk, description)
+            rejected += [row for row in chunk if row.error]
+            lines += len(chunk)
+            chunk = []
+            if progress:
+                progress(checkoff, lines, time.monotonic() - started)
+    if chunk:
+        _post_chunk(checkoff, chunk, description)
+        rejected += [row for row in chunk if row.error]
+
+    CheckoffFile.objects.filter(pk=checkoff.pk).update(status="completed", completed_at=timezone.now())
+    summary.invalidate("members", "loans", "recent")  # bulk writes send no post_save
+    checkoff.refresh_from_db()
+    return checkoff, rejected
+
+
+def write_report(rejected, output):
+    """ Write the rejected lines as CSV to a text stream """
+    writer = csv.writer(output)
+    writer.writerow(REPORT_HEADER)
+    for row in rejected:
+        writer.writerow([row.line, row.member, row.savings, row.repayment, row.error])
@@ -0,0 +1,100 @@
+"""
+Per-member cache of the dashboard context.
+
+Each member's context is cached under a versioned key, {member}:{version}:{day}.
+The signals in sacco.signals call bump() for every member a posting, loan,
+repayment or transaction touches, which moves the member to a new version; the
+old entry is never read again and ages out. A warm dashboard load reads two keys
+and runs no ledger queries.
+
+The cache is the alias named by settings.SACCO_DASHBOARD_CACHE. The local-memory
+backend evicts least recently used entries past MAX_ENTRIES and expires them
+after the alias TIMEOUT, which only bounds anything the bumps missed. The versions
+live in the same cache, so with local memory a bump only reaches the process that
+made it: postings from other workers or management commands leave that process's
+entries stale until TIMEOUT. Deployments with more than one process need a shared
+backend for the alias. Hits and misses are counted per process and served with
+the instrumentation stats.
+"""
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction as db_transaction
+
+KEY_PREFIX = "sacco:dashboard"
+
+
+def _cache():
+    return caches[getattr(settings, "SACCO_DASHBOARD_CACHE", "default")]
+
+
+class Counters:
+    """ Thread-safe hit/miss counts since start (or the last reset) """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def add(self, hit):
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def snapshot(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "hit_rate": round(self.hits / total, 3) if total else None}
+
+    def reset(self):
+        with self.lock:
+            self.hits = self.misses = 0
+
+
+counters = Counters()
+
+
+def _version_key(member_id):
+    return f"{KEY_PREFIX}:{member_id}:version"
+
+
+def get(member_id, day, build):
+    """ The member's dashboard context for `day`, from cache at its current version or from build() """
+    cache = _cache()
+    version = cache.get(_version_key(member_id))
+    if version is not None:
+        context = cache.get(f"{KEY_PREFIX}:{member_id}:{version}:{day}")
+        if context is not None:
+            counters.add(hit=True)
+            return context
+
+    counters.add(hit=False)
+    if version is None:
+        # add() so a bump racing this load wins; re-read whichever version is now current
+        cache.add(_version_key(member_id), uuid.uuid4().hex)
+        version = cache.get(_version_key(member_id))
+    context = build()
+    if version is not None:
+        cache.set(f"{KEY_PREFIX}:{member_id}:{version}:{day}", context)
+    return context
+
+
+def _bump(member_ids):
+    _cache().set_many({_version_key(member_id): uuid.uuid4().hex for member_id in member_ids})
+
+
+def bump(*member_ids):
+    """ Move members to a new version now and again once the transaction commits.
+
+    The first bump keeps this transaction from reading its own stale entry; the
+    second drops any entry another request built from the pre-commit rows.
+    """
+    member_ids = {member_id for member_id in member_ids if member_id is not None}
+    if member_ids:
+        _bump(member_ids)
+        if connection.in_atomic_block:
+            db_transaction.on_commit(lambda: _bump(member_ids))
@@ -0,0 +1,322 @@
+"""
+Synthetic, production-shaped data for scale testing:
+- members whose transaction counts are long-tailed (log-normal), so a few very
+  active members have most of the ledger
+- loans in every status and repayment status, with their repayments
+- share holdings
+
+generate() works through the members a chunk at a time. Each chunk's rows are
+drawn with NumPy from a generator seeded with (seed, chunk number), and every
+timestamp falls in the `days` before a fixed `until` date rather than before
+now, so a seed, chunk size and until date always give the same dataset on an
+empty database. Rows are
+written with load_rows(), which uses COPY on PostgreSQL and one prepared INSERT
+elsewhere. Primary keys are assigned up front, so nothing is read back.
+
+No model save() runs, so there are no per-row journal postings, traces or
+rollup updates. Instead, balances are computed from the generated history and
+written directly. They are also booked as one opening-balance journal per chunk,
+so the journal checks and the reconciliation agree with them. The DailyFlow
+rollup is summed from the same arrays.
+"""
+import csv
+import io
+import time
+from datetime import date, datetime
+
+import numpy as np
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.color import no_style
+from django.db import connection, transaction as db_transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from . import journal, summary
+from .models import DailyFlow, Journal, JournalEntry, Loan, LoanRepayment, Member, Share, Transaction
+
+DATASET_CHUNK_SIZE = 5000
+DATASET_UNTIL = date(2026, 1, 1)  # Generated history ends at midnight UTC starting this day
+TRANSACTION_TYPES = ["deposit", "withdrawal", "transfer"]
+TRANSACTION_WEIGHTS = [0.55, 0.2, 0.25]
+TRANSACTION_SPREAD = 1.5  # sigma of log(transactions per member); higher means a longer tail
+LOAN_STATUSES = ["pending", "rejected", "approved"]
+LOAN_STATUS_WEIGHTS = [0.15, 0.1, 0.75]
+COMPLETED_SHARE = 0.3  # Approved loans that are fully repaid
+INTEREST_RATES = [1.0, 1.5, 2.0, 2.5]
+DURATIONS = [3, 6, 12, 24, 36]
+SHARE_PRICE = 10
+DESCRIPTIONS = {"deposit": "User deposit", "withdrawal": "Withdrawal", "transfer": "Transferred from Wallet to Savings"}
+OPENING_DESCRIPTION = "Opening balances (synthetic data)"
+
+USER_FIELDS = ["id", "password", "is_superuser", "username", "first_name", "last_name", "email", "is_staff", "is_active", "date_joined"]
+MEMBER_FIELDS = ["id", "user", "phone", "balance", "savings_balance", "joined_date"]
+LOAN_FIELDS = [
+    "id", "member", "amount", "remaining_balance", "total_withdrawn", "interest_rate",
+    "duration_months", "status", "repayment_status", "created_at",
+]
+REPAYMENT_FIELDS = ["id", "loan", "amount_paid", "date_paid"]
+TRANSACTION_FIELDS = ["id", "member", "amount", "transaction_type", "created_at", "description"]
+SHARE_FIELDS = ["id", "member", "shares_owned", "total_investment"]
+DAILY_FLOW_FIELDS = ["member", "day", "deposits", "withdrawals", "transfers", "repayments"]
+
+
+def load_rows(model, fields, rows):
+    """ Bulk-load database-ready rows: COPY ... FROM STDIN on PostgreSQL, one prepared INSERT elsewhere """
+    if connection.vendor != "postgresql":
+        journal.insert_rows(model, fields, rows)
+        return
+
+    quote = connection.ops.quote_name
+    sql = "COPY {table} ({columns}) FROM STDIN".format(
+        table=quote(model._meta.db_table),
+        columns=", ".join(quote(model._meta.get_field(field).column) for field in fields),
+    )
+    with connection.cursor() as cursor:
+        raw = cursor.cursor
+        if hasattr(raw, "copy"):  # psycopg 3
+            with raw.copy(sql) as copy:
+                for row in rows:
+                    copy.write_row(row)
+        else:  # psycopg2
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(rows)
+            buffer.seek(0)
+            raw.copy_expert(sql + " WITH (FORMAT csv)", buffer)
+
+
+def _money(cents):
+    """ Whole cents -> decimal strings, which every backend loads into a DecimalField exactly """
+    return [f"{'-' if value < 0 else ''}{abs(value) // 100}.{abs(value) % 100:02d}" for value in cents.tolist()]
+
+
+def _timestamps(values):
+    """ datetime64[us] (UTC) -> the text form a DateTimeField column is stored and compared in """
+    suffix = "+00:00" if connection.vendor == "postgresql" else ""
+    return [value.replace("T", " ") + suffix for value in np.datetime_as_string(values, unit="us").tolist()]
+
+
+def _cents(rng, mean, size, low, high):
+    """ Log-normal amounts in whole cents, averaging about `mean` and clipped to low..high """
+    sigma = 1.0
+    values = rng.lognormal(np.log(mean) - sigma ** 2 / 2, sigma, size)
+    return (np.clip(values, low, high) * 100).round().astype(np.int64)
+
+
+def _between(rng, start, end):
+    """ A random moment between each pair of datetime64[us] bounds """
+    span = (end - start).astype(np.int64)
+    return start + (rng.random(len(span)) * span).astype(np.int64).astype("timedelta64[us]")
+
+
+def _next_ids():
+    return {model: (model.objects.aggregate(last=Max("id"))["last"] or 0) + 1 for model in (User, Member, Loan, LoanRepayment, Transaction, Share)}
+
+
+class Chunk:
+    """ The generated rows of one chunk of members, with their balances in cents """
+
+    def __init__(self, rng, ids, members, options):
+        now = np.datetime64(options["until"], "us")
+        self.rng = rng
+        self.now = now
+        self.until = options["until"]
+        member = np.arange(members)
+        self.member_ids = ids[Member] + member
+        self.user_ids = ids[User] + member
+        span = np.int64(options["days"] * 86400 * 10 ** 6)
+        self.joined = now - (rng.random(members) * span).astype(np.int64).astype("timedelta64[us]")
+
+        self._loans(ids, member, options)
+        self._repayments(ids)
+        self._transactions(ids, member, options)
+        has_shares = rng.random(members) < options["share_ratio"]
+        self.share_members = self.member_ids[has_shares]
+        self.shares = rng.integers(1, 501, members)[has_shares]
+        self.share_ids = ids[Share] + np.arange(len(self.share_members))
+
+    def _loans(self, ids, member, options):
+        rng = self.rng
+        counts = rng.poisson(options["loans_per_member"], len(member))
+        self.loan_member = np.repeat(member, counts)
+        loans = len(self.loan_member)
+        self.loan_ids = ids[Loan] + np.arange(loans)
+        self.loan_created = _between(rng, self.joined[self.loan_member], np.full(loans, self.now))
+        self.loan_amount = _cents(rng, 50000, loans, 1000, 2000000) // 10000 * 10000  # Whole hundreds
+        self.loan_status = np.array(LOAN_STATUSES)[rng.choice(len(LOAN_STATUSES), loans, p=LOAN_STATUS_WEIGHTS)]
+        self.loan_duration = rng.choice(DURATIONS, loans)
+        self.loan_rate = rng.choice(INTEREST_RATES, loans)
+        approved = self.loan_status == "approved"
+        self.loan_completed = approved & (rng.random(loans) < COMPLETED_SHARE)
+        partly = (self.loan_amount * rng.uniform(0, 0.9, loans)).astype(np.int64) // 100 * 100
+        self.loan_repaid = np.where(self.loan_completed, self.loan_amount, np.where(approved, partly, 0))
+        self.loan_remaining = np.where(approved, self.loan_amount - self.loan_repaid, 0)
+
+    def _repayments(self, ids):
+        """ Split each loan's repaid total into 1..duration installments (the last takes the odd cents) """
+        rng = self.rng
+        count = np.where(self.loan_repaid > 0, rng.integers(1, self.loan_duration + 1), 0)
+        count = np.minimum(count, self.loan_repaid // 100)
+        self.repayment_loan = np.repeat(np.arange(len(count)), count)
+        installment = self.loan_repaid // np.maximum(count, 1)
+        self.repayment_amount = installment[self.repayment_loan]
+        last = np.cumsum(count)[count > 0] - 1
+        self.repayment_amount[last] += (self.loan_repaid - installment * count)[count > 0]
+        self.repayment_ids = ids[LoanRepayment] + np.arange(len(self.repayment_loan))
+        self.repayment_time = _between(rng, self.loan_created[self.repayment_loan], np.full(len(self.repayment_loan), self.now))
+
+    def _transactions(self, ids, member, options):
+        """ Skewed deposits, withdrawals and transfers, the repayments' ledger rows and a top-up where needed """
+        rng = self.rng
+        mean = max(options["transactions_per_member"], 0.01)
+        counts = rng.lognormal(np.log(mean) - TRANSACTION_SPREAD ** 2 / 2, TRANSACTION_SPREAD, len(member)).round().astype(np.int64)
+        owner = np.repeat(member, counts)
+        kind = rng.choice(len(TRANSACTION_TYPES), len(owner), p=TRANSACTION_WEIGHTS)
+        amount = _cents(rng, 2000, len(owner), 10, 200000)
+        moment = _between(rng, self.joined[owner], np.full(len(owner), self.now))
+
+        # Repayments were paid from the wallet, so each has its loan_repayment ledger row
+        repaid_by = self.loan_member[self.repayment_loan]
+        owner = np.concatenate([owner, repaid_by])
+        kind = np.concatenate([kind, np.full(len(repaid_by), len(TRANSACTION_TYPES))])
+        amount = np.concatenate([amount, self.repayment_amount])
+        moment = np.concatenate([moment, self.repayment_time])
+        loan = np.concatenate([np.full(len(owner) - len(repaid_by), -1), self.loan_ids[self.repayment_loan]])
+
+        def total(kinds):
+            return np.bincount(owner, weights=np.where(np.isin(kind, kinds), amount, 0), minlength=len(member)).astype(np.int64)
+
+        wallet = total([0]) - total([1, 2, 3])
+        # Members whose outflows exceed their deposits get one opening deposit that covers them
+        short = np.flatnonzero(wallet < 0)
+        top_up = -wallet[short] + _cents(rng, 500, len(short), 1, 10000)
+        owner = np.concatenate([owner, short])
+        kind = np.concatenate([kind, np.zeros(len(short), dtype=kind.dtype)])
+        amount = np.concatenate([amount, top_up])
+        moment = np.concatenate([moment, self.joined[short]])
+        loan = np.concatenate([loan, np.full(len(short), -1)])
+        wallet[short] += top_up
+
+        order = np.argsort(moment, kind="stable")  # ids follow time, as they would in production
+        self.transaction_owner, self.transaction_kind = owner[order], kind[order]
+        self.transaction_amount, self.transaction_time, self.transaction_loan = amount[order], moment[order], loan[order]
+        self.transaction_ids = ids[Transaction] + np.arange(len(order))
+        self.wallet = wallet
+        self.savings = total([2])
+
+    def rows(self, password):
+        """ (model, fields, rows) in the order their foreign keys need """
+        joined = _timestamps(self.joined)
+        yield User, USER_FIELDS, [
+            (user_id, password, False, f"member{user_id}", "", "", f"member{user_id}@example.com", False, True, joined_at)
+            for user_id, joined_at in zip(self.user_ids.tolist(), joined)
+        ]
+        yield Member, MEMBER_FIELDS, [
+            (member_id, user_id, f"07{member_id % 10 ** 8:08d}", wallet, savings, joined_at[:10])
+            for member_id, user_id, wallet, savings, joined_at in zip(
+                self.member_ids.tolist(), self.user_ids.tolist(), _money(self.wallet), _money(self.savings), joined
+            )
+        ]
+        yield Loan, LOAN_FIELDS, list(zip(
+            self.loan_ids.tolist(), self.member_ids[self.loan_member].tolist(), _money(self.loan_amount),
+            _money(self.loan_remaining), ["0.00"] * len(self.loan_ids), [f"{rate:.2f}" for rate in self.loan_rate.tolist()],
+            self.loan_duration.tolist(), self.loan_status.tolist(),
+            np.where(self.loan_completed, "completed", "ongoing").tolist(), _timestamps(self.loan_created),
+        ))
+        yield LoanRepayment, REPAYMENT_FIELDS, list(zip(
+            self.repayment_ids.tolist(), self.loan_ids[self.repayment_loan].tolist(),
+            _money(self.repayment_amount), _timestamps(self.repayment_time),
+        ))
+        types = TRANSACTION_TYPES + ["loan_repayment"]
+        yield Transaction, TRANSACTION_FIELDS, [
+            (transaction_id, member_id, amount, types[kind], created_at,
+             DESCRIPTIONS[types[kind]] if loan < 0 else f"Repayment of Loan ID {loan} from Wallet")
+            for transaction_id, member_id, amount, kind, created_at, loan in zip(
+                self.transaction_ids.tolist(), self.member_ids[self.transaction_owner].tolist(), _money(self.transaction_amount),
+                self.transaction_kind.tolist(), _timestamps(self.transaction_time), self.transaction_loan.tolist(),
+            )
+        ]
+        yield DailyFlow, DAILY_FLOW_FIELDS, self._daily_flows()
+        yield Share, SHARE_FIELDS, [
+            (share_id, member_id, f"{shares}.00", f"{shares * SHARE_PRICE}.00")
+            for share_id, member_id, shares in zip(self.share_ids.tolist(), self.share_members.tolist(), self.shares.tolist())
+        ]
+
+    def _daily_flows(self):
+        """ DailyFlow rows: each member's total per transaction type and local day """
+        # Local days use the time zone's current UTC offset (exact for zones without DST, like EAT)
+        offset = timezone.get_default_timezone().utcoffset(datetime.combine(self.until, datetime.min.time()))
+        days = (self.transaction_time + np.timedelta64(offset)).astype("datetime64[D]")
+        if not len(days):
+            return []
+        first_day = days.min()
+        day_index = (days - first_day).astype(np.int64)
+        keys, bucket = np.unique(self.transaction_owner * (day_index.max() + 1) + day_index, return_inverse=True)
+        totals = [
+            np.bincount(bucket, weights=np.where(self.transaction_kind == kind, self.transaction_amount, 0)).round().astype(np.int64)
+            for kind in range(len(TRANSACTION_TYPES) + 1)
+        ]
+        owner, day = np.divmod(keys, day_index.max() + 1)
+        return list(zip(
+            self.member_ids[owner].tolist(), np.datetime_as_string(first_day + day).tolist(), *(_money(total) for total in totals)
+        ))
+
+    def balances(self):
+        """ kind -> [(owner id, cents)] of every non-zero projected balance """
+        return {
+            "wallet": list(zip(self.member_ids.tolist(), self.wallet.tolist())),
+            "savings": list(zip(self.member_ids.tolist(), self.savings.tolist())),
+            "share_capital": list(zip(self.share_members.tolist(), (self.shares * SHARE_PRICE * 100).tolist())),
+            "loan": list(zip(self.loan_ids.tolist(), self.loan_remaining.tolist())),
+        }
+
+
+def _book_opening_balances(balances):
+    """ One journal crediting every generated balance against the opening account """
+    opening = Journal.objects.create(description=OPENING_DESCRIPTION)
+    entries, total = [], 0
+    for kind, rows in balances.items():
+        rows = [(owner_id, cents) for owner_id, cents in rows if cents]
+        if not rows:
+            continue
+        accounts = journal.owner_accounts(kind, [owner_id for owner_id, _ in rows])
+        cents = np.array([cents for _, cents in rows], dtype=np.int64)
+        entries += zip([opening.pk] * len(rows), [accounts[owner_id] for owner_id, _ in rows], _money(cents), [True] * len(rows))
+        total += int(cents.sum())
+    entries.append((opening.pk, journal.account("opening").pk, _money(np.array([-total]))[0], True))
+    load_rows(JournalEntry, ["journal", "account", "amount", "projected"], entries)
+
+
+def generate(members, transactions_per_member=20, loans_per_member=0.5, share_ratio=0.6, days=730, seed=0,
+             chunk_size=DATASET_CHUNK_SIZE, progress=None, until=DATASET_UNTIL):
+    """ Add `members` synthetic members with their history, which ends before `until`; returns row counts per model.
+
+    `progress(counts, seconds)` is called after every chunk.
+    """
+    options = {
+        "transactions_per_member": transactions_per_member, "loans_per_member": loans_per_member,
+        "share_ratio": share_ratio, "days": days, "until": until,
+    }
+    password = make_password(None)  # Unusable: synthetic members cannot sign in
+    counts = dict.fromkeys([User, Member, Loan, LoanRepayment, Transaction, DailyFlow, Share], 0)
+    started = time.monotonic()
+
+    for number, first in enumerate(range(0, members, chunk_size)):
+        size = min(chunk_size, members - first)
+        with db_transaction.atomic():
+            ids = _next_ids()
+            chunk = Chunk(np.random.default_rng([seed, number]), ids, size, options)
+            for model, fields, rows in chunk.rows(password):
+                if rows:
+                    load_rows(model, fields, rows)
+                counts[model] += len(rows)
+            _book_opening_balances(chunk.balances())
+        if progress:
+            progress(counts, time.monotonic() - started)
+
+    # Explicit ids leave PostgreSQL sequences behind the data (a no-op on SQLite)
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), list(counts)):
+            cursor.execute(sql)
+    summary.invalidate()
+    return {model._meta.label: count for model, count in counts.items()}
@@ -0,0 +1,98 @@
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import transaction as db_transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from . import journal, summary
+from .models import DividendRun, Share, Transaction
+
+CENT = Decimal("0.01")
+DIVIDEND_CHUNK_SIZE = 2000
+
+
+def start_dividend_run(total_amount):
+    """ Open a run and freeze the share total every payout is computed against """
+    total_shares = Share.objects.aggregate(total=Sum("shares_owned"))["total"] or Decimal(0)
+    if total_shares <= 0:
+        raise ValueError("There are no shares to pay dividends on.")
+    return DividendRun.objects.create(total_amount=Decimal(total_amount), total_shares=total_shares)
+
+
+def _allocated(run, cumulative_shares):
+    """ Rounded amount owed to everyone up to and including this cumulative share count.
+
+    Each payout is the difference between two consecutive allocations, so rounding never
+    drifts: the last shareholder closes the gap and the run pays out exactly total_amount.
+    """
+    return (run.total_amount * cumulative_shares / run.total_shares).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def _pay_chunk(run, rows):
+    """ Credit one chunk of shareholders with bulk writes and advance the checkpoint """
+    cumulative_shares = run.cumulative_shares
+    distributed = run.distributed
+    payouts = []
+
+    for share_id, member_id, shares_owned in rows:
+        cumulative_shares += shares_owned
+        allocated = _allocated(run, cumulative_shares)
+        payout = allocated - distributed
+        distributed = allocated
+        if payout > 0:
+            payouts.append((member_id, payout))
+
+    if payouts:
+        # One journal per chunk; wallet credits go out as a single batched UPDATE
+        journal.post_many(
+            f"Dividend payout (run {run.id})",
+            [("wallet", member_id, payout) for member_id, payout in payouts],
+            counter_kind="dividends",
+        )
+
+        # bulk_create skips Transaction.save, which would otherwise re-save every member
+        Transaction.objects.bulk_create([
+            Transaction(
+                member_id=member_id,
+                amount=payout,
+                transaction_type="dividend",
+                description=f"Dividend payout (run {run.id})",
+            )
+            for member_id, payout in payouts
+        ])
+        summary.invalidate("recent")  # bulk_create sends no post_save
+
+    run.last_share_id = rows[-1][0]
+    run.cumulative_shares = cumulative_shares
+    run.distributed = distributed
+    run.members_paid += len(payouts)
+    run.save(update_fields=["last_share_id", "cumulative_shares", "distributed", "members_paid"])
+
+
+def process_dividend_run(run, chunk_size=DIVIDEND_CHUNK_SIZE):
+    """ Pay out a run chunk by chunk; safe to call again on a run that was interrupted """
+    while True:
+        with db_transaction.atomic():
+            # Lock the run so two workers never pay the same chunk, and re-read the checkpoint
+            run = DividendRun.objects.select_for_update().get(pk=run.pk)
+            if run.status == "completed":
+                return run
+
+            rows = list(
+                Share.objects.filter(pk__gt=run.last_share_id, shares_owned__gt=0)
+                .order_by("pk")
+                .values_list("pk", "member_id", "shares_owned")[:chunk_size]
+            )
+            if not rows:
+                run.status = "completed"
+                run.completed_at = timezone.now()
+                run.save(update_fields=["status", "completed_at"])
+                return run
+
+            # Balances, transactions and the checkpoint commit together, so a resume never double-pays
+            _pay_chunk(run, rows)
+
+
+def distribute_dividends(total_amount, chunk_size=DIVIDEND_CHUNK_SIZE):
+    """ Start and complete a dividend run in one call """
+    return process_dividend_run(start_dividend_run(total_amount), chunk_size=chunk_size)
@@ -85,6 +85,11 @@ class LoanRepaymentForm(forms.ModelForm):
         model = LoanRepayment
         fields = ["loan", "amount_paid", "account"]
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Loan.__str__ shows the member's username, so choices join it in
+        self.fields["loan"].queryset = Loan.objects.select_related("member__user")
+
 
 class FundTransferForm(forms.Form):
     ACCOUNT_CHOICES = [
@@ -0,0 +1,243 @@
+"""
+Per-request SQL and latency instrumentation.
+
+InstrumentationMiddleware samples requests (settings.SACCO_INSTRUMENTATION
+SAMPLE_RATE) and records, per view name: wall time, number of queries, total SQL
+time, template render time and the slowest statements. The in-process collector
+aggregates them into fixed-bucket histograms, served as JSON by the admin-only
+instrumentation_stats view. Unsampled requests only pay for one random() call.
+"""
+import heapq
+import random
+import threading
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.template.base import Template
+
+DEFAULTS = {
+    "ENABLED": True,
+    "SAMPLE_RATE": 0.1,  # Fraction of requests measured
+    "SLOW_STATEMENTS": 5,  # Slowest statements kept per view
+}
+TIME_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SQL_PREVIEW = 500
+
+_current = ContextVar("sacco_instrumentation_record", default=None)
+
+
+def config():
+    return {**DEFAULTS, **getattr(settings, "SACCO_INSTRUMENTATION", {})}
+
+
+class Histogram:
+    """ Counts per upper bound; the last bucket catches everything above the largest bound """
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0
+        self.sum = 0.0
+
+    def add(self, value):
+        index = next((i for i, bound in enumerate(self.bounds) if value <= bound), len(self.bounds))
+        self.counts[index] += 1
+        self.total += 1
+        self.sum += value
+
+    def percentile(self, fraction):
+        """ Upper bound of the bucket holding the given fraction of samples (None if above every bound) """
+        if not self.total:
+            return None
+        seen = 0
+        for bound, count in zip(self.bounds + (None,), self.counts):
+            seen += count
+            if seen >= fraction * self.total:
+                return bound
+        return None
+
+    def as_dict(self):
+        return {
+            "count": self.total,
+            "mean": round(self.sum / self.total, 3) if self.total else None,
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+            "buckets": {f"le_{bound}": count for bound, count in zip(self.bounds, self.counts)} | {"inf": self.counts[-1]},
+        }
+
+
+class ViewStats:
+    def __init__(self):
+        self.wall_ms = Histogram(TIME_BUCKETS_MS)
+        self.sql_ms = Histogram(TIME_BUCKETS_MS)
+        self.template_ms = Histogram(TIME_BUCKETS_MS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.slowest = []  # min-heap of (ms, sql)
+
+    def add(self, record, keep):
+        self.wall_ms.add(record.wall_ms)
+        self.sql_ms.add(record.sql_ms)
+        self.template_ms.add(record.template_ms)
+        self.queries.add(record.queries)
+        for statement in record.slowest:
+            if len(self.slowest) < keep:
+                heapq.heappush(self.slowest, statement)
+            elif statement > self.slowest[0]:
+                heapq.heapreplace(self.slowest, statement)
+
+    def as_dict(self):
+        return {
+            "wall_ms": self.wall_ms.as_dict(),
+            "sql_ms": self.sql_ms.as_dict(),
+            "template_ms": self.template_ms.as_dict(),
+            "queries": self.queries.as_dict(),
+            "slowest_statements": [{"ms": round(ms, 3), "sql": sql} for ms, sql in sorted(self.slowest, reverse=True)],
+        }
+
+
+class Collector:
+    """ Thread-safe, in-process aggregate of sampled requests, keyed by view name """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+        self.started = time.time()
+
+    def add(self, view_name, record, keep):
+        with self.lock:
+            self.views.setdefault(view_name, ViewStats()).add(record, keep)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "since": self.started,
+                "sample_rate": config()["SAMPLE_RATE"],
+                "views": {name: stats.as_dict() for name, stats in sorted(self.views.items())},
+            }
+
+    def reset(self):
+        with self.lock:
+            self.views = {}
+            self.started = time.time()
+
+
+collector = Collector()
+
+
+class RequestRecord:
+    def __init__(self, keep):
+        self.keep = keep
+        self.queries = 0
+        self.sql_ms = 0.0
+        self.template_ms = 0.0
+        self.template_depth = 0
+        self.wall_ms = 0.0
+        self.slowest = []  # min-heap of (ms, sql)
+
+    def __call__(self, execute, sql, params, many, context):
+        """ connection.execute_wrapper hook: time every statement """
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            ms = (time.perf_counter() - started) * 1000
+            self.queries += 1
+            self.sql_ms += ms
+            # Statements are kept without their parameters, so no member data ends up in the stats
+            statement = (ms, sql[:SQL_PREVIEW])
+            if len(self.slowest) < self.keep:
+                heapq.heappush(self.slowest, statement)
+            elif statement > self.slowest[0]:
+                heapq.heapreplace(self.slowest, statement)
+
+
+_original_render = Template.render
+
+
+def _timed_render(self, context):
+    """ Template.render wrapper; only the outermost render of a sampled request is timed """
+    record = _current.get()
+    if record is None or record.template_depth:
+        return _original_render(self, context)
+
+    record.template_depth += 1
+    started = time.perf_counter()
+    try:
+        return _original_render(self, context)
+    finally:
+        record.template_ms += (time.perf_counter() - started) * 1000
+        record.template_depth -= 1
+
+
+def _wrap_connections(stack, record):
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(record))
+
+
+class InstrumentationMiddleware:
+    """ Sync and async capable, so async views (sacco.api) are not pushed onto a thread under ASGI """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        Template.render = _timed_render
+
+    def _sampled(self):
+        options = config()
+        return options["ENABLED"] and random.random() < options["SAMPLE_RATE"], options
+
+    def _finish(self, request, record, started, options):
+        record.wall_ms = (time.perf_counter() - started) * 1000
+        match = getattr(request, "resolver_match", None)
+        view_name = match.view_name if match else "unresolved"
+        collector.add(view_name, record, options["SLOW_STATEMENTS"])
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+
+        sampled, options = self._sampled()
+        if not sampled:
+            return self.get_response(request)
+
+        record = RequestRecord(options["SLOW_STATEMENTS"])
+        token = _current.set(record)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                _wrap_connections(stack, record)
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._finish(request, record, started, options)
+        return response
+
+    async def __acall__(self, request):
+        sampled, options = self._sampled()
+        if not sampled:
+            return await self.get_response(request)
+
+        record = RequestRecord(options["SLOW_STATEMENTS"])
+        token = _current.set(record)
+        started = time.perf_counter()
+        # The async ORM runs queries on the request's thread-sensitive thread, whose
+        # connections are not this thread's: install the wrappers over there
+        stack = ExitStack()
+        await sync_to_async(_wrap_connections)(stack, record)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+            _current.reset(token)
+        self._finish(request, record, started, options)
+        return response
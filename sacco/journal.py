@@ -0,0 +1,304 @@
+"""
+Double-entry journal. Every money movement is a Journal whose JournalEntry amounts
+sum to zero; Member.balance, Member.savings_balance, Loan.remaining_balance and
+Share.total_investment are materialized projections of their accounts' entries.
+
+Share holdings are projected as their capital (total_investment, the share_capital
+account) rather than as Share.shares_owned: the journal holds money, not share
+counts. Every change to shares_owned posts the matching share_capital movement
+(posting.add_shares, posting.transfer_shares), so reconciling share_capital
+checks the holdings.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import connection, transaction as db_transaction
+from django.db.models import Exists, F, OuterRef, Q, Sum
+from django.db.models.constants import OnConflict
+from django.db.models.functions import Round
+from django.dispatch import Signal
+
+from .models import Journal, JournalEntry, LedgerAccount, Loan, Member, Share
+
+# Account kind -> (model, balance field, account owner attribute, model key, path from the account)
+PROJECTIONS = {
+    "wallet": (Member, "balance", "member_id", "id", "member__balance"),
+    "savings": (Member, "savings_balance", "member_id", "id", "member__savings_balance"),
+    "loan": (Loan, "remaining_balance", "loan_id", "id", "loan__remaining_balance"),
+    "share_capital": (Share, "total_investment", "member_id", "member_id", "member__share__total_investment"),
+}
+CATCH_UP_CHUNK_SIZE = 5000
+
+# Sent with kinds={account kinds} and owners={kind: owner ids} whenever projected balance fields are moved
+projections_changed = Signal()
+
+
+class InsufficientFunds(ValueError):
+    """ A debit was rejected because the account would go negative """
+
+    def __init__(self, message, model=None, owner_id=None):
+        super().__init__(message)
+        self.model, self.owner_id = model, owner_id
+
+
+class MissingProjection(LookupError):
+    """ A posting reached an account whose owner row (member, loan or share holding) does not exist """
+
+    def __init__(self, message, model=None, owner_id=None):
+        super().__init__(message)
+        self.model, self.owner_id = model, owner_id
+
+
+class UnbalancedJournal(ValueError):
+    """ A journal's entries do not sum to zero """
+
+
+def account(kind, member=None, loan=None):
+    """ Fetch (or open) the ledger account of a kind for a member, a loan, or the SACCO itself """
+    account, _ = LedgerAccount.objects.get_or_create(
+        kind=kind,
+        member_id=member.pk if member is not None else None,
+        loan_id=loan.pk if loan is not None else None,
+    )
+    return account
+
+
+def owner_accounts(kind, owner_ids):
+    """ Map owner id (a loan id for loan accounts, else a member id) -> account id, opening any that are missing """
+    owner = PROJECTIONS[kind][2] if kind in PROJECTIONS else "member_id"
+    owner_ids = set(owner_ids)
+    accounts = dict(LedgerAccount.objects.filter(kind=kind, **{f"{owner}__in": owner_ids}).values_list(owner, "id"))
+    missing = owner_ids - accounts.keys()
+    if missing:
+        insert_rows(LedgerAccount, ["kind", owner], [(kind, owner_id) for owner_id in missing], ignore_conflicts=True)
+        accounts.update(LedgerAccount.objects.filter(kind=kind, **{f"{owner}__in": missing}).values_list(owner, "id"))
+    return accounts
+
+
+def insert_rows(model, fields, rows, ignore_conflicts=False):
+    """ INSERT many rows with one prepared statement, without building model instances.
+
+    The bulk paths write tens of thousands of entries per chunk, where bulk_create
+    spends most of its time preparing objects; values must already be database-ready.
+    """
+    ops = connection.ops
+    on_conflict = OnConflict.IGNORE if ignore_conflicts else None
+    columns = [model._meta.get_field(field).column for field in fields]
+    sql = "{insert} {table} ({columns}) VALUES ({values}) {suffix}".format(
+        insert=ops.insert_statement(on_conflict=on_conflict),
+        table=ops.quote_name(model._meta.db_table),
+        columns=", ".join(map(ops.quote_name, columns)),
+        values=", ".join(["%s"] * len(columns)),
+        suffix=ops.on_conflict_suffix_sql(columns, on_conflict, None, None),
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+
+
+def _apply(legs):
+    """ Push a journal's deltas into the projected balance fields, one guarded UPDATE per row """
+    rows = defaultdict(lambda: defaultdict(Decimal))
+    for account, amount in legs:
+        if account.kind not in PROJECTIONS:
+            continue
+        model, field, owner, key, _ = PROJECTIONS[account.kind]
+        rows[(model, key, getattr(account, owner))][field] += amount
+
+    for (model, key, owner_id), deltas in rows.items():
+        # A debit only lands if the balance still covers it when the row is written
+        guards = {f"{field}__gte": -delta for field, delta in deltas.items() if delta < 0}
+        if not model.objects.filter(**{key: owner_id}, **guards).update(
+            **{field: F(field) + delta for field, delta in deltas.items()}
+        ):
+            # Name the row whose UPDATE matched nothing: a missing owner row is not a shortfall
+            if not guards or not model.objects.filter(**{key: owner_id}).exists():
+                raise MissingProjection(f"No {model._meta.verbose_name} {owner_id} to post to.", model, owner_id)
+            debited = next(
+                account for account, amount in legs
+                if account.kind in PROJECTIONS and PROJECTIONS[account.kind][0] is model
+                and getattr(account, PROJECTIONS[account.kind][2]) == owner_id and deltas[PROJECTIONS[account.kind][1]] < 0
+            )
+            raise InsufficientFunds(f"Insufficient funds in your {debited.get_kind_display()}!", model, owner_id)
+
+    if rows:
+        owners = defaultdict(set)
+        for account, _ in legs:
+            if account.kind in PROJECTIONS:
+                owners[account.kind].add(getattr(account, PROJECTIONS[account.kind][2]))
+        projections_changed.send(sender=LedgerAccount, kinds=set(owners), owners=owners)
+
+
+def post(description, legs, transaction=None, apply=True):
+    """ Write one balanced journal; `legs` is a list of (LedgerAccount, signed amount).
+
+    With apply=True the projections are updated in the same atomic block and a
+    guarded debit that fails rolls the whole journal back. With apply=False the
+    entries wait for catch_up(), which suits bulk loaders.
+    """
+    legs = [(account, Decimal(amount)) for account, amount in legs if amount]
+    if sum(amount for _, amount in legs) != 0:
+        raise UnbalancedJournal(f"Journal '{description}' does not balance.")
+
+    with db_transaction.atomic():
+        if apply:
+            _apply(legs)
+        journal = Journal.objects.create(description=description, transaction=transaction)
+        JournalEntry.objects.bulk_create([
+            JournalEntry(journal=journal, account=account, amount=amount, projected=apply) for account, amount in legs
+        ])
+    return journal
+
+
+def post_many(description, credits, counter_kind):
+    """ Post to many member or loan accounts in one journal, balanced by a single system account.
+
+    `credits` is a list of (account kind, owner id, signed amount), where the owner is
+    a loan id for loan accounts and a member id otherwise. Projections are applied
+    with one batched UPDATE per balance field, so this is the bulk path for dividend
+    runs and check-off files. A debit that would take a balance below zero raises
+    InsufficientFunds and rolls the whole journal back.
+    """
+    by_kind = defaultdict(list)
+    for kind, owner_id, amount in credits:
+        by_kind[kind].append((owner_id, Decimal(amount)))
+
+    with db_transaction.atomic():
+        journal = Journal.objects.create(description=description)
+        entries = []
+        for kind, rows in by_kind.items():
+            accounts = owner_accounts(kind, [owner_id for owner_id, _ in rows])
+            entries += [(journal.pk, accounts[owner_id], amount, True) for owner_id, amount in rows]
+            _increment(kind, rows, guarded=any(amount < 0 for _, amount in rows))
+        counter = account(counter_kind)
+        entries.append((journal.pk, counter.pk, -sum(Decimal(amount) for _, _, amount in credits), True))
+        insert_rows(JournalEntry, ["journal", "account", "amount", "projected"], entries)
+    return journal
+
+
+def _increment(kind, rows, guarded=False):
+    """ Add amounts to one projected field for many owners with a single prepared UPDATE.
+
+    With guarded=True a row only changes if it stays non-negative, and InsufficientFunds
+    is raised unless every row changed.
+    """
+    model, field, _, key, _ = PROJECTIONS[kind]
+    quote = connection.ops.quote_name
+    sql = "UPDATE {table} SET {field} = {field} + %s WHERE {key} = %s".format(
+        table=quote(model._meta.db_table),
+        field=quote(model._meta.get_field(field).column),
+        key=quote(model._meta.get_field(key).column),
+    )
+    params = [(amount, owner_id) for owner_id, amount in rows]
+    if guarded:
+        # Compare against the debit rather than testing field + amount >= 0, which float rounding can miss
+        sql += " AND {field} >= %s".format(field=quote(model._meta.get_field(field).column))
+        params = [(amount, owner_id, -amount) for owner_id, amount in rows]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, params)
+        if guarded and cursor.rowcount != len(rows):
+            raise InsufficientFunds(f"A {kind} balance would go below zero.")
+    projections_changed.send(sender=LedgerAccount, kinds={kind}, owners={kind: {owner_id for owner_id, _ in rows}})
+
+
+def catch_up(chunk_size=CATCH_UP_CHUNK_SIZE):
+    """ Apply entries written with apply=False to the projections, oldest first; returns entries applied """
+    applied = 0
+    while True:
+        with db_transaction.atomic():
+            chunk = list(
+                JournalEntry.objects.filter(projected=False)
+                .order_by("id")
+                .values_list("id", "account__kind", "account__member_id", "account__loan_id", "amount")[:chunk_size]
+            )
+            if not chunk:
+                return applied
+
+            deltas = defaultdict(Decimal)
+            for _, kind, member_id, loan_id, amount in chunk:
+                if kind in PROJECTIONS:
+                    deltas[(kind, loan_id if kind == "loan" else member_id)] += amount
+            by_kind = defaultdict(list)
+            for (kind, owner_id), amount in deltas.items():
+                by_kind[kind].append((owner_id, amount))
+            for kind, rows in by_kind.items():
+                _increment(kind, rows)
+
+            JournalEntry.objects.filter(id__in=[row[0] for row in chunk]).update(projected=True)
+            applied += len(chunk)
+
+
+def projection_drift(kind, chunk_size=CATCH_UP_CHUNK_SIZE):
+    """ Yield (owner id, projected, journal total) for every account whose field disagrees with its entries.
+
+    Totals come from one grouped query streamed with iterator(), so millions of
+    entries are checked without holding them in memory.
+    """
+    _, _, owner, _, projected_field = PROJECTIONS[kind]
+    totals = (
+        LedgerAccount.objects.filter(kind=kind)
+        .annotate(total=Sum("entries__amount", filter=Q(entries__projected=True)))
+        .values_list(owner, projected_field, "total")
+        .order_by(owner)
+    )
+    for owner_id, projected, total in totals.iterator(chunk_size=chunk_size):
+        if (projected or 0) != (total or 0):
+            yield owner_id, projected, total
+
+    # Balances on owners that never had an account opened for this kind
+    model, field, owner, key, _ = PROJECTIONS[kind]
+    orphans = (
+        model.objects.exclude(**{field: 0})
+        .exclude(Exists(LedgerAccount.objects.filter(kind=kind, **{owner: OuterRef(key)})))
+        .values_list(key, field)
+    )
+    for owner_id, projected in orphans.iterator(chunk_size=chunk_size):
+        yield owner_id, projected, None
+
+
+def reconcile(kind, first_id, last_id):
+    """ Return (owner id, projected, journal total) for each owner in first_id..last_id whose field is off.
+
+    One grouped SUM over the range's accounts and one read of the balance field, so
+    the nightly reconciliation checks a chunk of owners in two queries per kind.
+    `projected` is None when entries exist for an owner without a row to hold them.
+    """
+    model, field, owner, key, _ = PROJECTIONS[kind]
+    totals = dict(
+        JournalEntry.objects.filter(
+            projected=True, account__kind=kind, **{f"account__{owner}__gte": first_id, f"account__{owner}__lte": last_id}
+        )
+        .values_list(f"account__{owner}")
+        .annotate(total=Sum("amount"))
+        .order_by()
+    )
+    drift = []
+    for owner_id, projected in model.objects.filter(**{f"{key}__gte": first_id, f"{key}__lte": last_id}).values_list(key, field):
+        total = totals.pop(owner_id, None) or Decimal(0)
+        if projected != total:
+            drift.append((owner_id, projected, total))
+    drift += [(owner_id, None, total) for owner_id, total in totals.items() if total]
+    return drift
+
+
+def repair(kind, drift):
+    """ Set drifted fields to their journal totals; returns the owner ids repaired.
+
+    Each UPDATE is guarded on the value that was found, so a balance a posting has
+    moved since (which moves the journal too) is left for the next run.
+    """
+    model, field, _, key, _ = PROJECTIONS[kind]
+    repaired = [
+        owner_id for owner_id, projected, total in drift
+        if projected is not None and model.objects.filter(**{key: owner_id, field: projected}).update(**{field: total})
+    ]
+    if repaired:
+        projections_changed.send(sender=LedgerAccount, kinds={kind}, owners={kind: set(repaired)})
+    return repaired
+
+
+def unbalanced_journals(chunk_size=CATCH_UP_CHUNK_SIZE):
+    """ Yield (journal id, total) for every journal whose entries do not sum to zero """
+    # Rounded to the cent: SQLite sums decimals as floats, which leaves noise on large journals
+    totals = JournalEntry.objects.values("journal_id").annotate(total=Round(Sum("amount"), 2)).exclude(total=0).order_by()
+    for row in totals.values_list("journal_id", "total").iterator(chunk_size=chunk_size):
+        yield row
@@ -0,0 +1,17 @@
+from datetime import date
+
+from django.utils import timezone
+
+from sacco.batch import BatchCommand
+
+
+class Command(BatchCommand):
+    help = "Record a day's interest accrual on the remaining balance of every open loan."
+    job_name = "accrue_interest"
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument("--day", type=date.fromisoformat, default=None, help="Accrual date, YYYY-MM-DD (default: today).")
+
+    def get_params(self, options):
+        return {"day": (options["day"] or timezone.localdate()).isoformat()}
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from sacco.archive import ARCHIVE_CHUNK_SIZE, archive, hot_cutoff
+from sacco.batch import throughput
+
+
+class Command(BaseCommand):
+    help = "Move closed months of transactions older than the hot window into gzip CSV archive segments."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hot-months", type=int, default=None, help="Months kept in the transaction table (default: SACCO_HOT_MONTHS).")
+        parser.add_argument("--chunk-size", type=int, default=ARCHIVE_CHUNK_SIZE, help="Rows read and deleted per batch.")
+
+    def handle(self, *args, **options):
+        def progress(segment):
+            self.stdout.write(f"Archived {segment}")
+
+        started = time.monotonic()
+        segments = archive(hot_months=options["hot_months"], chunk_size=options["chunk_size"], progress=progress)
+        rows = sum(segment.rows for segment in segments)
+        cutoff = hot_cutoff(hot_months=options["hot_months"])
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(segments)} months archived, transactions from {cutoff} kept hot: {throughput(rows, time.monotonic() - started)}."
+        ))
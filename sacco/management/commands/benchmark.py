@@ -0,0 +1,69 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from sacco import benchmark
+
+COLUMNS = ["requests", "errors", "p50_ms", "p95_ms", "p99_ms", "throughput", "queries_mean"]
+
+
+def _levels(value):
+    return [int(level) for level in value.split(",")]
+
+
+class Command(BaseCommand):
+    help = "Benchmark the money-flow views and model saves at several concurrency levels in a throwaway test database."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--members", type=int, default=200, help="Synthetic members to create.")
+        parser.add_argument("--transactions", type=int, default=20, help="Average deposits per member.")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed for the synthetic data.")
+        parser.add_argument("--requests", type=int, default=200, help="Requests per scenario and concurrency level.")
+        parser.add_argument("--concurrency", type=_levels, default=[1, 4, 8], help="Comma-separated thread counts (default: 1,4,8).")
+        parser.add_argument("--scenarios", type=lambda value: value.split(","), default=None,
+                            help=f"Comma-separated subset of: {', '.join(benchmark.SCENARIOS)}.")
+        parser.add_argument("--output", default=None, help="Save the results as JSON here (e.g. as the next baseline).")
+        parser.add_argument("--baseline", default=None, help="Fail if results regressed against this saved JSON.")
+        parser.add_argument("--tolerance", type=float, default=benchmark.TOLERANCE, help="Allowed p95 growth over the baseline.")
+
+    def handle(self, *args, **options):
+        unknown = set(options["scenarios"] or []) - benchmark.SCENARIOS.keys()
+        if unknown:
+            raise CommandError(f"Unknown scenario(s): {', '.join(sorted(unknown))}.")
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.stdout.write(f"Creating {options['members']} members with ~{options['transactions']} transactions each...")
+            actors = benchmark.populate(options["members"], options["transactions"], options["seed"])
+            self.stdout.write(f"{'scenario':<28}" + "".join(f"{column:>14}" for column in COLUMNS))
+            results = benchmark.run(
+                actors, options["scenarios"], options["concurrency"], options["requests"],
+                progress=lambda stats: self.stdout.write(
+                    f"{stats['scenario'] + '@' + str(stats['concurrency']):<28}" + "".join(f"{stats[column]:>14}" for column in COLUMNS)
+                ),
+            )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump({
+                    "created": timezone.now().isoformat(),
+                    "dataset": {key: options[key] for key in ("members", "transactions", "seed", "requests")},
+                    "vendor": connection.vendor,
+                    "results": results,
+                }, output, indent=2)
+
+        if options["baseline"]:
+            with open(options["baseline"]) as file:
+                regressions = benchmark.compare(results, json.load(file)["results"], options["tolerance"])
+            for key, metric, before, after in regressions:
+                self.stdout.write(self.style.WARNING(f"  {key}: {metric} {before} -> {after}"))
+            if regressions:
+                raise CommandError(f"{len(regressions)} regressions against {options['baseline']}.")
+            self.stdout.write(self.style.SUCCESS(f"No regressions against {options['baseline']}."))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from sacco import journal
+
+
+class Command(BaseCommand):
+    help = "Check that every journal balances and that projected balances match their ledger accounts."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--catch-up", action="store_true", help="Apply pending (unprojected) entries before checking.")
+        parser.add_argument("--chunk-size", type=int, default=journal.CATCH_UP_CHUNK_SIZE, help="Rows fetched per chunk.")
+        parser.add_argument("--limit", type=int, default=20, help="Problems listed per check.")
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+        if options["catch_up"]:
+            applied = journal.catch_up(chunk_size=chunk_size)
+            self.stdout.write(f"Applied {applied} pending journal entries.")
+
+        problems = self.report("Unbalanced journals", journal.unbalanced_journals(chunk_size), options["limit"])
+        for kind in journal.PROJECTIONS:
+            problems += self.report(f"Drift in {kind} balances", journal.projection_drift(kind, chunk_size), options["limit"])
+
+        if problems:
+            raise CommandError(f"Found {problems} ledger inconsistencies.")
+        self.stdout.write(self.style.SUCCESS("Journal is balanced and all projections match."))
+
+    def report(self, title, rows, limit):
+        """ Print the first `limit` rows of one check and return how many there were """
+        count = 0
+        for row in rows:
+            if count < limit:
+                self.stdout.write(f"  {title}: {row}")
+            count += 1
+        if count:
+            self.stdout.write(self.style.WARNING(f"{title}: {count}"))
+        return count
@@ -0,0 +1,36 @@
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from sacco import dividends
+from sacco.batch import throughput
+from sacco.models import DividendRun
+
+
+class Command(BaseCommand):
+    help = "Pay a dividend pot out to shareholders, or resume the unfinished dividend run."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--amount", type=Decimal, default=None, help="Total to distribute; starts a new run.")
+        parser.add_argument("--chunk-size", type=int, default=dividends.DIVIDEND_CHUNK_SIZE, help="Shareholders paid per chunk.")
+
+    def handle(self, *args, **options):
+        unfinished = DividendRun.objects.filter(status="running").order_by("id").first()
+        if unfinished and options["amount"] is not None:
+            raise CommandError(f"Dividend run {unfinished.id} is unfinished; run without --amount to resume it first.")
+        if unfinished is None and options["amount"] is None:
+            raise CommandError("No unfinished dividend run; pass --amount to start one.")
+
+        try:
+            run = unfinished or dividends.start_dividend_run(options["amount"])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        paid_before = run.members_paid
+        started = time.monotonic()
+        run = dividends.process_dividend_run(run, chunk_size=options["chunk_size"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Dividend run {run.id} completed: Ksh {run.distributed} to {run.members_paid} members; "
+            f"{throughput(run.members_paid - paid_before, time.monotonic() - started)} this time."
+        ))
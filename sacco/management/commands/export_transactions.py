@@ -0,0 +1,33 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from sacco.batch import throughput
+from sacco.archive import report_rows
+from sacco.reports import iter_report_rows
+
+
+class Command(BaseCommand):
+    help = "Write the transaction report CSV to a file, streaming the ledger in chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Output CSV file.")
+        parser.add_argument("--start-date", type=date.fromisoformat, default=None)
+        parser.add_argument("--end-date", type=date.fromisoformat, default=None)
+        parser.add_argument("--member", default=None, help="Username to export.")
+        parser.add_argument("--type", dest="transaction_type", default=None, help="Transaction type to export.")
+
+    def handle(self, *args, **options):
+        rows = report_rows(
+            options["start_date"], options["end_date"], options["member"], options["transaction_type"]
+        )
+        started = time.monotonic()
+        written = -1  # the header line is not a row
+        with open(options["path"], "w", newline="") as output:
+            for line in iter_report_rows(rows):
+                output.write(line)
+                written += 1
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {options['path']}: {throughput(written, time.monotonic() - started)}."
+        ))
@@ -0,0 +1,37 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from sacco import dataset
+from sacco.batch import throughput
+
+
+class Command(BaseCommand):
+    help = "Bulk-load synthetic members, loans, repayments, transactions and shares for scale testing (skips model save())."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--members", type=int, default=10000, help="Members to add.")
+        parser.add_argument("--transactions-per-member", type=float, default=20, help="Mean transactions per member (long-tailed).")
+        parser.add_argument("--loans-per-member", type=float, default=0.5, help="Mean loans per member.")
+        parser.add_argument("--share-ratio", type=float, default=0.6, help="Fraction of members holding shares.")
+        parser.add_argument("--days", type=int, default=730, help="How far back the history goes.")
+        parser.add_argument(
+            "--until", type=date.fromisoformat, default=dataset.DATASET_UNTIL,
+            help=f"Day the history ends before, YYYY-MM-DD (default: {dataset.DATASET_UNTIL}).",
+        )
+        parser.add_argument("--seed", type=int, default=0, help="Same seed, chunk size and --until, same data.")
+        parser.add_argument("--chunk-size", type=int, default=dataset.DATASET_CHUNK_SIZE, help="Members loaded per transaction.")
+
+    def handle(self, *args, **options):
+        if options["members"] < 1 or options["chunk_size"] < 1:
+            raise CommandError("--members and --chunk-size must be positive.")
+
+        def progress(counts, seconds):
+            rows = sum(counts.values())
+            self.stderr.write(f"{counts[dataset.Member]} members: {throughput(rows, seconds)}")
+
+        counts = dataset.generate(
+            options["members"], options["transactions_per_member"], options["loans_per_member"], options["share_ratio"],
+            options["days"], options["seed"], options["chunk_size"], progress=progress, until=options["until"],
+        )
+        self.stdout.write(self.style.SUCCESS("Generated " + ", ".join(f"{count} {label}" for label, count in counts.items()) + "."))
@@ -0,0 +1,38 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from sacco import onboarding
+from sacco.batch import throughput
+
+
+class Command(BaseCommand):
+    help = "Create members in bulk from a CSV or XLSX sheet (username, email, phone, optional password)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or XLSX file to import.")
+        parser.add_argument("--report", default=None, help="Write the per-row report CSV here (default: stdout).")
+        parser.add_argument("--chunk-size", type=int, default=onboarding.IMPORT_CHUNK_SIZE, help="Rows inserted per transaction.")
+        parser.add_argument("--workers", type=int, default=1, help="Processes used to hash passwords.")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        try:
+            with open(options["path"], "rb") as file:
+                results = onboarding.import_members(
+                    onboarding.read_rows(file, options["path"]), chunk_size=options["chunk_size"], workers=options["workers"]
+                )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if options["report"]:
+            with open(options["report"], "w", newline="") as output:
+                onboarding.write_report(results, output)
+        else:
+            onboarding.write_report(results, sys.stdout)
+
+        created = sum(result.status == "created" for result in results)
+        self.stderr.write(self.style.SUCCESS(
+            f"Created {created} members, {len(results) - created} rows rejected; {throughput(len(results), time.monotonic() - started)}."
+        ))
@@ -0,0 +1,53 @@
+import os
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from sacco import statements
+from sacco.batch import JOBS, run_job, throughput
+
+
+class Command(BaseCommand):
+    help = "Snapshot every wallet and savings balance at a month end, then write each member's statements for that month."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--month", default=None, help="Month to close, YYYY-MM (default: last month).")
+        parser.add_argument("--directory", required=True, help="Where to write the statement files.")
+        parser.add_argument("--format", choices=sorted(statements.FORMATS), default="pdf")
+        parser.add_argument("--snapshots-only", action="store_true", help="Take the month-end snapshots but write no statements.")
+        parser.add_argument("--chunk-size", type=int, default=None, help="Rows per chunk (default: each job's own).")
+        parser.add_argument("--workers", type=int, default=1, help="Processes to spread chunks over.")
+        parser.add_argument("--restart", action="store_true", help="Abandon unfinished runs instead of resuming them.")
+
+    def handle(self, *args, **options):
+        try:
+            first_day = date.fromisoformat(f"{options['month']}-01") if options["month"] else statements.previous_month_end(timezone.localdate()).replace(day=1)
+        except ValueError:
+            raise CommandError("--month must look like YYYY-MM.")
+        last_day = statements.month_end(first_day)
+        if last_day >= timezone.localdate():
+            # A snapshot taken before the month has closed would miss its last postings for good
+            raise CommandError(f"{first_day:%Y-%m} has not ended yet.")
+        os.makedirs(options["directory"], exist_ok=True)
+
+        jobs = [("balance_snapshots", {"day": last_day.isoformat()})]
+        if not options["snapshots_only"]:
+            jobs.append(("member_statements", {
+                "start": first_day.isoformat(),
+                "end": last_day.isoformat(),
+                "directory": os.path.abspath(options["directory"]),
+                "format": options["format"],
+            }))
+
+        for name, params in jobs:
+            def progress(run, rows, seconds):
+                self.stdout.write(f"{name}: checkpoint at id {run.last_id}, {throughput(rows, seconds)}")
+
+            started = time.monotonic()
+            run, rows = run_job(
+                JOBS[name], params=params, chunk_size=options["chunk_size"], workers=options["workers"],
+                restart=options["restart"], progress=progress,
+            )
+            self.stdout.write(self.style.SUCCESS(f"{name} run {run.id} completed: {throughput(rows, time.monotonic() - started)}."))
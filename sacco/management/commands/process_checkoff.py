@@ -0,0 +1,47 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from sacco import checkoff
+from sacco.batch import throughput
+
+
+class Command(BaseCommand):
+    help = "Post an employer check-off CSV (member, savings, loan_repayment) to savings and loan balances."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Check-off CSV file.")
+        parser.add_argument("--report", default=None, help="Write the rejected lines as CSV here (default: stdout).")
+        parser.add_argument("--chunk-size", type=int, default=checkoff.CHECKOFF_CHUNK_SIZE, help="Lines posted per transaction.")
+
+    def handle(self, *args, **options):
+        def progress(checkoff_file, lines, seconds):
+            self.stderr.write(f"{checkoff_file.filename}: checkpoint at line {checkoff_file.last_line}, {throughput(lines, seconds)}")
+
+        started = time.monotonic()
+        try:
+            with open(options["path"], "rb") as file:
+                checkoff_file, rejected = checkoff.process_file(
+                    file, options["path"], chunk_size=options["chunk_size"], progress=progress
+                )
+        except (ValueError, checkoff.CheckoffConflict) as e:
+            raise CommandError(str(e))
+
+        if rejected is None:
+            self.stderr.write(self.style.WARNING(
+                f"{options['path']} was already posted on {checkoff_file.completed_at:%Y-%m-%d %H:%M} (as {checkoff_file.filename}); nothing done."
+            ))
+            return
+
+        if options["report"]:
+            with open(options["report"], "w", newline="") as output:
+                checkoff.write_report(rejected, output)
+        else:
+            checkoff.write_report(rejected, sys.stdout)
+
+        self.stderr.write(self.style.SUCCESS(
+            f"Posted {checkoff_file.rows_posted} lines (savings Ksh {checkoff_file.total_savings}, "
+            f"repayments Ksh {checkoff_file.total_repayments}), {checkoff_file.rows_rejected} rejected; "
+            f"{throughput(checkoff_file.rows_posted + checkoff_file.rows_rejected, time.monotonic() - started)}."
+        ))
@@ -0,0 +1,6 @@
+from sacco.batch import BatchCommand
+
+
+class Command(BatchCommand):
+    help = "Rebuild the per-member daily flow rollup used by the dashboard charts from the transaction ledger."
+    job_name = "daily_flows"
@@ -0,0 +1,60 @@
+import csv
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from sacco.batch import JOBS, run_job, throughput
+from sacco.models import BalanceDrift
+
+REPORT_HEADER = ["Kind", "Owner", "Recorded", "Expected", "Difference", "Repaired"]
+
+
+class Command(BaseCommand):
+    help = "Recompute every wallet, savings, share and loan balance from the journal and report (or --repair) drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repair", action="store_true", help="Set drifted balances to their journal totals.")
+        parser.add_argument("--day", type=date.fromisoformat, default=None, help="Run date the drift is filed under (default: today).")
+        parser.add_argument("--report", default=None, help="Write every drifted balance as CSV here.")
+        parser.add_argument("--limit", type=int, default=20, help="Drifted balances listed in the output.")
+        parser.add_argument("--chunk-size", type=int, default=None, help="Members or loans per chunk (default: each job's own).")
+        parser.add_argument("--workers", type=int, default=1, help="Processes to spread chunks over.")
+        parser.add_argument("--restart", action="store_true", help="Abandon unfinished runs instead of resuming them.")
+
+    def handle(self, *args, **options):
+        day = options["day"] or timezone.localdate()
+        params = {"day": day.isoformat(), "repair": options["repair"]}
+
+        for name in ("reconcile_members", "reconcile_loans"):
+            def progress(run, rows, seconds):
+                self.stdout.write(f"{name}: checkpoint at id {run.last_id}, {throughput(rows, seconds)}")
+
+            started = time.monotonic()
+            run, rows = run_job(
+                JOBS[name], params=params, chunk_size=options["chunk_size"], workers=options["workers"],
+                restart=options["restart"], progress=progress,
+            )
+            self.stdout.write(f"{name} run {run.id} completed: {throughput(rows, time.monotonic() - started)}.")
+
+        drifts = BalanceDrift.objects.filter(day=day).order_by("kind", "owner_id")
+        for drift in drifts[:options["limit"]]:
+            self.stdout.write(f"  {drift}{' (repaired)' if drift.repaired else ''}")
+        if options["report"]:
+            with open(options["report"], "w", newline="") as output:
+                writer = csv.writer(output)
+                writer.writerow(REPORT_HEADER)
+                for drift in drifts.iterator(chunk_size=5000):
+                    difference = drift.expected - drift.recorded if drift.recorded is not None else ""
+                    writer.writerow([drift.kind, drift.owner_id, drift.recorded, drift.expected, difference, drift.repaired])
+
+        counts = drifts.aggregate(found=Count("id"), repaired=Count("id", filter=Q(repaired=True)))
+        outstanding = counts["found"] - counts["repaired"]
+        if outstanding:
+            raise CommandError(f"{counts['found']} balances drifted from the journal, {outstanding} not repaired.")
+        if counts["found"]:
+            self.stdout.write(self.style.SUCCESS(f"Repaired all {counts['found']} drifted balances."))
+        else:
+            self.stdout.write(self.style.SUCCESS("Every balance matches the journal."))
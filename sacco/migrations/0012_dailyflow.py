@@ -0,0 +1,29 @@
+# Generated by Django 5.1.7 on 2026-10-18 10:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sacco', '0011_share'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyFlow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('deposits', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('withdrawals', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('transfers', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('repayments', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('member', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='sacco.member')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('member', 'day'), name='unique_daily_flow_per_member')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.7 on 2026-10-18 10:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sacco', '0012_dailyflow'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DividendRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_amount', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('total_shares', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('status', models.CharField(choices=[('running', 'Running'), ('completed', 'Completed')], default='running', max_length=20)),
+                ('last_share_id', models.BigIntegerField(default=0)),
+                ('cumulative_shares', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('distributed', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('members_paid', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
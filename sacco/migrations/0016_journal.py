@@ -0,0 +1,102 @@
+# Generated by Django 5.1.7 on 2026-10-18 10:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Balance field each member-facing account kind is opened from
+OPENING_BALANCES = [
+    ('wallet', 'Member', 'balance', 'member'),
+    ('savings', 'Member', 'savings_balance', 'member'),
+    ('share_capital', 'Share', 'total_investment', 'member'),
+    ('loan', 'Loan', 'remaining_balance', 'loan'),
+]
+
+
+def open_existing_balances(apps, schema_editor):
+    """ Journal every balance that predates the journal, against the Opening Balances account """
+    LedgerAccount = apps.get_model('sacco', 'LedgerAccount')
+    Journal = apps.get_model('sacco', 'Journal')
+    JournalEntry = apps.get_model('sacco', 'JournalEntry')
+
+    journal = None
+    total = 0
+    for kind, model_name, field, owner in OPENING_BALANCES:
+        model = apps.get_model('sacco', model_name)
+        owner_key = 'member_id' if model_name == 'Share' else 'id'
+        rows = list(model.objects.exclude(**{field: 0}).values_list(owner_key, field))
+        if not rows:
+            continue
+        if journal is None:
+            journal = Journal.objects.create(description='Opening balances')
+
+        LedgerAccount.objects.bulk_create([LedgerAccount(kind=kind, **{f'{owner}_id': owner_id}) for owner_id, _ in rows], batch_size=1000)
+        accounts = dict(LedgerAccount.objects.filter(kind=kind).values_list(f'{owner}_id', 'id'))
+        JournalEntry.objects.bulk_create(
+            [JournalEntry(journal=journal, account_id=accounts[owner_id], amount=amount) for owner_id, amount in rows],
+            batch_size=1000,
+        )
+        total += sum(amount for _, amount in rows)
+
+    if journal is not None:
+        opening = LedgerAccount.objects.create(kind='opening')
+        JournalEntry.objects.create(journal=journal, account=opening, amount=-total)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sacco', '0015_transaction_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Journal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('description', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('transaction', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='sacco.transaction')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LedgerAccount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('wallet', 'Wallet'), ('savings', 'Savings'), ('loan', 'Loan'), ('share_capital', 'Share Capital'), ('cash', 'Cash'), ('loan_fund', 'Loan Fund'), ('dividends', 'Dividends'), ('opening', 'Opening Balances')], max_length=20)),
+                ('loan', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='sacco.loan')),
+                ('member', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='sacco.member')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='JournalEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('projected', models.BooleanField(default=True)),
+                ('journal', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='sacco.journal')),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='entries', to='sacco.ledgeraccount')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='ledgeraccount',
+            constraint=models.UniqueConstraint(condition=models.Q(('member__isnull', False)), fields=('kind', 'member'), name='unique_member_account'),
+        ),
+        migrations.AddConstraint(
+            model_name='ledgeraccount',
+            constraint=models.UniqueConstraint(condition=models.Q(('loan__isnull', False)), fields=('kind', 'loan'), name='unique_loan_account'),
+        ),
+        migrations.AddConstraint(
+            model_name='ledgeraccount',
+            constraint=models.UniqueConstraint(condition=models.Q(('loan__isnull', True), ('member__isnull', True)), fields=('kind',), name='unique_system_account'),
+        ),
+        migrations.AddIndex(
+            model_name='journalentry',
+            index=models.Index(fields=['account', 'id'], name='entry_account_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='journalentry',
+            index=models.Index(condition=models.Q(('projected', False)), fields=['id'], name='entry_unprojected_idx'),
+        ),
+        migrations.RunPython(open_existing_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.7 on 2026-10-18 11:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sacco', '0017_batch_runs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CheckoffFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True)),
+                ('filename', models.CharField(max_length=255)),
+                ('status', models.CharField(choices=[('processing', 'Processing'), ('completed', 'Completed')], default='processing', max_length=20)),
+                ('last_line', models.IntegerField(default=0)),
+                ('rows_posted', models.IntegerField(default=0)),
+                ('rows_rejected', models.IntegerField(default=0)),
+                ('total_savings', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('total_repayments', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
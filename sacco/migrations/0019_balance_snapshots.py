@@ -0,0 +1,35 @@
+# Generated by Django 5.1.7 on 2026-10-18 11:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sacco', '0018_checkoff_files'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=14)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='journal',
+            index=models.Index(fields=['created_at'], name='journal_created_idx'),
+        ),
+        migrations.AddField(
+            model_name='balancesnapshot',
+            name='account',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='sacco.ledgeraccount'),
+        ),
+        migrations.AddConstraint(
+            model_name='balancesnapshot',
+            constraint=models.UniqueConstraint(fields=('account', 'day'), name='unique_snapshot_per_account_day'),
+        ),
+    ]
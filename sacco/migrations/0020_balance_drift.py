@@ -0,0 +1,28 @@
+# Generated by Django 5.1.7 on 2026-10-18 11:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sacco', '0019_balance_snapshots'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceDrift',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('kind', models.CharField(choices=[('wallet', 'Wallet'), ('savings', 'Savings'), ('loan', 'Loan'), ('share_capital', 'Share Capital'), ('cash', 'Cash'), ('loan_fund', 'Loan Fund'), ('dividends', 'Dividends'), ('opening', 'Opening Balances')], max_length=20)),
+                ('owner_id', models.BigIntegerField()),
+                ('recorded', models.DecimalField(decimal_places=2, max_digits=14, null=True)),
+                ('expected', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('repaired', models.BooleanField(default=False)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'kind', 'owner_id'), name='unique_drift_per_day')],
+            },
+        ),
+    ]
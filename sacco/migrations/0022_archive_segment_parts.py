@@ -0,0 +1,27 @@
+# Generated by Django 5.1.7 on 2026-10-18 12:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sacco', '0021_archive_segments'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivesegment',
+            name='part',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AlterField(
+            model_name='archivesegment',
+            name='month',
+            field=models.DateField(),
+        ),
+        migrations.AddConstraint(
+            model_name='archivesegment',
+            constraint=models.UniqueConstraint(fields=('month', 'part'), name='unique_archive_part'),
+        ),
+    ]
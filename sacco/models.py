@@ -1,7 +1,14 @@
-from django.db import models
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import connection, models, transaction as db_transaction
+from django.db.models.functions import TruncDate
 from django.contrib.auth.models import User
+from django.utils import timezone
 from decimal import Decimal
 
+from .tracing import trace
+
 # ✅ Member Model
 class Member(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
@@ -35,17 +42,34 @@ class Loan(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     reviewed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # Admin queue and KPI counts by status (loan_approval)
+            models.Index(fields=['status', 'created_at'], name='loan_status_created_idx'),
+            # A member's loans by status (dashboard, repay_loan)
+            models.Index(fields=['member', 'status'], name='loan_member_status_idx'),
+        ]
+
     def save(self, *args, **kwargs):
         """ Ensure remaining balance updates properly without overriding repayments """
-        print(f"Before Save - Loan ID: {self.id}, Remaining Balance: {self.remaining_balance}")
+        remaining_before = self.remaining_balance
 
-        # Only set remaining balance when first approving a loan, not during repayments or updates
-        if self.status == "approved" and self._state.adding:
-            self.remaining_balance = self.amount
+        # Only set remaining balance when first approving a loan, not during repayments or updates.
+        # It is funded through the journal, which moves remaining_balance from zero to the amount.
+        funding = self.status == "approved" and self._state.adding
+        if funding:
+            self.remaining_balance = 0
 
         super().save(*args, **kwargs)
 
-        print(f"After Save - Loan ID: {self.id}, Remaining Balance: {self.remaining_balance}")
+        if funding:
+            from .posting import fund_loan
+            fund_loan(self, self.amount)
+
+        trace(
+            "loan.save", loan_id=self.id, member_id=self.member_id, status=self.status,
+            remaining_before=remaining_before, remaining_after=self.remaining_balance,
+        )
 
     def calculate_interest(self):
         """ Method to calculate loan interest """
@@ -55,14 +79,20 @@ class Loan(models.Model):
             return interest
         return 0
 
+    def amortization_schedule(self, method="reducing"):
+        """ Monthly repayment schedule (flat, reducing or annuity) as a list of dict rows """
+        from .amortization import loan_schedule
+        return loan_schedule(self, method)
+
+    def daily_interest(self, days=1):
+        """ Interest accrued on the remaining balance over `days` """
+        from .amortization import daily_accrual
+        return Decimal(f"{daily_accrual(self.remaining_balance, self.interest_rate, days)[0]:.2f}")
+
     def update_withdrawn_balance(self, amount):
         """ Method to update total withdrawn amount """
-        if amount <= self.remaining_balance:
-            self.total_withdrawn += amount
-            self.remaining_balance -= amount
-            self.save()
-        else:
-            raise ValueError("Withdrawal amount exceeds remaining loan balance")
+        from .posting import apply_loan_withdrawal
+        apply_loan_withdrawal(self, amount)
 
     def __str__(self):
         return f"{self.member.user.username} - Loan Amount: ${self.amount} - Remaining Balance: ${self.remaining_balance} - Status: {self.status}"
@@ -83,44 +113,35 @@ class Transaction(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     description = models.CharField(max_length=255, blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            # Per-member history (dashboard, statements), newest first
+            models.Index(fields=['member', 'created_at'], name='txn_member_created_idx'),
+            # Per-member history of one type (transfer_funds)
+            models.Index(fields=['member', 'transaction_type', 'created_at'], name='txn_member_type_created_idx'),
+            # Ledger-wide listings by type (transaction_history filter, report export)
+            models.Index(fields=['transaction_type', 'created_at'], name='txn_type_created_idx'),
+            # Ledger-wide listings and date ranges (loan_approval, transaction_history, report export)
+            models.Index(fields=['created_at'], name='txn_created_idx'),
+        ]
+
     def save(self, *args, **kwargs):
         """ Update member balance when a transaction is saved """
-        if self.pk is None:  # Only update balance for new transactions
-            if self.transaction_type == "deposit":
-                # Adding deposit amount to member's balance
-                self.member.balance += self.amount
-            
-            elif self.transaction_type == "withdrawal":
-                # Deducting withdrawal amount from member's balance, ensuring sufficient funds
-                if self.member.balance >= self.amount:
-                    self.member.balance -= self.amount
-                else:
-                    raise ValueError("Insufficient funds for withdrawal")
-            
-            elif self.transaction_type == "loan_repayment":
-                # Deduct loan repayment from member's balance
-                if self.member.balance >= self.amount:
-                    self.member.balance -= self.amount
-
-                    # Find an ongoing loan to apply the repayment
-                    loan = Loan.objects.filter(member=self.member, repayment_status="ongoing").first()
-                    if loan:
-                        LoanRepayment.objects.create(loan=loan, amount_paid=self.amount)
-                    else:
-                        raise ValueError("No ongoing loan found for repayment.")
-
-                else:
-                    raise ValueError("Insufficient funds for loan repayment")
-
-            elif self.transaction_type == "transfer":
-                # Transfer logic handled separately, no balance change here
-                pass
-
-            # Save the member's updated balance
-            self.member.save()
-
-        # Ensure the transaction record is saved
-        super().save(*args, **kwargs)
+        # Posting services apply their own balance legs and pass apply_balance=False
+        apply_balance = kwargs.pop("apply_balance", True)
+        adding = self._state.adding
+
+        with db_transaction.atomic():
+            # Ensure the transaction record is saved (first, so its journal can point at it)
+            super().save(*args, **kwargs)
+
+            if adding and apply_balance:
+                from .posting import apply_transaction
+                apply_transaction(self)
+
+            # Keep the dashboard's daily rollup in step with the ledger
+            if adding:
+                DailyFlow.record(self)
 
     def __str__(self):
         return f"{self.member.user.username} - {self.transaction_type} - Ksh {self.amount}"
@@ -134,25 +155,25 @@ class LoanRepayment(models.Model):
 
     def save(self, *args, **kwargs):
         """ Deduct repayment from remaining loan balance and update status """
-        print(f"Before Repayment - Loan ID: {self.loan.id}, Remaining Balance: {self.loan.remaining_balance}")
+        if not self._state.adding:
+            return super().save(*args, **kwargs)
 
-        if self.loan.remaining_balance < self.amount_paid:
-            raise ValueError("Payment exceeds remaining balance.")
+        remaining_before = self.loan.remaining_balance
 
-        # Deduct the repayment
-        self.loan.remaining_balance -= self.amount_paid
-        print(f"After Deduction - New Remaining Balance: {self.loan.remaining_balance}")
+        with db_transaction.atomic():
+            # Guarded F() update: raises if the payment exceeds the remaining balance
+            from .posting import apply_loan_repayment
+            apply_loan_repayment(self.loan, self.amount_paid)
 
-        # Mark loan as completed if fully paid
-        if self.loan.remaining_balance == 0:
-            self.loan.repayment_status = "completed"
-            self.loan.status = "approved"
+            super().save(*args, **kwargs)
 
-        self.loan.save()
-        super().save(*args, **kwargs)
+        trace(
+            "loan.repayment", loan_id=self.loan_id, member_id=self.loan.member_id, amount=self.amount_paid,
+            remaining_before=remaining_before, remaining_after=self.loan.remaining_balance,
+        )
 
     def __str__(self):
-        return f"Loan ID: {self.loan.id} - Amount Paid: {self.amount_paid} - Date: {self.date_paid}"
+        return f"Loan ID: {self.loan_id} - Amount Paid: {self.amount_paid} - Date: {self.date_paid}"
     
 
 class Share(models.Model):
@@ -161,16 +182,330 @@ class Share(models.Model):
     total_investment = models.DecimalField(max_digits=12, decimal_places=2, default=0)
 
     def buy_shares(self, amount, price_per_share):
-        num_shares = Decimal(amount) / Decimal(price_per_share)
-        self.shares_owned += num_shares
-        self.total_investment += amount
-        self.save()
+        """ Add shares paid for outside the wallet (see posting.buy_shares for wallet purchases) """
+        from .posting import add_shares
+        add_shares(self, amount, price_per_share, paid_from="cash")
 
     def transfer_shares(self, recipient, num_shares):
-        if self.shares_owned >= num_shares:
-            self.shares_owned -= num_shares
-            recipient.shares_owned += num_shares
-            self.save()
-            recipient.save()
-            return True
-        return False
+        from .posting import transfer_shares
+        return transfer_shares(self, recipient, num_shares)
+
+
+# ✅ Dividend Run (checkpointed so an interrupted payout can be resumed)
+class DividendRun(models.Model):
+    STATUS_CHOICES = [
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+    ]
+
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2)  # Pot being distributed
+    total_shares = models.DecimalField(max_digits=14, decimal_places=2)  # Frozen when the run starts
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='running')
+    last_share_id = models.BigIntegerField(default=0)  # Checkpoint: highest Share id already paid
+    cumulative_shares = models.DecimalField(max_digits=14, decimal_places=2, default=0)  # Shares covered so far
+    distributed = models.DecimalField(max_digits=14, decimal_places=2, default=0)  # Amount paid out so far
+    members_paid = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Dividend Run {self.id} - Ksh {self.total_amount} - Status: {self.status}"
+
+
+# ✅ Batch Run (checkpoint of a chunked management command)
+class BatchRun(models.Model):
+    STATUS_CHOICES = [
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('abandoned', 'Abandoned'),
+    ]
+
+    job = models.CharField(max_length=50)
+    params = models.JSONField(default=dict, blank=True)  # Job options; a run only resumes with the same ones
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='running')
+    last_id = models.BigIntegerField(default=0)  # Checkpoint: highest row id already processed
+    rows_processed = models.IntegerField(default=0)
+    chunks_processed = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['job', 'status'], name='batch_run_job_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.job} run {self.id} - {self.rows_processed} rows - Status: {self.status}"
+
+
+# ✅ Interest Accrual (one row per loan per day, written by the accrue_interest job)
+class InterestAccrual(models.Model):
+    loan = models.ForeignKey(Loan, on_delete=models.CASCADE, related_name='accruals')
+    day = models.DateField()
+    balance = models.DecimalField(max_digits=10, decimal_places=2)  # Remaining balance the interest was charged on
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['loan', 'day'], name='unique_accrual_per_loan_day'),
+        ]
+
+    def __str__(self):
+        return f"Loan {self.loan_id} - {self.day} - Ksh {self.amount}"
+
+
+# ✅ Check-off File (one per employer payroll file, keyed by content hash so a file is never posted twice)
+class CheckoffFile(models.Model):
+    STATUS_CHOICES = [
+        ('processing', 'Processing'),
+        ('completed', 'Completed'),
+    ]
+
+    sha256 = models.CharField(max_length=64, unique=True)
+    filename = models.CharField(max_length=255)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='processing')
+    last_line = models.IntegerField(default=0)  # Checkpoint: last file line already posted or rejected
+    rows_posted = models.IntegerField(default=0)
+    rows_rejected = models.IntegerField(default=0)
+    total_savings = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_repayments = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.filename} - {self.rows_posted} rows posted - Status: {self.status}"
+
+
+# ✅ Ledger Account (one per member wallet/savings, loan and share holding, plus SACCO system accounts)
+class LedgerAccount(models.Model):
+    KIND_CHOICES = [
+        ('wallet', 'Wallet'),
+        ('savings', 'Savings'),
+        ('loan', 'Loan'),
+        ('share_capital', 'Share Capital'),
+        ('cash', 'Cash'),  # Money entering or leaving the SACCO
+        ('loan_fund', 'Loan Fund'),  # Lending pool loans are funded from and repaid into
+        ('dividends', 'Dividends'),
+        ('opening', 'Opening Balances'),  # Balances that existed before the journal
+    ]
+    MEMBER_KINDS = ('wallet', 'savings', 'share_capital')
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    member = models.ForeignKey(Member, on_delete=models.CASCADE, null=True, blank=True)
+    loan = models.ForeignKey(Loan, on_delete=models.CASCADE, null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'member'], condition=models.Q(member__isnull=False), name='unique_member_account'),
+            models.UniqueConstraint(fields=['kind', 'loan'], condition=models.Q(loan__isnull=False), name='unique_loan_account'),
+            models.UniqueConstraint(
+                fields=['kind'], condition=models.Q(member__isnull=True, loan__isnull=True), name='unique_system_account'
+            ),
+        ]
+
+    def __str__(self):
+        owner = self.member_id or self.loan_id
+        return f"{self.get_kind_display()} {owner}" if owner else self.get_kind_display()
+
+
+# ✅ Journal (one balanced, append-only posting)
+class Journal(models.Model):
+    description = models.CharField(max_length=255, blank=True)
+    transaction = models.ForeignKey(Transaction, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Entries of a date range (month-end snapshots, statements)
+            models.Index(fields=['created_at'], name='journal_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"Journal {self.id} - {self.description}"
+
+
+# ✅ Journal Entry (signed amount on one account; every journal's entries sum to zero)
+class JournalEntry(models.Model):
+    journal = models.ForeignKey(Journal, on_delete=models.CASCADE, related_name='entries')
+    account = models.ForeignKey(LedgerAccount, on_delete=models.PROTECT, related_name='entries')
+    amount = models.DecimalField(max_digits=14, decimal_places=2)
+    projected = models.BooleanField(default=True)  # False until catch-up applies it to the balance fields
+
+    class Meta:
+        indexes = [
+            # Per-account history and sums (statements, reconciliation)
+            models.Index(fields=['account', 'id'], name='entry_account_idx'),
+            # Entries still waiting for projection catch-up
+            models.Index(fields=['id'], condition=models.Q(projected=False), name='entry_unprojected_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.account} {self.amount}"
+
+
+# ✅ Balance Snapshot (an account's balance at a month end, so statements never replay the whole journal)
+class BalanceSnapshot(models.Model):
+    account = models.ForeignKey(LedgerAccount, on_delete=models.CASCADE, related_name='snapshots')
+    day = models.DateField()  # Last day of the month; includes every entry up to the end of that day
+    balance = models.DecimalField(max_digits=14, decimal_places=2)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['account', 'day'], name='unique_snapshot_per_account_day'),
+        ]
+
+    def __str__(self):
+        return f"{self.account} - {self.day} - Ksh {self.balance}"
+
+
+# ✅ Balance Drift (a projected balance that disagreed with its journal entries, found by the nightly reconciliation)
+class BalanceDrift(models.Model):
+    day = models.DateField()  # Reconciliation run the drift was found by
+    kind = models.CharField(max_length=20, choices=LedgerAccount.KIND_CHOICES)
+    owner_id = models.BigIntegerField()  # Loan id for loan balances, else member id
+    recorded = models.DecimalField(max_digits=14, decimal_places=2, null=True)  # None: no row holds this balance
+    expected = models.DecimalField(max_digits=14, decimal_places=2)  # Sum of the account's projected entries
+    repaired = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'kind', 'owner_id'], name='unique_drift_per_day'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.owner_id} - {self.day} - recorded {self.recorded}, expected {self.expected}"
+
+
+# ✅ Archive Segment (one closed month of transactions moved from the hot table to a gzip CSV file; see sacco/archive.py)
+class ArchiveSegment(models.Model):
+    month = models.DateField()  # First day of the archived month
+    part = models.PositiveIntegerField(default=1)  # Later parts hold rows that arrived after the month was archived
+    path = models.CharField(max_length=255)  # File name under settings.SACCO_ARCHIVE_DIR
+    rows = models.IntegerField()
+    total_amount = models.DecimalField(max_digits=16, decimal_places=2)
+    first_id = models.BigIntegerField()
+    last_id = models.BigIntegerField()  # Hot rows of the month up to this id are in this part or an earlier one
+    sha256 = models.CharField(max_length=64)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['month', 'part'], name='unique_archive_part'),
+        ]
+
+    @classmethod
+    def hot_from(cls):
+        """ First day after the newest archived month (None if nothing is archived) """
+        month = cls.objects.aggregate(latest=models.Max('month'))['latest']
+        return (month.replace(day=28) + timedelta(days=4)).replace(day=1) if month else None
+
+    def __str__(self):
+        return f"{self.month:%Y-%m} part {self.part} - {self.rows} transactions - {self.path}"
+
+
+# ✅ Daily Flow Rollup (per member, per day)
+class DailyFlow(models.Model):
+    """ Pre-aggregated daily totals per member, so charts never scan the raw ledger """
+    FLOW_FIELDS = {
+        'deposit': 'deposits',
+        'withdrawal': 'withdrawals',
+        'transfer': 'transfers',
+        'loan_repayment': 'repayments',
+    }
+
+    member = models.ForeignKey(Member, on_delete=models.CASCADE)
+    day = models.DateField()
+    deposits = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    withdrawals = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    transfers = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    repayments = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['member', 'day'], name='unique_daily_flow_per_member'),
+        ]
+
+    @classmethod
+    def record(cls, transaction):
+        """ Add a saved transaction's amount to its member's bucket for that day """
+        field = cls.FLOW_FIELDS.get(transaction.transaction_type)
+        if field is None:
+            return
+
+        day = timezone.localdate(transaction.created_at)
+        cls.objects.get_or_create(member_id=transaction.member_id, day=day)
+        # F() keeps concurrent saves for the same member/day from losing updates
+        cls.objects.filter(member_id=transaction.member_id, day=day).update(
+            **{field: models.F(field) + transaction.amount}
+        )
+
+    @classmethod
+    def record_many(cls, transactions):
+        """ record() for transactions written with bulk_create: one prepared upsert per member and day """
+        fields = list(cls.FLOW_FIELDS.values())
+        totals = defaultdict(lambda: dict.fromkeys(fields, Decimal(0)))
+        for transaction in transactions:
+            field = cls.FLOW_FIELDS.get(transaction.transaction_type)
+            if field is not None:
+                totals[(transaction.member_id, timezone.localdate(transaction.created_at))][field] += transaction.amount
+        if not totals:
+            return
+
+        # INSERT ... ON CONFLICT DO UPDATE adds to an existing bucket just like record()'s F() update
+        quote = connection.ops.quote_name
+        sql = "INSERT INTO {table} (member_id, day, {columns}) VALUES (%s, %s, {values}) ON CONFLICT (member_id, day) DO UPDATE SET {updates}".format(
+            table=quote(cls._meta.db_table),
+            columns=", ".join(map(quote, fields)),
+            values=", ".join(["%s"] * len(fields)),
+            updates=", ".join(f"{quote(field)} = {quote(field)} + excluded.{quote(field)}" for field in fields),
+        )
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, [
+                (member_id, day.isoformat(), *(flows[field] for field in fields)) for (member_id, day), flows in totals.items()
+            ])
+
+    @classmethod
+    def rebuild(cls, batch_size=5000, member_ids=None):
+        """ Recompute buckets from the ledger with one grouped query; returns rows written.
+
+        member_ids (a list or a values('id') subquery) limits the rebuild to those members.
+        Days in archived months are kept as they are: their transactions have left the table.
+        """
+        sums = {
+            field: models.Sum('amount', filter=models.Q(transaction_type=transaction_type), default=0)
+            for transaction_type, field in cls.FLOW_FIELDS.items()
+        }
+        buckets = (
+            Transaction.objects.filter(transaction_type__in=cls.FLOW_FIELDS)
+            .annotate(day=TruncDate('created_at'))
+            .values('member_id', 'day')
+            .annotate(**sums)
+            .order_by()
+        )
+        existing = cls.objects.all()
+        hot_from = ArchiveSegment.hot_from()
+        if hot_from:
+            buckets = buckets.filter(day__gte=hot_from)
+            existing = existing.filter(day__gte=hot_from)
+        if member_ids is not None:
+            buckets = buckets.filter(member_id__in=member_ids)
+            existing = existing.filter(member_id__in=member_ids)
+
+        written = 0
+        with db_transaction.atomic():
+            existing.delete()
+            batch = []
+            for bucket in buckets.iterator(chunk_size=batch_size):
+                batch.append(cls(**bucket))
+                if len(batch) >= batch_size:
+                    cls.objects.bulk_create(batch)
+                    written += len(batch)
+                    batch = []
+            if batch:
+                cls.objects.bulk_create(batch)
+                written += len(batch)
+        return written
+
+    def __str__(self):
+        return f"{self.member_id} - {self.day}"
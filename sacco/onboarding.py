@@ -0,0 +1,173 @@
+"""
+Bulk member onboarding from a CSV or XLSX sheet (columns: username, email, phone,
+and optionally password).
+
+Rows are validated with the same rules as the register view (UserRegistrationForm
+and MemberForm), except that username uniqueness is checked for a whole chunk in
+one query. Rows with a password have it hashed, in a process pool when workers > 1;
+rows without one get an unusable password and a set-password link. Users and
+members are then written with bulk_create, one atomic chunk at a time.
+"""
+import csv
+import io
+from concurrent.futures import ProcessPoolExecutor
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.contrib.auth.tokens import default_token_generator
+from django.db import IntegrityError, connections, transaction as db_transaction
+from django.urls import reverse
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from . import summary
+from .batch import init_worker
+from .forms import MemberForm, UserRegistrationForm
+from .models import Member
+
+COLUMNS = ["username", "email", "phone", "password"]
+IMPORT_CHUNK_SIZE = 1000
+REPORT_HEADER = ["Row", "Username", "Status", "Errors", "Set password link"]
+
+
+class ImportUserForm(UserRegistrationForm):
+    """ UserRegistrationForm rules; uniqueness is checked per chunk by the importer instead """
+
+    def validate_unique(self):
+        pass
+
+
+class RowResult:
+    def __init__(self, row, username, errors=None):
+        self.row = row
+        self.username = username
+        self.errors = errors or []
+        self.set_password_link = ""
+
+    @property
+    def status(self):
+        return "error" if self.errors else "created"
+
+
+def read_rows(file, filename):
+    """ Yield (row number, dict of COLUMNS) from an uploaded or opened CSV/XLSX file """
+    if filename.lower().endswith(".xlsx"):
+        try:
+            from openpyxl import load_workbook
+        except ImportError:
+            raise ValueError("XLSX import needs the openpyxl package; save the sheet as CSV instead.")
+        sheet = load_workbook(file, read_only=True).active
+        rows = sheet.iter_rows(values_only=True)
+        header = [str(cell or "").strip().lower() for cell in next(rows, [])]
+        records = ({key: "" if value is None else str(value) for key, value in zip(header, values)} for values in rows)
+    else:
+        text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="") if isinstance(file.read(0), bytes) else file
+        reader = csv.DictReader(text)
+        reader.fieldnames = [name.strip().lower() for name in reader.fieldnames or []]
+        records = reader
+
+    for number, record in enumerate(records, start=2):  # row 1 is the header
+        if any((value or "").strip() for value in record.values()):
+            yield number, {column: (record.get(column) or "").strip() for column in COLUMNS}
+
+
+def _form_errors(*forms):
+    return [f"{field}: {error}" if field != "__all__" else error for form in forms for field, errors in form.errors.items() for error in errors]
+
+
+def _validate(chunk, seen):
+    """ Return (results, valid rows) for one chunk; valid rows are (result, user data, member data, password) """
+    existing = set(User.objects.filter(username__in=[data["username"] for _, data in chunk]).values_list("username", flat=True))
+    results, valid = [], []
+    for number, data in chunk:
+        password = data["password"]
+        user_form = ImportUserForm({**data, "password": password or "-", "confirm_password": password or "-"})
+        member_form = MemberForm({"phone": data["phone"]})
+        result = RowResult(number, data["username"])
+        if not (user_form.is_valid() & member_form.is_valid()):  # & so both forms report their errors
+            result.errors = _form_errors(user_form, member_form)
+        elif data["username"] in seen:
+            result.errors = ["username: Duplicate of an earlier row in this file."]
+        elif data["username"] in existing:
+            result.errors = ["username: A user with that username already exists."]
+        else:
+            seen.add(data["username"])
+            valid.append((result, user_form.cleaned_data, member_form.cleaned_data, password))
+        results.append(result)
+    return results, valid
+
+
+def _hash_passwords(passwords, pool):
+    """ Hash the given passwords (None -> unusable password), spreading the work over `pool` if any """
+    to_hash = [password for password in passwords if password]
+    hashed = iter(pool.map(make_password, to_hash, chunksize=16) if pool else map(make_password, to_hash))
+    return [next(hashed) if password else make_password(None) for password in passwords]
+
+
+def _set_password_link(user):
+    uid = urlsafe_base64_encode(force_bytes(user.pk))
+    return reverse("password_reset_confirm", args=[uid, default_token_generator.make_token(user)])
+
+
+def _insert(valid, hashes):
+    """ bulk_create one chunk of users and their members in a single transaction """
+    users = [
+        User(username=cleaned["username"], email=cleaned["email"], password=password_hash)
+        for (_, cleaned, _, _), password_hash in zip(valid, hashes)
+    ]
+    with db_transaction.atomic():
+        User.objects.bulk_create(users)
+        Member.objects.bulk_create([
+            Member(user=user, phone=member_data["phone"]) for user, (_, _, member_data, _) in zip(users, valid)
+        ])
+    for user, (result, _, _, password) in zip(users, valid):
+        if not password:
+            result.set_password_link = _set_password_link(user)
+
+
+def import_members(rows, chunk_size=IMPORT_CHUNK_SIZE, workers=1):
+    """ Validate and create members from read_rows() output; returns a RowResult per row """
+    pool = None
+    if workers > 1:
+        connections.close_all()  # forked workers must not inherit open connections
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=init_worker)
+
+    results, seen, chunk = [], set(), []
+    try:
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                results += _import_chunk(chunk, seen, pool)
+                chunk = []
+        if chunk:
+            results += _import_chunk(chunk, seen, pool)
+    finally:
+        if pool:
+            pool.shutdown()
+    summary.invalidate("members")  # bulk_create sends no post_save
+    return results
+
+
+def _import_chunk(chunk, seen, pool):
+    results, valid = _validate(chunk, seen)
+    if not valid:
+        return results
+    hashes = _hash_passwords([password for _, _, _, password in valid], pool)
+    try:
+        _insert(valid, hashes)
+    except IntegrityError:
+        # Someone registered one of these usernames meanwhile: fall back to row-by-row inserts
+        for row, password_hash in zip(valid, hashes):
+            try:
+                _insert([row], [password_hash])
+            except IntegrityError:
+                row[0].errors = ["username: A user with that username already exists."]
+    return results
+
+
+def write_report(results, output):
+    """ Write the per-row outcome as CSV to a text stream """
+    writer = csv.writer(output)
+    writer.writerow(REPORT_HEADER)
+    for result in results:
+        writer.writerow([result.row, result.username, result.status, "; ".join(result.errors), result.set_password_link])
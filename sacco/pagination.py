@@ -0,0 +1,125 @@
+import base64
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+class KeysetPage:
+    """ One page of keyset results, iterable like a Paginator page """
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None, approximate_total=None, total_is_capped=False):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.approximate_total = approximate_total
+        self.total_is_capped = total_is_capped
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    """ Cursor pagination over (created_at, id), newest first.
+
+    Each page seeks straight to its cursor through the created_at index, so there is
+    no COUNT(*) over the ledger and no OFFSET scan: page 1000 costs the same as page 1.
+    """
+
+    def __init__(self, queryset, per_page, count_limit=None):
+        self.queryset = queryset.order_by()
+        self.per_page = per_page
+        self.count_limit = count_limit  # Count at most this many rows for the approximate total
+
+    @staticmethod
+    def encode_cursor(obj, direction):
+        payload = json.dumps([obj.created_at.isoformat(), obj.pk, direction])
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+    @staticmethod
+    def decode_cursor(cursor):
+        """ Return (created_at, id, direction), or None for a missing or tampered cursor """
+        if not cursor:
+            return None
+        try:
+            padded = cursor + "=" * (-len(cursor) % 4)
+            created_at, pk, direction = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            created_at = parse_datetime(created_at)
+            if created_at is None or direction not in ("next", "prev"):
+                return None
+            return created_at, int(pk), direction
+        except (ValueError, TypeError):
+            return None
+
+    def approximate_count(self):
+        """ Count up to count_limit rows; returns (count, capped) so deep ledgers stay cheap """
+        if self.count_limit is None:
+            return None, False
+        count = self.queryset[:self.count_limit + 1].count()
+        return min(count, self.count_limit), count > self.count_limit
+
+    def older_rows(self, position, count):
+        """ Up to `count` rows older than every row of the queryset, newest first, after `position`.
+
+        A hook for rows kept outside the queryset (see sacco.archive.ArchivePaginator);
+        there are none here.
+        """
+        return []
+
+    def newer_rows(self, position, count):
+        """ The same rows oldest first, after `position` going back up """
+        return []
+
+    def _older(self, rows, position):
+        if len(rows) > self.per_page:
+            return []
+        if rows:
+            position = (rows[-1].created_at, rows[-1].pk)
+        return self.older_rows(position, self.per_page + 1 - len(rows))
+
+    def get_page(self, cursor=None):
+        position = self.decode_cursor(cursor)
+        queryset = self.queryset
+
+        if position is None:
+            rows = list(queryset.order_by("-created_at", "-id")[:self.per_page + 1])
+            rows += self._older(rows, None)
+            has_more_after, has_more_before = len(rows) > self.per_page, False
+            rows = rows[:self.per_page]
+        else:
+            created_at, pk, direction = position
+            if direction == "next":
+                # created_at__lte gives the index a range to seek to; the OR breaks ties on id
+                rows = list(
+                    queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk), created_at__lte=created_at)
+                    .order_by("-created_at", "-id")[:self.per_page + 1]
+                )
+                rows += self._older(rows, (created_at, pk))
+                has_more_after, has_more_before = len(rows) > self.per_page, True
+                rows = rows[:self.per_page]
+            else:
+                # Rows older than the queryset's come first going back up, so they are read first
+                rows = self.newer_rows((created_at, pk), self.per_page + 1)
+                if len(rows) <= self.per_page:
+                    rows += list(
+                        queryset.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk), created_at__gte=created_at)
+                        .order_by("created_at", "id")[:self.per_page + 1 - len(rows)]
+                    )
+                has_more_after, has_more_before = True, len(rows) > self.per_page
+                rows = rows[:self.per_page][::-1]
+
+        next_cursor = self.encode_cursor(rows[-1], "next") if rows and has_more_after else None
+        previous_cursor = self.encode_cursor(rows[0], "prev") if rows and has_more_before else None
+        total, capped = self.approximate_count()
+        return KeysetPage(rows, next_cursor, previous_cursor, total, capped)
@@ -0,0 +1,215 @@
+"""
+Loan book analytics: portfolio at risk (PAR30/60/90), arrears aging buckets,
+monthly disbursement and repayment curves and per-cohort performance.
+
+Two queries feed the per-loan figures: the approved loans, streamed, (with their local
+creation day computed in SQL) and the repayment total per loan (GROUP BY in
+SQL). They are aligned and bucketed with NumPy a chunk at a time, with no
+Python loop per loan. Results are cached per day in the summary cache; the
+portfolio_analytics command recomputes them, e.g. nightly. Loan postings
+(approvals, repayments, withdrawals) and loan changes drop the day's entry
+through sacco.signals. With the local-memory backend both the nightly warm-up
+and the invalidation only reach their own process, so the command warms nothing
+the web workers read; see the Caches notes in settings.
+
+Arrears are principal-only: repayments reduce the principal (see
+LoanRepayment.save), so installment k of a loan is amount / duration_months, due
+k months after the loan was created. A loan's days past due count from its
+oldest installment that its repayments do not cover.
+"""
+from itertools import islice
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction as db_transaction
+from django.db.models import Sum
+from django.db.models.functions import TruncDate, TruncMonth
+from django.utils import timezone
+
+from .amortization import PORTFOLIO_CHUNK_SIZE
+from .models import Loan, LoanRepayment
+
+KEY_PREFIX = "sacco:portfolio"
+TIMEOUT = 60 * 60 * 24
+PAR_DAYS = (30, 60, 90)
+# Aging buckets by days past due: (label, lowest day in the bucket)
+AGING_BUCKETS = [("Current", 0), ("1-30", 1), ("31-60", 31), ("61-90", 61), ("91-180", 91), ("Over 180", 181)]
+
+
+def _cache():
+    return caches[getattr(settings, "SACCO_SUMMARY_CACHE", "default")]
+
+
+def _month_label(index):
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+def _due_dates(start_month, day_of_month, k):
+    """ Due date of installment k (k months after the start month), clamped to the end of short months """
+    month = (start_month + k).astype("datetime64[D]")
+    days_in_month = (start_month + k + 1).astype("datetime64[D]") - month
+    return month + np.minimum(day_of_month, days_in_month.astype(np.int64) - 1)
+
+
+def days_past_due(created, amount, months, repaid, as_of):
+    """ Days past due for arrays of loans (created: datetime64[D]); 0 for loans that are up to date """
+    as_of = np.datetime64(as_of, "D")
+    start_month = created.astype("datetime64[M]")
+    day_of_month = (created - start_month.astype("datetime64[D]")).astype(np.int64)
+
+    # Installments due by as_of: whole months elapsed, less one if this month's due day is still ahead
+    elapsed = (as_of.astype("datetime64[M]") - start_month).astype(np.int64)
+    elapsed -= _due_dates(start_month, day_of_month, elapsed) > as_of
+    due = np.clip(elapsed, 0, months)
+
+    installment = amount / np.maximum(months, 1)
+    covered = np.floor(repaid / installment + 1e-9).astype(np.int64)
+    late = (covered < due) & (repaid < amount)
+    oldest_unpaid = _due_dates(start_month, day_of_month, covered + 1)
+    return np.where(late, (as_of - oldest_unpaid).astype(np.int64), 0)
+
+
+def _repayment_totals():
+    """ (loan ids, total repaid) arrays sorted by loan id, from one grouped query """
+    rows = list(LoanRepayment.objects.values_list("loan_id").annotate(total=Sum("amount_paid")).order_by("loan_id"))
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    ids, totals = zip(*rows)
+    return np.array(ids, dtype=np.int64), np.array(totals, dtype=float)
+
+
+def _align(loan_ids, repaid_ids, repaid_totals):
+    """ Total repaid for each of loan_ids (0 for loans without repayments) """
+    if not len(repaid_ids):
+        return np.zeros(len(loan_ids))
+    positions = np.minimum(np.searchsorted(repaid_ids, loan_ids), len(repaid_ids) - 1)
+    return np.where(repaid_ids[positions] == loan_ids, repaid_totals[positions], 0.0)
+
+
+def compute(as_of=None, chunk_size=PORTFOLIO_CHUNK_SIZE):
+    """ Analytics of every approved loan as of a day (today by default), as a JSON-friendly dict """
+    as_of = as_of or timezone.localdate()
+    bounds = [day for _, day in AGING_BUCKETS[1:]]
+    bucket_count = np.zeros(len(AGING_BUCKETS), dtype=np.int64)
+    bucket_outstanding = np.zeros(len(AGING_BUCKETS))
+    par_outstanding = np.zeros(len(PAR_DAYS))
+    cohorts = {}
+    loans = 0
+
+    repaid_ids, repaid_totals = _repayment_totals()
+    rows = (
+        Loan.objects.filter(status="approved")
+        .annotate(created_day=TruncDate("created_at"))
+        .values_list("id", "amount", "duration_months", "created_day")
+        .iterator(chunk_size=chunk_size)
+    )
+    while chunk := list(islice(rows, chunk_size)):
+        ids, amount, months, created = zip(*chunk)
+        ids = np.array(ids, dtype=np.int64)
+        amount = np.array(amount, dtype=float)
+        months = np.array(months, dtype=np.int64)
+        created = np.array(created, dtype="datetime64[D]")
+        repaid = _align(ids, repaid_ids, repaid_totals)
+        outstanding = np.clip(amount - repaid, 0, None)
+        dpd = days_past_due(created, amount, months, repaid, as_of)
+        loans += len(ids)
+
+        bucket = np.digitize(dpd, bounds)
+        bucket_count += np.bincount(bucket, minlength=len(AGING_BUCKETS))
+        bucket_outstanding += np.bincount(bucket, weights=outstanding, minlength=len(AGING_BUCKETS))
+        par_outstanding += [outstanding[dpd > days].sum() for days in PAR_DAYS]
+
+        # Cohort = month the loan was created; sums per cohort with one bincount per column
+        month_index = created.astype("datetime64[M]").astype(np.int64) + 1970 * 12
+        cohort_months, position = np.unique(month_index, return_inverse=True)
+        columns = {
+            "loans": np.bincount(position),
+            "disbursed": np.bincount(position, weights=amount),
+            "repaid": np.bincount(position, weights=repaid),
+            "outstanding": np.bincount(position, weights=outstanding),
+            "at_risk": np.bincount(position, weights=np.where(dpd > PAR_DAYS[0], outstanding, 0)),
+        }
+        for i, month in enumerate(cohort_months.tolist()):
+            row = cohorts.setdefault(month, dict.fromkeys(columns, 0))
+            for name, values in columns.items():
+                row[name] += values[i].item()
+
+    total_outstanding = bucket_outstanding.sum()
+
+    def share(value, total):
+        return round(float(value) / float(total) * 100, 2) if total else 0.0
+
+    return {
+        "as_of": as_of.isoformat(),
+        "loans": loans,
+        "outstanding": round(float(total_outstanding), 2),
+        "par": [
+            {"days": days, "outstanding": round(float(value), 2), "percent": share(value, total_outstanding)}
+            for days, value in zip(PAR_DAYS, par_outstanding)
+        ],
+        "aging": [
+            {"bucket": label, "loans": int(count), "outstanding": round(float(value), 2), "percent": share(value, total_outstanding)}
+            for (label, _), count, value in zip(AGING_BUCKETS, bucket_count, bucket_outstanding)
+        ],
+        "cohorts": [
+            {
+                "month": _month_label(month),
+                "loans": int(row["loans"]),
+                "disbursed": round(row["disbursed"], 2),
+                "repaid": round(row["repaid"], 2),
+                "outstanding": round(row["outstanding"], 2),
+                "repaid_percent": share(row["repaid"], row["disbursed"]),
+                "par30_percent": share(row["at_risk"], row["outstanding"]),
+            }
+            for month, row in sorted(cohorts.items())
+        ],
+        "curve": _curve({month: row["disbursed"] for month, row in cohorts.items()}),
+    }
+
+
+def _curve(disbursed):
+    """ Monthly and cumulative disbursements against repayments (one grouped query over repayments) """
+    repaid = {
+        row["month"].year * 12 + row["month"].month - 1: float(row["total"])
+        for row in LoanRepayment.objects.filter(loan__status="approved")
+        .annotate(month=TruncMonth("date_paid"))
+        .values("month")
+        .annotate(total=Sum("amount_paid"))
+        .order_by()
+    }
+    months = sorted(disbursed.keys() | repaid.keys())
+    if not months:
+        return []
+    disbursed_by_month = np.array([disbursed.get(month, 0.0) for month in months])
+    repaid_by_month = np.array([repaid.get(month, 0.0) for month in months])
+    return [
+        {
+            "month": _month_label(month),
+            "disbursed": round(float(d), 2),
+            "repaid": round(float(r), 2),
+            "cumulative_disbursed": round(float(cd), 2),
+            "cumulative_repaid": round(float(cr), 2),
+        }
+        for month, d, r, cd, cr in zip(
+            months, disbursed_by_month, repaid_by_month, np.cumsum(disbursed_by_month), np.cumsum(repaid_by_month)
+        )
+    ]
+
+
+def invalidate(as_of=None):
+    """ Drop the day's cached analytics once the current transaction commits (immediately outside one) """
+    key = f"{KEY_PREFIX}:{(as_of or timezone.localdate()).isoformat()}"
+    db_transaction.on_commit(lambda: _cache().delete(key))
+
+
+def get_analytics(as_of=None, refresh=False):
+    """ compute() for the day, from cache unless missing or refresh=True """
+    as_of = as_of or timezone.localdate()
+    key = f"{KEY_PREFIX}:{as_of.isoformat()}"
+    cache = _cache()
+    analytics = None if refresh else cache.get(key)
+    if analytics is None:
+        analytics = compute(as_of)
+        cache.set(key, analytics, TIMEOUT)
+    return analytics
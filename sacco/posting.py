@@ -0,0 +1,301 @@
+"""
+Posting engine: the one place member, loan and share balances change.
+
+Every posting writes a balanced journal (see sacco.journal), which moves the
+projected balance fields with database-side F() updates, so concurrent requests
+can never overwrite each other's result. Debits carry their own guard in the
+WHERE clause (e.g. balance >= amount); if a concurrent debit got there first the
+guard fails and InsufficientFunds is raised. Each service runs inside
+transaction.atomic, so a failed guard rolls back every other leg of the posting.
+"""
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+from django.db import connection, transaction as db_transaction
+from django.db.models import F
+
+from . import dashboard_cache, journal, summary
+from .journal import InsufficientFunds
+from .models import Loan, LoanRepayment, Share, Transaction
+from .tracing import trace
+
+ACCOUNT_LABELS = {"wallet": "Wallet", "savings": "Savings"}
+DECISION_CHUNK_SIZE = 500
+
+
+def record(member, amount, transaction_type, description=None):
+    """ Write the ledger row for a posting whose balance legs are journaled separately """
+    transaction = Transaction(member=member, amount=amount, transaction_type=transaction_type, description=description)
+    transaction.save(apply_balance=False)
+    return transaction
+
+
+def _refresh_member(member):
+    member.refresh_from_db(fields=["balance", "savings_balance"])
+    return member
+
+
+def apply_transaction(transaction):
+    """ Default balance effect of a new Transaction saved directly (admin, forms, scripts) """
+    member = transaction.member
+    amount = transaction.amount
+    description = transaction.description or transaction.get_transaction_type_display()
+
+    if transaction.transaction_type == "deposit":
+        journal.post(description, [(journal.account("wallet", member), amount), (journal.account("cash"), -amount)], transaction)
+
+    elif transaction.transaction_type == "withdrawal":
+        journal.post(description, [(journal.account("wallet", member), -amount), (journal.account("cash"), amount)], transaction)
+
+    elif transaction.transaction_type == "loan_repayment":
+        journal.post(description, [(journal.account("wallet", member), -amount), (journal.account("cash"), amount)], transaction)
+        # Find an ongoing loan to apply the repayment
+        loan = Loan.objects.filter(member=member, repayment_status="ongoing").first()
+        if loan is None:
+            raise ValueError("No ongoing loan found for repayment.")
+        LoanRepayment.objects.create(loan=loan, amount_paid=amount)
+
+    else:
+        # Transfers, share purchases and dividends are posted by their own services
+        return
+
+    _refresh_member(member)
+
+
+def fund_loan(loan, amount):
+    """ Change how much of an approved loan is available (approval, or a re-approval at a new amount) """
+    journal.post(
+        f"Loan ID {loan.id} funded",
+        [(journal.account("loan", loan=loan), amount), (journal.account("loan_fund"), -amount)],
+    )
+    loan.refresh_from_db(fields=["remaining_balance"])
+    return loan
+
+
+def apply_loan_repayment(loan, amount):
+    """ Reduce a loan's remaining balance, closing it when it reaches zero """
+    try:
+        journal.post(
+            f"Repayment on Loan ID {loan.id}",
+            [(journal.account("loan", loan=loan), -amount), (journal.account("loan_fund"), amount)],
+        )
+    except InsufficientFunds:
+        raise ValueError("Payment exceeds remaining balance.")
+
+    Loan.objects.filter(pk=loan.pk, remaining_balance=0).update(repayment_status="completed", status="approved")
+    loan.refresh_from_db(fields=["remaining_balance", "repayment_status", "status"])
+    return loan
+
+
+def apply_loan_withdrawal(loan, amount, transaction=None):
+    """ Draw approved loan funds into the member's wallet """
+    try:
+        with db_transaction.atomic():
+            journal.post(
+                f"Loan withdrawal from Loan ID {loan.id}",
+                [(journal.account("loan", loan=loan), -amount), (journal.account("wallet", loan.member), amount)],
+                transaction,
+            )
+            Loan.objects.filter(pk=loan.pk).update(total_withdrawn=F("total_withdrawn") + amount)
+    except InsufficientFunds:
+        raise ValueError("Withdrawal amount exceeds remaining loan balance")
+
+    loan.refresh_from_db(fields=["remaining_balance", "total_withdrawn"])
+    _refresh_member(loan.member)
+    return loan
+
+
+@db_transaction.atomic
+def approve_loan(loan, amount, reviewer):
+    """ Approve a loan at `amount`, funding (or re-funding) its remaining balance through the journal """
+    loan = Loan.objects.select_for_update().get(pk=loan.pk)
+    Loan.objects.filter(pk=loan.pk).update(amount=amount, status="approved", reviewed_by=reviewer)
+    change = Decimal(amount) - loan.remaining_balance
+    if change:
+        fund_loan(loan, change)
+    loan.refresh_from_db()
+    return loan
+
+
+def _decision_amount(value):
+    """ A positive amount in whole cents, or None """
+    try:
+        amount = Decimal(str(value))
+    except (InvalidOperation, ValueError):
+        return None
+    return amount if amount.is_finite() and amount > 0 and amount == amount.quantize(Decimal("0.01")) else None
+
+
+@db_transaction.atomic
+def decide_loans(decisions, reviewer, chunk_size=DECISION_CHUNK_SIZE):
+    """ Apply many approve/reject decisions at once; returns one outcome dict per decision, in order.
+
+    `decisions` is a list of (loan id, action, amount); the amount is only read for
+    approvals. Only pending applications are decided: re-approving a loan would fund
+    money already withdrawn a second time, and rejecting a funded one would strand its
+    balance, so those stay with process_loan. Like approve_loan, an approval sets the
+    amount and funds the remaining balance to it. Every approval is written by one
+    prepared UPDATE and funded by one journal (journal.post_many); rejections are one
+    UPDATE per chunk. A decision that cannot apply (unknown or already decided loan,
+    bad action or amount, a loan decided earlier in the batch) is reported and
+    skipped; the rest commit together.
+    """
+    outcomes = [{"loan": loan_id, "action": action, "status": "skipped"} for loan_id, action, _ in decisions]
+    loan_ids = list({loan_id for loan_id, _, _ in decisions if isinstance(loan_id, int)})
+    loans = {}
+    for start in range(0, len(loan_ids), chunk_size):
+        loans.update(
+            (loan_id, (member_id, remaining, status))
+            for loan_id, member_id, remaining, status in Loan.objects.select_for_update()
+            .filter(id__in=loan_ids[start:start + chunk_size])
+            .values_list("id", "member_id", "remaining_balance", "status")
+        )
+
+    approvals, rejections, seen = [], [], set()
+    for outcome, (loan_id, action, amount) in zip(outcomes, decisions):
+        if loan_id not in loans:
+            outcome["message"] = "Loan not found."
+        elif loan_id in seen:
+            outcome["message"] = "Loan already decided in this batch."
+        elif loans[loan_id][2] != "pending":
+            outcome["message"] = "Loan already decided."
+        elif action == "approve":
+            amount = _decision_amount(amount)
+            if amount is None:
+                outcome["message"] = "Loan amount must be greater than zero."
+                continue
+            approvals.append((loan_id, amount))
+            outcome.update(status="approved", amount=str(amount))
+            seen.add(loan_id)
+        elif action == "reject":
+            rejections.append(loan_id)
+            outcome["status"] = "rejected"
+            seen.add(loan_id)
+        else:
+            outcome["message"] = "Action must be approve or reject."
+
+    if approvals:
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                "UPDATE {table} SET {amount} = %s, {status} = %s, {reviewed_by} = %s WHERE {id} = %s AND {status} = %s".format(
+                    table=quote(Loan._meta.db_table),
+                    **{field: quote(Loan._meta.get_field(field).column) for field in ("amount", "status", "reviewed_by", "id")},
+                ),
+                [(amount, "approved", reviewer.pk, loan_id, "pending") for loan_id, amount in approvals],
+            )
+        # Never debits below zero: each loan ends at its (positive) approved amount
+        changes = [("loan", loan_id, amount - loans[loan_id][1]) for loan_id, amount in approvals if amount != loans[loan_id][1]]
+        if changes:
+            journal.post_many(f"{len(changes)} loans funded in bulk", changes, counter_kind="loan_fund")
+    for start in range(0, len(rejections), chunk_size):
+        Loan.objects.filter(id__in=rejections[start:start + chunk_size], status="pending").update(status="rejected", reviewed_by=reviewer)
+
+    # Queryset updates send no post_save, so the caches that listen for it are dropped here
+    summary.invalidate("loans")
+    dashboard_cache.bump(*(loans[loan_id][0] for loan_id in seen))
+    trace("loan.bulk_decision", reviewer_id=reviewer.pk, approved=len(approvals), rejected=len(rejections), skipped=len(decisions) - len(seen))
+    return outcomes
+
+
+@db_transaction.atomic
+def deposit(member, amount, description="User deposit"):
+    transaction = record(member, amount, "deposit", description)
+    journal.post(description, [(journal.account("wallet", member), amount), (journal.account("cash"), -amount)], transaction)
+    _refresh_member(member)
+    return transaction
+
+
+@db_transaction.atomic
+def transfer(member, from_account, to_account, amount):
+    """ Move money between a member's wallet and savings """
+    if from_account == to_account or {from_account, to_account} != set(ACCOUNT_LABELS):
+        raise ValueError("Cannot transfer between the same account.")
+
+    description = f"Transferred from {ACCOUNT_LABELS[from_account]} to {ACCOUNT_LABELS[to_account]}"
+    transaction = record(member, amount, "transfer", description)
+    journal.post(
+        description,
+        [(journal.account(from_account, member), -amount), (journal.account(to_account, member), amount)],
+        transaction,
+    )
+    _refresh_member(member)
+    return transaction
+
+
+@db_transaction.atomic
+def repay_loan(member, loan, amount, account="wallet"):
+    """ Pay a loan down from the member's wallet or savings """
+    description = f"Repayment of Loan ID {loan.id} from {ACCOUNT_LABELS[account]}"
+    transaction = record(member, amount, "loan_repayment", description)
+    journal.post(description, [(journal.account(account, member), -amount), (journal.account("cash"), amount)], transaction)
+    LoanRepayment.objects.create(loan=loan, amount_paid=amount)
+    _refresh_member(member)
+    return transaction
+
+
+@db_transaction.atomic
+def withdraw_loan(loan, amount):
+    """ Move approved loan funds into the member's wallet """
+    transaction = record(loan.member, amount, "withdrawal", f"Loan withdrawal from Loan ID {loan.id}")
+    apply_loan_withdrawal(loan, amount, transaction)
+    return transaction
+
+
+def add_shares(share, amount, price_per_share, transaction=None, paid_from="wallet"):
+    """ Credit a holding with the shares `amount` buys; returns the number of shares.
+
+    paid_from="wallet" debits the member's wallet; "cash" records money paid in from outside.
+    """
+    num_shares = Decimal(amount) / Decimal(price_per_share)
+    source = journal.account("wallet", share.member) if paid_from == "wallet" else journal.account("cash")
+    with db_transaction.atomic():
+        journal.post(
+            f"Purchased {num_shares} shares",
+            [(source, -amount), (journal.account("share_capital", share.member), amount)],
+            transaction,
+        )
+        Share.objects.filter(pk=share.pk).update(shares_owned=F("shares_owned") + num_shares)
+    share.refresh_from_db(fields=["shares_owned", "total_investment"])
+    _refresh_member(share.member)
+    return num_shares
+
+
+@db_transaction.atomic
+def buy_shares(member, share, amount, price_per_share):
+    """ Pay for shares out of the wallet """
+    num_shares = Decimal(amount) / Decimal(price_per_share)
+    transaction = record(member, amount, "share_purchase", f"Purchased {num_shares} shares")
+    share.member = member
+    add_shares(share, amount, price_per_share, transaction)
+    return transaction
+
+
+@db_transaction.atomic
+def transfer_shares(share, recipient, num_shares):
+    """ Move shares between holders with their share capital; returns False if the sender holds too few.
+
+    The capital that goes with the shares is the sender's investment per share (all of
+    it when every share goes), journaled from the sender's share_capital account to the
+    recipient's, so share_capital still reconciles with both holdings.
+    """
+    num_shares = Decimal(num_shares)
+    if num_shares <= 0 or share.pk == recipient.pk:
+        return False
+    holding = Share.objects.select_for_update().filter(pk=share.pk).values("shares_owned", "total_investment").first()
+    if holding is None or holding["shares_owned"] < num_shares:
+        return False
+
+    if num_shares == holding["shares_owned"]:
+        capital = holding["total_investment"]
+    else:
+        capital = (holding["total_investment"] * num_shares / holding["shares_owned"]).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+    Share.objects.filter(pk=share.pk).update(shares_owned=F("shares_owned") - num_shares)
+    Share.objects.filter(pk=recipient.pk).update(shares_owned=F("shares_owned") + num_shares)
+    if capital:
+        journal.post(
+            f"Transferred {num_shares} shares",
+            [(journal.account("share_capital", share.member), -capital), (journal.account("share_capital", recipient.member), capital)],
+        )
+    share.refresh_from_db(fields=["shares_owned", "total_investment"])
+    recipient.refresh_from_db(fields=["shares_owned", "total_investment"])
+    return True
@@ -0,0 +1,69 @@
+import csv
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import Transaction
+
+REPORT_HEADER = ['Member', 'Amount', 'Type', 'Date']
+REPORT_CHUNK_SIZE = 2000
+
+
+class Echo:
+    """ Pseudo-buffer for csv.writer: hands each formatted row straight back """
+
+    def write(self, value):
+        return value
+
+
+def day_start(day):
+    """ Timezone-aware midnight for a date, so range filters can use the created_at index """
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def report_queryset(start_date=None, end_date=None, member=None, transaction_type=None):
+    """ Build the filtered ledger query for the CSV export (dates are inclusive) """
+    transactions = Transaction.objects.all()
+
+    if start_date:
+        transactions = transactions.filter(created_at__gte=day_start(start_date))
+    if end_date:
+        transactions = transactions.filter(created_at__lt=day_start(end_date + timedelta(days=1)))
+    if member:
+        transactions = transactions.filter(member__user__username=member)
+    if transaction_type:
+        transactions = transactions.filter(transaction_type=transaction_type)
+
+    # Usernames come from the join, so there is no extra query per row
+    return transactions.order_by('created_at', 'id').values_list(
+        'member__user__username', 'amount', 'transaction_type', 'created_at'
+    )
+
+
+def _parse_day(value):
+    """ Parse a YYYY-MM-DD filter value, returning None when it is missing or invalid """
+    try:
+        return parse_date(value or '')
+    except ValueError:
+        return None
+
+
+def report_filters(params):
+    """ Read the export filters from a GET QueryDict; bad dates are ignored """
+    return {
+        'start_date': _parse_day(params.get('start_date')),
+        'end_date': _parse_day(params.get('end_date')),
+        'member': params.get('member') or None,
+        'transaction_type': params.get('transaction_type') or None,
+    }
+
+
+def iter_report_rows(rows, chunk_size=REPORT_CHUNK_SIZE):
+    """ Yield CSV lines one at a time while the database is read in chunks (rows: a queryset or any iterable) """
+    writer = csv.writer(Echo())
+    yield writer.writerow(REPORT_HEADER)
+    if hasattr(rows, 'iterator'):
+        rows = rows.iterator(chunk_size=chunk_size)
+    for row in rows:
+        yield writer.writerow(row)
@@ -0,0 +1,89 @@
+import re
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+from .models import Transaction
+
+FTS_TABLE = "sacco_transaction_fts"
+TOKEN = re.compile(r"\w+", re.UNICODE)
+
+RANKED_BATCH_SIZE = 500
+
+_index_available = None
+
+
+def search_index_available():
+    """ True when the FTS5 shadow table from migration 0015 exists on this database """
+    global _index_available
+    if _index_available is None:
+        _index_available = connection.vendor == "sqlite" and FTS_TABLE in connection.introspection.table_names()
+    return _index_available
+
+
+def fts_query(text):
+    """ Turn free text into a safe FTS5 query: every word must match, as a prefix.
+
+    User input is never passed through as FTS syntax, so quotes, operators and
+    column filters in the search box cannot raise errors.
+    """
+    return " ".join(f'"{word}"*' for word in TOKEN.findall(text))
+
+
+def text_matches(text, description):
+    """ The fts_query() rule applied in Python (every word a prefix of some word), for rows outside the index """
+    words = [word.casefold() for word in TOKEN.findall(description or "")]
+    return all(any(word.startswith(term.casefold()) for word in words) for term in TOKEN.findall(text))
+
+
+def search_transactions(text, queryset=None):
+    """ Filter a Transaction queryset to rows whose description matches `text`.
+
+    The queryset can already carry other filters (e.g. transaction_type) and keeps
+    its own ordering, so it pages with KeysetPaginator as usual. The match subquery
+    has no LIMIT of its own: a cap taken before those filters would drop matching
+    rows that sit behind newer matches of other types or members. Falls back to
+    icontains where the search index is not available.
+    """
+    if queryset is None:
+        queryset = Transaction.objects.all()
+
+    if not search_index_available():
+        return queryset.filter(description__icontains=text)
+
+    query = fts_query(text)
+    if not query:
+        return queryset.none()
+
+    return queryset.filter(id__in=RawSQL(
+        f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s",
+        [query],
+    ))
+
+
+def ranked_search(text, queryset=None, limit=20):
+    """ Return up to `limit` transactions from `queryset`, best match first (FTS5 bm25).
+
+    Matches stream out of the index in rank order and are checked against the
+    queryset's filters a batch at a time, so only the rows needed are fetched.
+    """
+    if queryset is None:
+        queryset = Transaction.objects.all()
+
+    if not search_index_available():
+        return list(queryset.filter(description__icontains=text).order_by("-created_at")[:limit])
+
+    query = fts_query(text)
+    if not query:
+        return []
+
+    results = []
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s ORDER BY rank", [query])
+        while len(results) < limit:
+            ids = [row[0] for row in cursor.fetchmany(RANKED_BATCH_SIZE)]
+            if not ids:
+                break
+            found = queryset.in_bulk(ids)
+            results.extend(found[pk] for pk in ids if pk in found)
+    return results[:limit]
@@ -0,0 +1,71 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import dashboard_cache, portfolio, summary
+from .journal import projections_changed
+from .models import Loan, LoanRepayment, Member, Transaction
+
+
+# ✅ Admin summary cache: drop the KPI groups a change affects
+@receiver([post_save, post_delete], sender=Member)
+def member_changed(sender, **kwargs):
+    summary.invalidate("members")
+
+
+@receiver([post_save, post_delete], sender=Loan)
+def loan_changed(sender, **kwargs):
+    summary.invalidate("loans")
+    portfolio.invalidate()
+
+
+@receiver(post_save, sender=Transaction)
+def transaction_saved(sender, created=False, **kwargs):
+    if created:
+        summary.invalidate("recent")
+
+
+@receiver(post_delete, sender=Transaction)
+def transaction_deleted(sender, **kwargs):
+    summary.invalidate("recent")
+
+
+@receiver(projections_changed)
+def balances_changed(sender, kinds, **kwargs):
+    # Savings feed total_savings; loan postings come with approvals and status changes
+    if "savings" in kinds:
+        summary.invalidate("members")
+    if "loan" in kinds:
+        summary.invalidate("loans")
+        portfolio.invalidate()
+
+
+# ✅ Member dashboards: move every member a change touches to a new cache version
+@receiver([post_save, post_delete], sender=Member)
+def member_dashboard_changed(sender, instance, **kwargs):
+    dashboard_cache.bump(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Loan)
+@receiver([post_save, post_delete], sender=Transaction)
+def member_row_changed(sender, instance, **kwargs):
+    dashboard_cache.bump(instance.member_id)
+
+
+@receiver(post_save, sender=LoanRepayment)
+def repayment_saved(sender, instance, **kwargs):
+    dashboard_cache.bump(instance.loan.member_id)
+
+
+@receiver(post_delete, sender=LoanRepayment)
+def repayment_deleted(sender, instance, **kwargs):
+    # The loan may already be gone in a cascade, which bumps the member itself
+    dashboard_cache.bump(Loan.objects.filter(pk=instance.loan_id).values_list("member_id", flat=True).first())
+
+
+@receiver(projections_changed)
+def member_balances_changed(sender, owners=None, **kwargs):
+    owners = owners or {}
+    member_ids = set().union(*(ids for kind, ids in owners.items() if kind != "loan"))
+    if owners.get("loan"):
+        member_ids.update(Loan.objects.filter(id__in=owners["loan"]).values_list("member_id", flat=True))
+    dashboard_cache.bump(*member_ids)
@@ -0,0 +1,245 @@
+"""
+Member statements: opening balance, every entry with its running balance, and
+the closing balance of a wallet or savings account over any period.
+
+Statements are read from the journal (see sacco.journal). The opening balance
+starts from the latest month-end BalanceSnapshot before the period, so only the
+entries since that month end are summed, never the account's whole history.
+take_snapshots() writes those snapshots for a range of accounts at a month end;
+the balance_snapshots and member_statements batch jobs (see sacco.batch) run it,
+and the statement files, across all members in parallel.
+
+Output is streamed: iter_csv() and iter_pdf() yield the statement a piece at a
+time while the entries are read in chunks.
+"""
+import calendar
+import csv
+import os
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import Max, Sum
+from django.utils import timezone
+
+from .models import BalanceSnapshot, JournalEntry, LedgerAccount
+from .reports import Echo, day_start
+
+STATEMENT_ACCOUNTS = {"wallet": "Wallet", "savings": "Savings"}
+STATEMENT_CHUNK_SIZE = 2000
+CSV_HEADER = ["Date", "Description", "Amount", "Balance"]
+CENT = Decimal("0.01")
+
+
+def month_end(day):
+    """ Last day of the month `day` falls in """
+    return day.replace(day=calendar.monthrange(day.year, day.month)[1])
+
+
+def previous_month_end(day):
+    return day.replace(day=1) - timedelta(days=1)
+
+
+def _entries(account_ids, after_day=None, through_day=None):
+    """ Entries of the accounts dated after the end of `after_day` and up to the end of `through_day` """
+    entries = JournalEntry.objects.filter(account_id__in=account_ids)
+    if after_day is not None:
+        entries = entries.filter(journal__created_at__gte=day_start(after_day + timedelta(days=1)))
+    if through_day is not None:
+        entries = entries.filter(journal__created_at__lt=day_start(through_day + timedelta(days=1)))
+    return entries
+
+
+def opening_balances(account_ids, day):
+    """ Map account id -> balance at the start of `day`, for many accounts with one grouped sum.
+
+    Balances start from the accounts' latest snapshot before `day`, so only the
+    entries since are summed. An account without that snapshot (new, or never
+    snapshotted) is summed from its first entry.
+    """
+    account_ids = list(account_ids)
+    latest = BalanceSnapshot.objects.filter(account_id__in=account_ids, day__lt=day).aggregate(latest=Max("day"))["latest"]
+    snapshots = dict(
+        BalanceSnapshot.objects.filter(account_id__in=account_ids, day=latest).values_list("account_id", "balance")
+    ) if latest else {}
+    balances = {account_id: snapshots.get(account_id, Decimal(0)) for account_id in account_ids}
+
+    for ids, after_day in ((list(snapshots), latest), ([i for i in account_ids if i not in snapshots], None)):
+        if ids:
+            moved = _entries(ids, after_day, day - timedelta(days=1)).values_list("account_id").annotate(total=Sum("amount")).order_by()
+            for account_id, total in moved:
+                balances[account_id] += total
+    return {account_id: balance.quantize(CENT) for account_id, balance in balances.items()}
+
+
+def balance_before(account_id, day):
+    """ Balance of one account at the start of `day` """
+    return opening_balances([account_id], day)[account_id]
+
+
+def take_snapshots(day, account_ids):
+    """ Write the `day` (a month end) snapshot of every given account; returns how many were written """
+    if day >= timezone.localdate():
+        # Snapshots are never rewritten, so one taken early would drop the rest of the day's entries
+        raise ValueError(f"Cannot snapshot {day} before it has ended.")
+    balances = opening_balances(account_ids, day + timedelta(days=1))
+    # A re-run of the same month leaves existing snapshots as they are
+    BalanceSnapshot.objects.bulk_create(
+        [BalanceSnapshot(account_id=account_id, day=day, balance=balance) for account_id, balance in balances.items()],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+    return len(balances)
+
+
+class Statement:
+    """ One account's statement for start..end (inclusive days); `closing` is set once lines() is consumed.
+
+    `preloaded` is (account id, opening balance, entry rows) when member_statements()
+    has already read them for many members at once.
+    """
+
+    def __init__(self, member, kind, start, end, preloaded=None):
+        self.member = member
+        self.kind = kind
+        self.start = start
+        self.end = end
+        self.closing = None
+        if preloaded is not None:
+            self.account_id, self.opening, self.rows = preloaded
+            return
+        self.account_id = LedgerAccount.objects.filter(kind=kind, member=member).values_list("id", flat=True).first()
+        self.opening = balance_before(self.account_id, start) if self.account_id else Decimal("0.00")
+        self.rows = None
+
+    @property
+    def title(self):
+        return f"{STATEMENT_ACCOUNTS[self.kind]} statement for {self.member.user.username}, {self.start:%d %b %Y} to {self.end:%d %b %Y}"
+
+    def lines(self, chunk_size=STATEMENT_CHUNK_SIZE):
+        """ Yield (created_at, description, amount, running balance), oldest first """
+        balance = self.opening
+        rows = self.rows
+        if rows is None and self.account_id:
+            rows = (
+                _entries([self.account_id], self.start - timedelta(days=1), self.end)
+                .order_by("journal__created_at", "id")
+                .values_list("journal__created_at", "journal__description", "amount")
+                .iterator(chunk_size=chunk_size)
+            )
+        for created_at, description, amount in rows or []:
+            balance += amount
+            yield created_at, description, amount, balance
+        self.closing = balance
+
+
+def member_statements(members, start, end):
+    """ Yield the wallet and savings Statement of every member, reading each kind's data in three queries """
+    members = list(members)
+    for kind in STATEMENT_ACCOUNTS:
+        accounts = dict(LedgerAccount.objects.filter(kind=kind, member__in=members).values_list("member_id", "id"))
+        openings = opening_balances(accounts.values(), start)
+        rows = defaultdict(list)
+        entries = (
+            _entries(accounts.values(), start - timedelta(days=1), end)
+            .order_by("account_id", "journal__created_at", "id")
+            .values_list("account_id", "journal__created_at", "journal__description", "amount")
+        )
+        for account_id, *row in entries.iterator(chunk_size=STATEMENT_CHUNK_SIZE):
+            rows[account_id].append(row)
+        for member in members:
+            account_id = accounts.get(member.id)
+            yield Statement(member, kind, start, end, preloaded=(account_id, openings.get(account_id, Decimal("0.00")), rows[account_id]))
+
+
+def iter_csv(statement):
+    """ Yield the statement as CSV lines """
+    writer = csv.writer(Echo())
+    yield writer.writerow([statement.title])
+    yield writer.writerow(CSV_HEADER)
+    yield writer.writerow([statement.start.isoformat(), "Opening balance", "", statement.opening])
+    for created_at, description, amount, balance in statement.lines():
+        yield writer.writerow([timezone.localtime(created_at).isoformat(), description, amount, balance])
+    yield writer.writerow([statement.end.isoformat(), "Closing balance", "", statement.closing])
+
+
+class PdfStream:
+    """ Minimal text-only PDF (Courier, A4) written a page at a time, so it can be streamed.
+
+    Objects 1-3 (catalog, page tree, font) are reserved up front; the page tree is
+    written last, once every page is known, followed by the cross-reference table.
+    """
+    LINES_PER_PAGE = 60
+
+    def __init__(self):
+        self.offset = 0
+        self.offsets = {}
+        self.pages = []
+        self.next_number = 4
+
+    def _emit(self, data):
+        self.offset += len(data)
+        return data
+
+    def _object(self, number, body):
+        self.offsets[number] = self.offset
+        return self._emit(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+
+    def start(self):
+        return self._emit(b"%PDF-1.4\n") + self._object(3, b"<< /Type /Font /Subtype /Type1 /BaseFont /Courier >>")
+
+    def page(self, lines):
+        text = b"".join(b"(" + _pdf_text(line) + b") '\n" for line in lines)
+        content = b"BT /F1 9 Tf 11 TL 40 810 Td\n" + text + b"ET"
+        content_number, page_number = self.next_number, self.next_number + 1
+        self.next_number += 2
+        self.pages.append(page_number)
+        return self._object(content_number, b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream") + self._object(
+            page_number,
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>"
+            % content_number,
+        )
+
+    def finish(self):
+        kids = b" ".join(b"%d 0 R" % number for number in self.pages)
+        data = self._object(2, b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % len(self.pages))
+        data += self._object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        xref_offset = self.offset
+        data += b"xref\n0 %d\n0000000000 65535 f \n" % self.next_number
+        data += b"".join(b"%010d 00000 n \n" % self.offsets[number] for number in range(1, self.next_number))
+        data += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (self.next_number, xref_offset)
+        return data
+
+
+def _pdf_text(line):
+    return line.encode("latin-1", "replace").replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+
+
+def iter_pdf(statement):
+    """ Yield the statement as PDF bytes, one page per LINES_PER_PAGE lines """
+    pdf = PdfStream()
+    yield pdf.start()
+    lines = [statement.title, "", f"{'Date':<20}{'Amount':>14}{'Balance':>16}   Description",
+             f"{statement.start.isoformat():<20}{'':>14}{statement.opening:>16}   Opening balance"]
+    for created_at, description, amount, balance in statement.lines():
+        lines.append(f"{timezone.localtime(created_at):%Y-%m-%d %H:%M}{'':<4}{amount:>14}{balance:>16}   {description}")
+        if len(lines) == PdfStream.LINES_PER_PAGE:
+            yield pdf.page(lines)
+            lines = []
+    lines.append(f"{statement.end.isoformat():<20}{'':>14}{statement.closing:>16}   Closing balance")
+    yield pdf.page(lines)
+    yield pdf.finish()
+
+
+FORMATS = {"csv": (iter_csv, "text/csv"), "pdf": (iter_pdf, "application/pdf")}
+
+
+def write_statement(statement, directory, format="csv"):
+    """ Write a statement to `directory`, named after the member, account and period; returns the path """
+    path = os.path.join(
+        directory, f"{statement.member.user.username}-{statement.kind}-{statement.start:%Y%m%d}-{statement.end:%Y%m%d}.{format}"
+    )
+    with open(path, "wb") as file:
+        for chunk in FORMATS[format][0](statement):
+            file.write(chunk.encode() if isinstance(chunk, str) else chunk)
+    return path
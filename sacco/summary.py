@@ -0,0 +1,68 @@
+"""
+Cached SACCO-wide KPIs for the admin loan approval page.
+
+Figures are cached in groups and each group is dropped (after commit) by the
+signals in sacco.signals when something it depends on changes, so the page
+reads them from cache instead of aggregating the member and loan tables.
+
+The cache is the alias named by settings.SACCO_SUMMARY_CACHE: local memory by
+default, or a file/database cache from CACHES when several workers must share it.
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import models, transaction as db_transaction
+
+from .models import Loan, Member, Transaction
+
+KEY_PREFIX = "sacco:summary"
+TIMEOUT = 60 * 60  # Signals keep groups fresh; the timeout only bounds anything they missed
+RECENT_TRANSACTIONS = 10
+
+
+def _cache():
+    return caches[getattr(settings, "SACCO_SUMMARY_CACHE", "default")]
+
+
+def _members():
+    totals = Member.objects.aggregate(total_members=models.Count("id"), total_savings=models.Sum("savings_balance"))
+    return {"total_members": totals["total_members"], "total_savings": totals["total_savings"] or Decimal(0)}
+
+
+def _loans():
+    return Loan.objects.aggregate(
+        active_loans=models.Count("id", filter=models.Q(status="approved")),
+        pending_loans_count=models.Count("id", filter=models.Q(status="pending")),
+    )
+
+
+def _recent():
+    return {"transactions": list(Transaction.objects.select_related("member__user").order_by("-created_at")[:RECENT_TRANSACTIONS])}
+
+
+GROUPS = {"members": _members, "loans": _loans, "recent": _recent}
+
+
+def get_summary():
+    """ Every KPI group as one dict, computing only the groups missing from the cache """
+    cache = _cache()
+    keys = {group: f"{KEY_PREFIX}:{group}" for group in GROUPS}
+    cached = cache.get_many(keys.values())
+
+    summary, missing = {}, {}
+    for group, key in keys.items():
+        if key in cached:
+            summary.update(cached[key])
+        else:
+            missing[key] = GROUPS[group]()
+            summary.update(missing[key])
+    if missing:
+        cache.set_many(missing, TIMEOUT)
+    return summary
+
+
+def invalidate(*groups):
+    """ Drop KPI groups once the current transaction commits (immediately outside one) """
+    keys = [f"{KEY_PREFIX}:{group}" for group in (groups or GROUPS)]
+    db_transaction.on_commit(lambda: _cache().delete_many(keys))
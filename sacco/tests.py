@@ -1,3 +1,1354 @@
-from django.test import TestCase
+import base64
+import csv
+import io
+import json
+import logging
+import re
+import tempfile
+import threading
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.core.cache import cache, caches
+from django.db import connection, transaction as db_transaction
+from django.db.models import Sum
+from django.http import StreamingHttpResponse
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import amortization, archive, batch, benchmark, checkoff, dashboard_cache, dataset, dividends, instrumentation, journal, onboarding, portfolio, posting, statements, tracing
+from .models import ArchiveSegment, BalanceDrift, BalanceSnapshot, BatchRun, CheckoffFile, DailyFlow, InterestAccrual, Journal, LedgerAccount, Loan, LoanRepayment, Member, Share, Transaction
+from .pagination import KeysetPaginator
+from .search import ranked_search, search_transactions
+
+
+# Tables that grow with the ledger; a full scan of any of these is a regression
+LEDGER_TABLES = {"sacco_transaction", "sacco_loan", "sacco_loanrepayment", "sacco_dailyflow"}
+FULL_SCAN = re.compile(r"^SCAN (\w+)$")
+
+
+class QueryPlanTests(TestCase):
+    """ Every ledger query issued by the views must be served by an index """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser("admin", "admin@example.com", "pass")
+        cls.user = User.objects.create_user("alice", "alice@example.com", "pass")
+        cls.member = Member.objects.create(user=cls.user, phone="0700000000", balance=Decimal("500"))
+        Member.objects.create(user=cls.admin, phone="0700000001")
+        Loan.objects.create(member=cls.member, amount=Decimal("1000"), interest_rate=Decimal("1"), duration_months=12, status="approved")
+        Loan.objects.create(member=cls.member, amount=Decimal("200"), interest_rate=Decimal("1"), duration_months=6)
+        for _ in range(3):
+            Transaction.objects.create(member=cls.member, amount=Decimal("10"), transaction_type="deposit", description="Salary")
+            Transaction.objects.create(member=cls.member, amount=Decimal("5"), transaction_type="transfer", description="To savings")
+
+    def ledger_plans(self, queries):
+        """ Yield (sql, plan rows) for each captured query that touches a ledger table """
+        with connection.cursor() as cursor:
+            for query in queries:
+                sql = query["sql"]
+                if not sql.startswith("SELECT") or not any(table in sql for table in LEDGER_TABLES):
+                    continue
+                cursor.execute("EXPLAIN QUERY PLAN " + sql)
+                yield sql, [row[-1] for row in cursor.fetchall()]
+
+    def assertNoFullScans(self, queries):
+        checked = 0
+        for sql, plan in self.ledger_plans(queries):
+            checked += 1
+            for detail in plan:
+                match = FULL_SCAN.match(detail)
+                if match and match.group(1) in LEDGER_TABLES:
+                    self.fail(f"Full table scan ({detail}) for query:\n{sql}\nPlan: {plan}")
+        self.assertGreater(checked, 0, "No ledger queries were captured")
+
+    def get(self, user, url, data=None, evaluate=()):
+        """ Render a view and return its queries; `evaluate` forces context querysets the template skips """
+        cache.clear()  # so cached summaries are recomputed and their queries checked too
+        caches["dashboard"].clear()
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url, data)
+            if response.streaming:
+                b"".join(response.streaming_content)
+            for name in evaluate:
+                list(response.context[name])
+        self.assertEqual(response.status_code, 200)
+        return captured.captured_queries
+
+    def test_dashboard(self):
+        self.assertNoFullScans(self.get(self.user, reverse("dashboard"), evaluate=["transactions", "transfers"]))
+
+    def test_transfer_funds(self):
+        self.assertNoFullScans(self.get(self.user, reverse("transfer_funds"), evaluate=["transfers"]))
+
+    def test_repay_loan(self):
+        self.assertNoFullScans(self.get(self.user, reverse("repay_loan")))
+
+    def test_loan_approval(self):
+        self.assertNoFullScans(self.get(self.admin, reverse("loan_approval")))
+
+    def test_transaction_history(self):
+        self.assertNoFullScans(self.get(self.user, reverse("transaction_history")))
+
+    def test_transaction_history_type_filter(self):
+        self.assertNoFullScans(self.get(self.user, reverse("transaction_history"), {"transaction_type": "deposit"}))
+
+    def test_generate_report_date_range(self):
+        self.assertNoFullScans(self.get(self.admin, reverse("generate_report"), {"start_date": "2025-01-01", "end_date": "2025-01-31"}))
+
+    def test_generate_report_by_member_and_type(self):
+        self.assertNoFullScans(self.get(self.admin, reverse("generate_report"), {"member": "alice", "transaction_type": "deposit"}))
+
+
+class KeysetPaginatorTests(TestCase):
+    """ Cursors walk every row once in both directions, ties included, and bad cursors fall back to page 1 """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.member = Member.objects.create(user=User.objects.create(username="kira"), phone="0700000015")
+        Transaction.objects.bulk_create([Transaction(member=cls.member, amount=Decimal(index + 1)) for index in range(7)])
+        # Rows 2-5 share one created_at, so only the id orders them
+        moments = [datetime(2025, 1, 1, 9), *[datetime(2025, 1, 2, 9)] * 4, datetime(2025, 1, 3, 9), datetime(2025, 1, 4, 9)]
+        for transaction, moment in zip(Transaction.objects.order_by("id"), moments):
+            Transaction.objects.filter(pk=transaction.pk).update(created_at=timezone.make_aware(moment))
+        cls.newest_first = list(Transaction.objects.order_by("-created_at", "-id").values_list("id", flat=True))
+
+    def paginator(self, per_page=3, count_limit=None):
+        return KeysetPaginator(Transaction.objects.filter(member=self.member), per_page, count_limit)
+
+    def ids(self, page):
+        return [transaction.pk for transaction in page]
+
+    def test_next_cursors_walk_every_row_once(self):
+        paginator = self.paginator()
+        page = paginator.get_page()
+        self.assertFalse(page.has_previous)
+        seen = self.ids(page)
+        while page.has_next:
+            page = paginator.get_page(page.next_cursor)
+            self.assertTrue(page.has_previous)
+            seen += self.ids(page)
+        self.assertEqual(seen, self.newest_first)
+        self.assertEqual(self.ids(page), self.newest_first[6:])  # the last page is short and ends the walk
+
+    def test_previous_cursor_returns_the_page_before(self):
+        paginator = self.paginator()
+        first = paginator.get_page()
+        second = paginator.get_page(first.next_cursor)
+        third = paginator.get_page(second.next_cursor)
+        self.assertEqual(self.ids(paginator.get_page(third.previous_cursor)), self.ids(second))
+        back = paginator.get_page(second.previous_cursor)
+        self.assertEqual(self.ids(back), self.ids(first))
+        self.assertFalse(back.has_previous)
+        self.assertTrue(back.has_next)
+
+    def test_ties_on_created_at_split_by_id(self):
+        paginator = self.paginator(per_page=2)
+        first = paginator.get_page()
+        second = paginator.get_page(first.next_cursor)
+        third = paginator.get_page(second.next_cursor)
+        # The cursor of the second page sits inside the tied rows; neither side skips or repeats one
+        self.assertEqual(self.ids(second) + self.ids(third), self.newest_first[2:6])
+        self.assertEqual(self.ids(paginator.get_page(third.previous_cursor)), self.ids(second))
+
+    def test_exact_last_page_has_no_next(self):
+        page = self.paginator(per_page=7).get_page()
+        self.assertEqual(self.ids(page), self.newest_first)
+        self.assertFalse(page.has_next)
+        self.assertFalse(page.has_previous)
+
+    def test_bad_cursors_give_the_first_page(self):
+        first = self.ids(self.paginator().get_page())
+        encode = KeysetPaginator.encode_cursor
+        last = Transaction.objects.get(pk=self.newest_first[-1])
+
+        def raw(payload):
+            return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+        cursors = [
+            "garbage!", "", raw("not json"), raw('["2025-01-01T09:00:00", 1]'), raw('["not a date", 1, "next"]'),
+            raw('["2025-01-01T09:00:00", "x", "next"]'), raw('["2025-01-01T09:00:00", 1, "sideways"]'), encode(last, "next")[:-3],
+        ]
+        for cursor in cursors:
+            self.assertIsNone(KeysetPaginator.decode_cursor(cursor), cursor)
+            self.assertEqual(self.ids(self.paginator().get_page(cursor)), first, cursor)
+
+    def test_approximate_total_is_capped(self):
+        page = self.paginator(count_limit=5).get_page()
+        self.assertEqual((page.approximate_total, page.total_is_capped), (5, True))
+        page = self.paginator(count_limit=10).get_page()
+        self.assertEqual((page.approximate_total, page.total_is_capped), (7, False))
+
+
+class QueryBudgetTests(TestCase):
+    """ Rendering a list must cost the same number of queries however many rows it shows """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser("henry", "henry@example.com", "pass")
+        cls.user = User.objects.create_user("iris", "iris@example.com", "pass")
+        cls.member = Member.objects.create(user=cls.user, phone="0700000008", balance=Decimal("1000"))
+        Member.objects.create(user=cls.admin, phone="0700000009")
+        cls.created = 0
+
+    def add_rows(self, count):
+        """ Give the member `count` more loans, repayments and transfers, and the SACCO `count` more borrowers """
+        for _ in range(count):
+            type(self).created += 1
+            user = User.objects.create(username=f"borrower{self.created}")
+            borrower = Member.objects.create(user=user, phone="0700000010")
+            Loan.objects.create(member=borrower, amount=Decimal("100"), interest_rate=Decimal("1"), duration_months=6)
+            Transaction.objects.create(member=borrower, amount=Decimal("5"), description="Deposit")
+
+            loan = Loan.objects.create(member=self.member, amount=Decimal("100"), interest_rate=Decimal("1"), duration_months=6, status="approved")
+            LoanRepayment.objects.create(loan=loan, amount_paid=Decimal("10"))
+            posting.transfer(self.member, "wallet", "savings", Decimal("1"))
+
+    def query_count(self, user, url):
+        self.client.force_login(user)
+        self.client.get(url)  # warm per-process caches (content types, sessions) first
+        cache.clear()
+        caches["dashboard"].clear()
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(captured)
+
+    def assertQueryBudgetIsFlat(self, user, url):
+        self.add_rows(3)
+        small = self.query_count(user, url)
+        self.add_rows(12)
+        self.assertEqual(self.query_count(user, url), small, f"Queries for {url} grow with the number of rows")
+
+    def test_dashboard(self):
+        self.assertQueryBudgetIsFlat(self.user, reverse("dashboard"))
+
+    def test_repay_loan(self):
+        self.assertQueryBudgetIsFlat(self.user, reverse("repay_loan"))
+
+    def test_transfer_funds(self):
+        self.assertQueryBudgetIsFlat(self.user, reverse("transfer_funds"))
+
+    def test_transaction_history(self):
+        self.assertQueryBudgetIsFlat(self.user, reverse("transaction_history"))
+
+    def test_loan_approval(self):
+        self.assertQueryBudgetIsFlat(self.admin, reverse("loan_approval"))
+
+    def test_admin_changelists(self):
+        for model in ("member", "loan", "transaction"):
+            with self.subTest(model=model):
+                self.assertQueryBudgetIsFlat(self.admin, reverse(f"admin:sacco_{model}_changelist"))
+
+    def test_admin_add_forms(self):
+        for model in ("loan", "transaction"):
+            with self.subTest(model=model):
+                self.assertQueryBudgetIsFlat(self.admin, reverse(f"admin:sacco_{model}_add"))
+
+
+class SearchIndexTests(TestCase):
+    """ The FTS5 index follows inserts, edits and deletes made through the ORM """
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user("bob", "bob@example.com", "pass")
+        cls.member = Member.objects.create(user=user, phone="0700000002", balance=Decimal("100"))
+
+    def test_matches_follow_writes(self):
+        transaction = Transaction.objects.create(member=self.member, amount=Decimal("5"), description="School fees term 1")
+        self.assertEqual(list(search_transactions("school")), [transaction])
+
+        transaction.description = "Rent"
+        transaction.save()
+        self.assertFalse(search_transactions("school").exists())
+        self.assertEqual(list(search_transactions("rent")), [transaction])
+
+        transaction.delete()
+        self.assertFalse(search_transactions("rent").exists())
+
+    def test_combines_with_type_filter(self):
+        Transaction.objects.create(member=self.member, amount=Decimal("5"), transaction_type="deposit", description="Salary March")
+        transfer = Transaction.objects.create(member=self.member, amount=Decimal("5"), transaction_type="transfer", description="Salary to savings")
+        transfers = Transaction.objects.filter(transaction_type="transfer")
+        self.assertEqual(list(search_transactions("sal", transfers)), [transfer])
+        self.assertEqual(ranked_search("salary savings", transfers), [transfer])
+
+    def test_older_matches_are_not_cut_off(self):
+        wanted = Transaction.objects.create(member=self.member, amount=Decimal("5"), transaction_type="transfer", description="Salary to savings")
+        Transaction.objects.bulk_create([
+            Transaction(member=self.member, amount=Decimal("5"), transaction_type="deposit", description="Salary") for _ in range(50)
+        ])
+        transfers = Transaction.objects.filter(transaction_type="transfer")
+        self.assertEqual(list(search_transactions("salary", transfers)), [wanted])
+        self.client.force_login(self.member.user)
+        response = self.client.get(reverse("transaction_history"), {"transaction_type": "transfer", "search": "salary"})
+        self.assertEqual(list(response.context["transactions"]), [wanted])
+
+    def test_search_syntax_is_escaped(self):
+        Transaction.objects.create(member=self.member, amount=Decimal("5"), description='Quoted "NEAR(" text')
+        self.assertEqual(search_transactions('" OR (').count(), 0)
+        self.assertEqual(search_transactions('near(').count(), 1)
+
+
+class JournalTests(TestCase):
+    """ Every posting is a balanced journal and the balance fields match their accounts """
+
+    def setUp(self):
+        user = User.objects.create_user("dave", "dave@example.com", "pass")
+        self.member = Member.objects.create(user=user, phone="0700000004")
+
+    def assertConsistent(self):
+        self.assertEqual(list(journal.unbalanced_journals()), [])
+        for kind in journal.PROJECTIONS:
+            self.assertEqual(list(journal.projection_drift(kind)), [], kind)
+
+    def test_postings_keep_projections_in_step(self):
+        posting.deposit(self.member, Decimal("1000"))
+        posting.transfer(self.member, "wallet", "savings", Decimal("300"))
+        loan = Loan.objects.create(member=self.member, amount=Decimal("500"), interest_rate=Decimal("1"), duration_months=6)
+        loan = posting.approve_loan(loan, Decimal("400"), None)
+        posting.withdraw_loan(loan, Decimal("100"))
+        posting.repay_loan(self.member, loan, Decimal("50"), "savings")
+        posting.buy_shares(self.member, Share.objects.create(member=self.member), Decimal("200"), Decimal("10"))
+        dividends.distribute_dividends(Decimal("90"))
+
+        self.member.refresh_from_db()
+        self.assertEqual(self.member.balance, Decimal("690"))
+        self.assertEqual(self.member.savings_balance, Decimal("250"))
+        self.assertConsistent()
+
+    def test_catch_up_applies_deferred_entries(self):
+        wallet, cash = journal.account("wallet", self.member), journal.account("cash")
+        journal.post("Bulk load", [(wallet, Decimal("75")), (cash, Decimal("-75"))], apply=False)
+        self.assertEqual(list(journal.projection_drift("wallet")), [])  # pending entries are not counted yet
+
+        self.assertEqual(journal.catch_up(), 2)
+        self.member.refresh_from_db()
+        self.assertEqual(self.member.balance, Decimal("75"))
+        self.assertConsistent()
+
+    def test_drift_is_reported(self):
+        posting.deposit(self.member, Decimal("10"))
+        Member.objects.filter(pk=self.member.pk).update(balance=Decimal("15"))
+        self.assertEqual(list(journal.projection_drift("wallet")), [(self.member.pk, Decimal("15"), Decimal("10"))])
+
+    def test_share_transfers_move_share_capital(self):
+        other = Member.objects.create(user=User.objects.create_user("dina", "dina@example.com", "pass"), phone="0700000016")
+        posting.deposit(self.member, Decimal("100"))
+        share, recipient = Share.objects.create(member=self.member), Share.objects.create(member=other)
+        posting.buy_shares(self.member, share, Decimal("100"), Decimal("3"))  # 33.33... shares
+
+        self.assertTrue(posting.transfer_shares(share, recipient, Decimal("10")))
+        self.assertEqual((share.total_investment, recipient.total_investment), (Decimal("70.00"), Decimal("30.00")))
+        self.assertFalse(posting.transfer_shares(share, recipient, Decimal("1000")))
+        self.assertFalse(posting.transfer_shares(share, recipient, Decimal("-5")))
+        self.assertTrue(posting.transfer_shares(share, recipient, share.shares_owned))
+        self.assertEqual((share.shares_owned, share.total_investment), (Decimal("0"), Decimal("0")))
+        self.assertEqual(recipient.total_investment, Decimal("100"))
+        self.assertConsistent()
+
+    def test_failed_guard_names_its_row(self):
+        other = Member.objects.create(user=User.objects.create_user("dora", "dora@example.com", "pass"), phone="0700000014")
+        posting.deposit(self.member, Decimal("100"))
+        legs = [
+            (journal.account("wallet", self.member), Decimal("-10")),
+            (journal.account("savings", other), Decimal("5")),
+            (journal.account("wallet", other), Decimal("-10")),
+            (journal.account("cash"), Decimal("15")),
+        ]
+        with self.assertRaises(journal.InsufficientFunds) as raised:
+            journal.post("Two debits", legs)
+        self.assertEqual((raised.exception.model, raised.exception.owner_id), (Member, other.pk))
+        self.assertEqual(str(raised.exception), "Insufficient funds in your Wallet!")
+        self.member.refresh_from_db()
+        self.assertEqual(self.member.balance, Decimal("100"))
+
+    def test_credit_to_missing_owner_is_not_a_shortfall(self):
+        missing = LedgerAccount(kind="wallet", member_id=self.member.pk + 1000)
+        with self.assertRaises(journal.MissingProjection) as raised:
+            journal.post("Orphan credit", [(missing, Decimal("5")), (journal.account("cash"), Decimal("-5"))])
+        self.assertEqual((raised.exception.model, raised.exception.owner_id), (Member, self.member.pk + 1000))
+        self.assertEqual(Journal.objects.count(), 0)
+
+
+class DividendRunTests(TestCase):
+    """ Chunked dividend runs pay exactly the pot, whatever the chunking, and resume without paying anyone twice """
+
+    SHARES = [Decimal("1"), Decimal("1"), Decimal("1"), Decimal("0"), Decimal("2.5"), Decimal("5"), Decimal("8")]
+
+    def setUp(self):
+        self.members = []
+        for index, shares in enumerate(self.SHARES):
+            member = Member.objects.create(user=User.objects.create(username=f"holder{index}"), phone=f"07000001{index:02d}")
+            Share.objects.create(member=member, shares_owned=shares)
+            self.members.append(member)
+
+    def payouts(self):
+        return dict(Transaction.objects.filter(transaction_type="dividend").values_list("member_id", "amount"))
+
+    def test_payouts_sum_to_the_total(self):
+        run = dividends.distribute_dividends(Decimal("100"), chunk_size=2)
+        payouts = self.payouts()
+        self.assertEqual(sum(payouts.values()), Decimal("100"))
+        self.assertEqual((run.status, run.distributed, run.members_paid), ("completed", Decimal("100"), 6))
+        self.assertNotIn(self.members[3].pk, payouts)  # no shares, no payout
+        for member, shares in zip(self.members, self.SHARES):
+            if shares:
+                self.assertLessEqual(abs(payouts[member.pk] - Decimal("100") * shares / Decimal("18.5")), Decimal("0.01"))
+        self.assertEqual(list(journal.projection_drift("wallet")), [])
+
+    def test_chunk_boundaries_do_not_change_payouts(self):
+        results = []
+        for chunk_size in (1, 2, 3, 100):
+            with db_transaction.atomic():
+                dividends.distribute_dividends(Decimal("100"), chunk_size=chunk_size)
+                results.append(self.payouts())
+                db_transaction.set_rollback(True)
+        self.assertTrue(all(result == results[0] for result in results[1:]), results)
+
+    def test_interrupted_run_resumes_without_paying_twice(self):
+        run = dividends.start_dividend_run(Decimal("100"))
+        pay_chunk, calls = dividends._pay_chunk, []
+
+        def crash_on_second_chunk(run, rows):
+            calls.append(rows)
+            if len(calls) == 2:
+                raise RuntimeError("worker died")
+            pay_chunk(run, rows)
+
+        with mock.patch.object(dividends, "_pay_chunk", crash_on_second_chunk):
+            with self.assertRaises(RuntimeError):
+                dividends.process_dividend_run(run, chunk_size=3)
+
+        run.refresh_from_db()
+        self.assertEqual((run.status, run.last_share_id, run.members_paid), ("running", calls[0][-1][0], 3))
+        self.assertEqual(len(self.payouts()), 3)  # the failed chunk rolled back whole
+
+        run = dividends.process_dividend_run(run, chunk_size=3)
+        self.assertEqual(run.status, "completed")
+        self.assertEqual(Transaction.objects.filter(transaction_type="dividend").count(), 6)
+        self.assertEqual(sum(self.payouts().values()), Decimal("100"))
+        self.assertEqual(dividends.process_dividend_run(run).members_paid, 6)  # a completed run is left alone
+        self.assertEqual(Transaction.objects.filter(transaction_type="dividend").count(), 6)
+
+
+class DailyFlowTests(TestCase):
+    """ The daily rollup buckets every posting by type and local day, feeds the dashboard chart and rebuilds identically """
+
+    def setUp(self):
+        caches["dashboard"].clear()
+        self.user = User.objects.create_user("fern", "fern@example.com", "pass")
+        self.member = Member.objects.create(user=self.user, phone="0700000017")
+        self.today = timezone.localdate()
+
+        posting.deposit(self.member, Decimal("500"))
+        Transaction.objects.create(member=self.member, amount=Decimal("50"), transaction_type="withdrawal")
+        posting.transfer(self.member, "wallet", "savings", Decimal("100"))
+        loan = Loan.objects.create(member=self.member, amount=Decimal("200"), interest_rate=Decimal("1"), duration_months=6)
+        posting.repay_loan(self.member, posting.approve_loan(loan, Decimal("200"), None), Decimal("30"))
+
+        # Backdated deposits, loaded the way check-off files are: one inside the chart window, one just outside
+        older = Transaction.objects.bulk_create([
+            Transaction(member=self.member, amount=Decimal(amount), transaction_type="deposit") for amount in ("70", "80")
+        ])
+        for transaction, days in zip(older, (6, 7)):
+            moment = timezone.make_aware(datetime.combine(self.today - timedelta(days=days), datetime.min.time().replace(hour=12)))
+            Transaction.objects.filter(pk=transaction.pk).update(created_at=moment)
+        DailyFlow.record_many(Transaction.objects.filter(pk__in=[transaction.pk for transaction in older]))
+
+        other = Member.objects.create(user=User.objects.create(username="gale"), phone="0700000018")
+        posting.deposit(other, Decimal("20"))
+
+    def flows(self, member=None):
+        return list(
+            DailyFlow.objects.filter(member=member or self.member)
+            .order_by("day")
+            .values_list("day", "deposits", "withdrawals", "transfers", "repayments")
+        )
+
+    def test_postings_are_bucketed_by_type_and_day(self):
+        self.assertEqual(self.flows(), [
+            (self.today - timedelta(days=7), Decimal("80"), 0, 0, 0),
+            (self.today - timedelta(days=6), Decimal("70"), 0, 0, 0),
+            (self.today, Decimal("500"), Decimal("50"), Decimal("100"), Decimal("30")),
+        ])
+
+    def test_dashboard_chart_reads_the_last_seven_days(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("dashboard"))
+        days = [self.today - timedelta(days=offset) for offset in range(6, -1, -1)]
+        self.assertEqual(json.loads(response.context["transaction_dates"]), [day.strftime("%b %d") for day in days])
+        self.assertEqual(json.loads(response.context["deposit_amounts"]), [70.0, 0, 0, 0, 0, 0, 500.0])
+        self.assertEqual(json.loads(response.context["withdrawal_amounts"]), [0, 0, 0, 0, 0, 0, 50.0])
+
+    def test_rebuild_matches_incremental_recording(self):
+        recorded, others = self.flows(), list(DailyFlow.objects.exclude(member=self.member).values_list("member_id", "day", "deposits"))
+
+        DailyFlow.objects.filter(member=self.member).update(deposits=0)
+        DailyFlow.rebuild(member_ids=[self.member.pk])
+        self.assertEqual(self.flows(), recorded)
+
+        DailyFlow.objects.all().delete()
+        call_command("rebuild_daily_flows", stdout=io.StringIO())
+        self.assertEqual(self.flows(), recorded)
+        self.assertEqual(list(DailyFlow.objects.exclude(member=self.member).values_list("member_id", "day", "deposits")), others)
+
+
+class AmortizationTests(TestCase):
+    """ Vectorized schedules repay exactly their principal and match the per-loan API """
+
+    def test_annuity_installments_are_level(self):
+        schedule = amortization.amortize(1000, 1, 12, "annuity")
+        self.assertTrue(all(abs(value - 88.85) <= 0.01 for value in schedule.installment[0]))
+        self.assertAlmostEqual(schedule.total_interest[0], 66.19, places=2)
+
+    def test_every_method_repays_the_principal(self):
+        principal = [1000, 2500.55, 0.05]
+        for method in amortization.METHODS:
+            schedule = amortization.amortize(principal, [1.5, 0, 2], [12, 7, 3], method)
+            for index, amount in enumerate(principal):
+                self.assertAlmostEqual(schedule.principal[index].sum(), amount, places=2, msg=method)
+                self.assertEqual(schedule.balance[index, schedule.terms[index] - 1], 0)
+            self.assertEqual(schedule.installment[1, 7:].sum(), 0)  # nothing due past a loan's term
+
+    def test_flat_interest_matches_calculate_interest(self):
+        user = User.objects.create_user("erin", "erin@example.com", "pass")
+        member = Member.objects.create(user=user, phone="0700000005")
+        loan = Loan.objects.create(member=member, amount=Decimal("1200"), interest_rate=Decimal("2"), duration_months=6, status="approved")
+
+        rows = loan.amortization_schedule("flat")
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(sum(row["interest"] for row in rows), loan.calculate_interest())
+        self.assertEqual(loan.daily_interest(days=365), Decimal("288.00"))
+
+        schedule, = amortization.portfolio_schedules(method="flat")
+        self.assertEqual(list(schedule.loan_ids), [loan.pk])
+        self.assertEqual(schedule.rows(), rows)
+        projection = amortization.portfolio_projection(method="flat")
+        self.assertEqual(len(projection), 6)
+        self.assertEqual(sum(row[2] for row in projection), Decimal("1344.00"))
+
+
+class BatchJobTests(TestCase):
+    """ An interrupted batch run resumes from its checkpoint without redoing finished chunks """
+
+    class FlakyAccrual(batch.AccrueInterestJob):
+        fail_after_id = None
+
+        def process_chunk(self, first_id, last_id, params):
+            if self.fail_after_id is not None and last_id > self.fail_after_id:
+                raise RuntimeError("interrupted")
+            return super().process_chunk(first_id, last_id, params)
+
+    def setUp(self):
+        user = User.objects.create_user("frank", "frank@example.com", "pass")
+        member = Member.objects.create(user=user, phone="0700000006")
+        self.loans = [
+            Loan.objects.create(member=member, amount=Decimal("365"), interest_rate=Decimal("1"), duration_months=12, status="approved")
+            for _ in range(5)
+        ]
+
+    def test_resume_after_interruption(self):
+        job = self.FlakyAccrual()
+        job.fail_after_id = self.loans[1].pk
+        params = {"day": "2026-01-31"}
+        with self.assertRaises(RuntimeError):
+            batch.run_job(job, params, chunk_size=2)
+
+        run = BatchRun.objects.get()
+        self.assertEqual((run.status, run.last_id, run.rows_processed), ("running", self.loans[1].pk, 2))
+
+        job.fail_after_id = None
+        resumed, rows = batch.run_job(job, params, chunk_size=2)
+        self.assertEqual(resumed.pk, run.pk)
+        self.assertEqual((resumed.status, resumed.rows_processed, rows), ("completed", 5, 3))
+        self.assertEqual(InterestAccrual.objects.filter(day="2026-01-31").count(), 5)
+        self.assertEqual(InterestAccrual.objects.first().amount, Decimal("0.12"))
+
+
+class AdminSummaryCacheTests(TestCase):
+    """ loan_approval serves its KPIs from cache until a signal drops the affected group """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser("grace", "grace@example.com", "pass")
+        cls.member = Member.objects.create(user=cls.admin, phone="0700000007")
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+
+    def load(self):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(reverse("loan_approval"))
+        aggregates = [query["sql"] for query in captured.captured_queries if "COUNT(" in query["sql"] or "SUM(" in query["sql"]]
+        return response.context, aggregates
+
+    def test_kpis_are_cached_and_invalidated(self):
+        context, aggregates = self.load()
+        self.assertEqual((context["total_members"], context["pending_loans_count"]), (1, 0))
+        self.assertEqual(len(aggregates), 2)
+        self.assertEqual(self.load()[1], [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            posting.deposit(self.member, Decimal("100"))
+        context, aggregates = self.load()
+        self.assertEqual(aggregates, [])  # wallet deposits touch neither KPI group
+        self.assertEqual(len(context["transactions"]), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            posting.transfer(self.member, "wallet", "savings", Decimal("40"))
+            Loan.objects.create(member=self.member, amount=Decimal("50"), interest_rate=Decimal("1"), duration_months=3)
+        context, aggregates = self.load()
+        self.assertEqual((context["total_savings"], context["pending_loans_count"]), (Decimal("40"), 1))
+        self.assertEqual(len(aggregates), 2)
+
+
+class DashboardCacheTests(TestCase):
+    """ The dashboard is served from a per-member cache until something touches the member """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("pete", "pete@example.com", "pass")
+        cls.member = Member.objects.create(user=cls.user, phone="0700000024")
+        cls.other = Member.objects.create(user=User.objects.create(username="quinn"), phone="0700000025")
+
+    def setUp(self):
+        caches["dashboard"].clear()
+        dashboard_cache.counters.reset()
+        self.client.force_login(self.user)
+        self.client.get(reverse("dashboard"))  # cold load
+
+    def test_warm_load(self):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(reverse("dashboard"))
+        # Session and user, then the member id; nothing else reaches the database
+        self.assertEqual(len(captured), 3)
+        self.assertEqual(response.context["wallet_balance"], 0.0)
+        self.assertEqual(dashboard_cache.counters.snapshot(), {"hits": 1, "misses": 1, "hit_rate": 0.5})
+
+    def test_postings_bump_only_the_members_they_touch(self):
+        posting.deposit(self.other, Decimal("30"))
+        self.client.get(reverse("dashboard"))
+        self.assertEqual(dashboard_cache.counters.hits, 1)
+
+        posting.deposit(self.member, Decimal("70"))
+        response = self.client.get(reverse("dashboard"))
+        self.assertEqual((response.context["wallet_balance"], len(response.context["transactions"])), (70.0, 1))
+
+        loan = Loan.objects.create(member=self.member, amount=Decimal("200"), interest_rate=Decimal("1"), duration_months=6, status="approved")
+        response = self.client.get(reverse("dashboard"))
+        self.assertEqual((response.context["loan"], response.context["total_loan_balance"]), (loan, 200.0))
+
+        LoanRepayment.objects.create(loan=loan, amount_paid=Decimal("50"))
+        self.assertEqual(self.client.get(reverse("dashboard")).context["loan_remaining_balance"], 150.0)
+        self.assertEqual(dashboard_cache.counters.snapshot()["misses"], 4)
+
+    def test_counters_served_to_admins(self):
+        admin = User.objects.create_superuser("ruth", "ruth@example.com", "pass")
+        self.client.force_login(admin)
+        self.assertEqual(self.client.get(reverse("instrumentation_stats")).json()["dashboard_cache"]["misses"], 1)
+
+
+class InstrumentationTests(TestCase):
+    """ Sampled requests are aggregated per view and served to admins only """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser("jack", "jack@example.com", "pass")
+        cls.user = User.objects.create_user("kate", "kate@example.com", "pass")
+        Member.objects.create(user=cls.user, phone="0700000011")
+
+    def setUp(self):
+        instrumentation.collector.reset()
+
+    @override_settings(SACCO_INSTRUMENTATION={"SAMPLE_RATE": 1.0, "SLOW_STATEMENTS": 3})
+    def test_views_are_measured(self):
+        self.client.force_login(self.user)
+        for _ in range(2):
+            self.client.get(reverse("dashboard"))
+
+        self.client.force_login(self.admin)
+        stats = self.client.get(reverse("instrumentation_stats")).json()["views"]["dashboard"]
+        self.assertEqual(stats["wall_ms"]["count"], 2)
+        self.assertGreater(stats["queries"]["mean"], 0)
+        self.assertGreater(stats["template_ms"]["mean"], 0)
+        self.assertLessEqual(stats["sql_ms"]["mean"], stats["wall_ms"]["mean"])
+        self.assertEqual(len(stats["slowest_statements"]), 3)
+        self.assertNotIn("kate", str(stats["slowest_statements"]))  # parameters are never stored
+
+    @override_settings(SACCO_INSTRUMENTATION={"SAMPLE_RATE": 0.0})
+    def test_unsampled_requests_are_not_recorded(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse("dashboard"))
+        self.assertEqual(instrumentation.collector.snapshot()["views"], {})
+
+    def test_endpoint_is_admin_only(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse("instrumentation_stats")).status_code, 302)
+
+
+class TracingTests(TestCase):
+    """ Model events carry loan and member ids, and are only built when tracing is on """
+
+    def setUp(self):
+        user = User.objects.create_user("liam", "liam@example.com", "pass")
+        self.member = Member.objects.create(user=user, phone="0700000012")
+
+    def test_disabled_by_default(self):
+        self.assertFalse(tracing.enabled())
+
+    def test_loan_events_have_fields(self):
+        with self.assertLogs("sacco.trace", "DEBUG") as logs:
+            loan = Loan.objects.create(member=self.member, amount=Decimal("100"), interest_rate=Decimal("1"), duration_months=6, status="approved")
+            LoanRepayment.objects.create(loan=loan, amount_paid=Decimal("30"))
+
+        events = {record.getMessage(): record.fields for record in logs.records}
+        self.assertEqual(events["loan.save"]["loan_id"], loan.pk)
+        self.assertEqual(events["loan.save"]["remaining_after"], Decimal("100"))
+        self.assertEqual(events["loan.repayment"]["member_id"], self.member.pk)
+        self.assertEqual(events["loan.repayment"]["remaining_after"], Decimal("70"))
+
+    def test_background_handler_writes_json_lines(self):
+        with tempfile.NamedTemporaryFile("r", suffix=".log") as output:
+            handler = tracing.BackgroundHandler(filename=output.name)
+            record = logging.LogRecord("sacco.trace", logging.DEBUG, __file__, 0, "loan.save", None, None)
+            record.fields = {"loan_id": 7, "remaining_after": Decimal("1.50")}
+            handler.handle(record)
+            handler.stop()  # drains the queue
+            line = json.loads(output.read())
+        self.assertEqual(line["event"], "loan.save")
+        self.assertEqual((line["loan_id"], line["remaining_after"]), (7, "1.50"))
+
+
+class OnboardingImportTests(TestCase):
+    """ Bulk import applies the registration rules and reports every row """
+
+    SHEET = (
+        "Username,Email,Phone,Password\n"
+        "mia,mia@example.com,0711000001,Str0ng-pass\n"
+        "noah,noah@example.com,0711000002,\n"
+        "noah,other@example.com,0711000003,\n"
+        "taken,taken@example.com,0711000004,\n"
+        "bad name,not-an-email,,\n"
+        ",,,\n"
+    )
+
+    def test_import_and_report(self):
+        User.objects.create_user("taken")
+        rows = onboarding.read_rows(io.BytesIO(self.SHEET.encode()), "members.csv")
+        with self.captureOnCommitCallbacks(execute=True):
+            results = onboarding.import_members(rows, chunk_size=2)
+
+        self.assertEqual([(r.row, r.status) for r in results], [(2, "created"), (3, "created"), (4, "error"), (5, "error"), (6, "error")])
+        self.assertIn("Duplicate", results[2].errors[0])
+        self.assertIn("already exists", results[3].errors[0])
+        self.assertEqual(len(results[4].errors), 3)  # username, email and phone
+
+        self.assertTrue(User.objects.get(username="mia").check_password("Str0ng-pass"))
+        noah = Member.objects.select_related("user").get(user__username="noah")
+        self.assertEqual(noah.phone, "0711000002")
+        self.assertFalse(noah.user.has_usable_password())
+        self.assertEqual(results[0].set_password_link, "")
+
+        # The set-password link lets the member choose a password
+        response = self.client.get(results[1].set_password_link, follow=True)
+        self.client.post(response.redirect_chain[-1][0], {"new_password1": "An0ther-pass!", "new_password2": "An0ther-pass!"})
+        noah.user.refresh_from_db()
+        self.assertTrue(noah.user.check_password("An0ther-pass!"))
+
+        report = io.StringIO()
+        onboarding.write_report(results, report)
+        self.assertEqual(len(report.getvalue().splitlines()), 6)
+
+
+class PortfolioTests(TestCase):
+    """ PAR and aging from each loan's oldest unpaid installment """
+
+    def setUp(self):
+        cache.clear()
+        self.member = Member.objects.create(user=User.objects.create(username="mark"), phone="0700000031")
+
+    def loan(self, amount, months, created, repaid=0):
+        loan = Loan.objects.create(member=self.member, amount=Decimal(amount), interest_rate=Decimal("1"), duration_months=months, status="approved")
+        Loan.objects.filter(pk=loan.pk).update(created_at=timezone.make_aware(datetime.combine(created, datetime.min.time().replace(hour=12))))
+        if repaid:
+            LoanRepayment.objects.create(loan=loan, amount_paid=Decimal(repaid))
+        return loan
+
+    def test_par_and_aging(self):
+        self.loan(1200, 12, date(2025, 1, 10), repaid=200)  # 5 installments due, 2 paid: 3rd was due Apr 10
+        self.loan(600, 6, date(2025, 5, 31))  # First installment falls on Jun 30
+        self.loan(300, 3, date(2025, 1, 31), repaid=300)  # Repaid in full
+
+        analytics = portfolio.compute(date(2025, 6, 15), chunk_size=2)
+        self.assertEqual(analytics["outstanding"], 1600.0)
+        self.assertEqual([(row["days"], row["outstanding"]) for row in analytics["par"]], [(30, 1000.0), (60, 1000.0), (90, 0.0)])
+        aging = {row["bucket"]: row["loans"] for row in analytics["aging"]}
+        self.assertEqual((aging["Current"], aging["61-90"]), (2, 1))
+        self.assertEqual([row["month"] for row in analytics["cohorts"]], ["2025-01", "2025-05"])
+        self.assertEqual(analytics["cohorts"][0]["repaid"], 500.0)
+        self.assertEqual(analytics["curve"][-1]["cumulative_disbursed"], 2100.0)
+        self.assertEqual(analytics["curve"][-1]["cumulative_repaid"], 500.0)
+
+    def test_due_dates_clamp_to_month_end(self):
+        created = np.array(["2025-01-31"], dtype="datetime64[D]")
+        dpd = portfolio.days_past_due(created, np.array([600.0]), np.array([6]), np.array([0.0]), date(2025, 3, 1))
+        self.assertEqual(dpd.tolist(), [1])  # Due Feb 28
+
+    def test_report_is_cached_per_day(self):
+        admin = User.objects.create_superuser("nina", "nina@example.com", "pass")
+        self.client.force_login(admin)
+        self.loan(1200, 12, date(2025, 1, 10))
+        self.client.get(reverse("portfolio_report"))
+        with self.assertNumQueries(2):  # session and user only
+            response = self.client.get(reverse("portfolio_report"))
+        self.assertContains(response, "PAR30")
+
+    def test_loan_postings_drop_the_cached_day(self):
+        loan = self.loan(1200, 12, date(2025, 1, 10))
+        self.assertEqual(portfolio.get_analytics()["outstanding"], 1200.0)
+        with self.captureOnCommitCallbacks(execute=True):
+            LoanRepayment.objects.create(loan=loan, amount_paid=Decimal("200"))
+        self.assertEqual(portfolio.get_analytics()["outstanding"], 1000.0)
+
+
+class StatementTests(TestCase):
+    """ Statements start from month-end snapshots and stream as CSV or PDF """
+
+    def setUp(self):
+        self.user = User.objects.create(username="olga")
+        self.member = Member.objects.create(user=self.user, phone="0700000041")
+        for day, amount in ((date(2025, 1, 15), "100"), (date(2025, 2, 10), "50"), (date(2025, 3, 5), "25")):
+            transaction = posting.deposit(self.member, Decimal(amount))
+            Journal.objects.filter(transaction=transaction).update(created_at=timezone.make_aware(datetime(day.year, day.month, day.day, 9)))
+        self.account = journal.account("wallet", self.member)
+
+    def test_opening_running_and_closing(self):
+        statement = statements.Statement(self.member, "wallet", date(2025, 2, 1), date(2025, 3, 31))
+        self.assertEqual([line[3] for line in statement.lines()], [Decimal("150"), Decimal("175")])
+        self.assertEqual((statement.opening, statement.closing), (Decimal("100"), Decimal("175")))
+
+    def test_opening_balance_starts_from_snapshot(self):
+        self.assertEqual(statements.take_snapshots(date(2025, 1, 31), [self.account.id]), 1)
+        statements.take_snapshots(date(2025, 2, 28), [self.account.id])
+        self.assertEqual(BalanceSnapshot.objects.get(day=date(2025, 2, 28)).balance, Decimal("150"))
+
+        # Only entries after the latest snapshot are summed, so a changed snapshot shows through
+        BalanceSnapshot.objects.filter(day=date(2025, 2, 28)).update(balance=Decimal("1000"))
+        self.assertEqual(statements.balance_before(self.account.id, date(2025, 3, 20)), Decimal("1025"))
+
+    def test_open_months_are_not_snapshotted(self):
+        current = timezone.localdate()
+        with tempfile.TemporaryDirectory() as directory:
+            with self.assertRaisesMessage(CommandError, "has not ended yet"):
+                call_command("month_end_statements", "--month", f"{current:%Y-%m}", "--directory", directory, stdout=io.StringIO())
+        with self.assertRaises(ValueError):
+            statements.take_snapshots(statements.month_end(current), [self.account.id])
+        self.assertFalse(BalanceSnapshot.objects.exists())
+
+    def test_streamed_csv_and_pdf(self):
+        self.client.force_login(self.user)
+        params = {"start_date": "2025-02-01", "end_date": "2025-02-28"}
+        csv_lines = b"".join(self.client.get(reverse("member_statement"), {**params, "format": "csv"}).streaming_content).decode().splitlines()
+        self.assertEqual(csv_lines[2:], ["2025-02-01,Opening balance,,100.00", csv_lines[3], "2025-02-28,Closing balance,,150.00"])
+
+        pdf = b"".join(self.client.get(reverse("member_statement"), params).streaming_content)
+        self.assertTrue(pdf.startswith(b"%PDF-1.4"))
+        xref = int(pdf.rsplit(b"startxref\n", 1)[1].split()[0])
+        self.assertTrue(pdf[xref:].startswith(b"xref"))
+
+    def test_month_end_jobs(self):
+        with tempfile.TemporaryDirectory() as directory:
+            batch.run_job(batch.JOBS["balance_snapshots"], {"day": "2025-02-28"})
+            params = {"start": "2025-02-01", "end": "2025-02-28", "directory": directory, "format": "csv"}
+            _, rows = batch.run_job(batch.JOBS["member_statements"], params)
+            self.assertEqual(rows, 1)
+            with open(f"{directory}/olga-wallet-20250201-20250228.csv") as file:
+                self.assertIn("Closing balance,,150.00", file.read())
+        self.assertEqual(BalanceSnapshot.objects.get(account=self.account).balance, Decimal("150"))
+
+
+class CheckoffFileTests(TestCase):
+    """ A check-off file posts savings and repayments in bulk, exactly once """
+
+    def setUp(self):
+        self.ann = Member.objects.create(user=User.objects.create(username="ann"), phone="0722000001")
+        self.ben = Member.objects.create(user=User.objects.create(username="ben"), phone="0722000002")
+        Member.objects.create(user=User.objects.create(username="twin"), phone="0722000002")
+        self.loan = Loan.objects.create(member=self.ann, amount=Decimal("300"), interest_rate=Decimal("1"), duration_months=6, status="approved")
+        self.file = (
+            "Member,Savings,Loan_Repayment\n"
+            "0722000001,100.00,200\n"
+            "ann,,100\n"  # Repays the rest of the loan
+            "ben,50,\n"
+            "0722000002,10,\n"  # Phone shared with twin
+            "ben,5,20\n"  # No loan
+            "nobody,5,\n"
+            "ann,-1,\n"
+        ).encode()
+
+    def process(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return checkoff.process_file(io.BytesIO(self.file), "march.csv", chunk_size=3)
+
+    def test_posts_once(self):
+        checkoff_file, rejected = self.process()
+
+        self.assertEqual([row.line for row in rejected], [5, 6, 7, 8])
+        self.assertIn("shared", rejected[0].error)
+        self.assertIn("no ongoing loan", rejected[1].error)
+        self.assertEqual((checkoff_file.status, checkoff_file.rows_posted, checkoff_file.total_repayments), ("completed", 3, Decimal("300")))
+
+        self.ann.refresh_from_db()
+        self.loan.refresh_from_db()
+        self.assertEqual(self.ann.savings_balance, Decimal("100"))
+        self.assertEqual((self.loan.remaining_balance, self.loan.repayment_status), (Decimal("0"), "completed"))
+        self.assertEqual(LoanRepayment.objects.filter(loan=self.loan).count(), 2)
+        self.assertEqual(DailyFlow.objects.get(member=self.ann).repayments, Decimal("300"))
+        self.assertEqual(list(journal.projection_drift("savings")), [])
+        self.assertEqual(list(journal.projection_drift("loan")), [])
+
+        # The same content again is recognised by its hash and posts nothing
+        transactions = Transaction.objects.count()
+        _, rejected = self.process()
+        self.assertIsNone(rejected)
+        self.assertEqual(Transaction.objects.count(), transactions)
+        self.assertEqual(CheckoffFile.objects.count(), 1)
+
+
+class ApiTests(TestCase):
+    """ The async /api/v1/ views, exercised through the ASGI request handler """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="lena")
+        cls.member = Member.objects.create(user=cls.user, phone="0700000021", balance=Decimal("500"))
+        cls.loan = Loan.objects.create(member=cls.member, amount=Decimal("800"), interest_rate=Decimal("1"), duration_months=6, status="approved")
+
+    async def test_requires_login(self):
+        response = await self.async_client.get(reverse("api_balance"))
+        self.assertEqual(response.status_code, 401)
+
+    async def test_balance_transfer_and_statement(self):
+        await self.async_client.aforce_login(self.user)
+        self.assertEqual((await self.async_client.get(reverse("api_balance"))).json()["wallet_balance"], "500.00")
+
+        response = await self.async_client.post(
+            reverse("api_transfer"), {"from_account": "wallet", "to_account": "savings", "amount": "120"}, content_type="application/json"
+        )
+        self.assertEqual(response.json()["savings_balance"], "120.00")
+        self.assertEqual(response.json()["total_balance"], "500.00")
+
+        response = await self.async_client.post(reverse("api_transfer"), {"from_account": "wallet", "to_account": "savings", "amount": "900"})
+        self.assertEqual(response.status_code, 400)
+
+        statement = (await self.async_client.get(reverse("api_statement"), {"limit": 5})).json()["transactions"]
+        self.assertEqual([row["transaction_type"] for row in statement], ["transfer"])
+
+    async def test_transfer_body_must_be_an_object(self):
+        await self.async_client.aforce_login(self.user)
+        for body in ("[1]", '"x"', "1", "null"):
+            response = await self.async_client.post(reverse("api_transfer"), body, content_type="application/json")
+            self.assertEqual(response.status_code, 400, body)
+
+    async def test_loan_status(self):
+        await self.async_client.aforce_login(self.user)
+        loans = (await self.async_client.get(reverse("api_loans"))).json()["loans"]
+        self.assertEqual([(loan["id"], loan["remaining_balance"]) for loan in loans], [(self.loan.id, "800.00")])
+        other = await Loan.objects.acreate(member=self.member, amount=Decimal("1"), interest_rate=Decimal("1"), duration_months=1)
+        self.assertEqual((await self.async_client.get(reverse("api_loan_status", args=[other.id]))).json()["loan"]["status"], "pending")
+        self.assertEqual((await self.async_client.get(reverse("api_loan_status", args=[0]))).status_code, 404)
+
+    @override_settings(SACCO_INSTRUMENTATION={"SAMPLE_RATE": 1.0})
+    async def test_async_requests_are_measured(self):
+        instrumentation.collector.reset()
+        await self.async_client.aforce_login(self.user)
+        await self.async_client.get(reverse("api_balance"))
+        stats = instrumentation.collector.snapshot()["views"]["api_balance"]
+        self.assertGreater(stats["queries"]["mean"], 0)
+
+
+class ReconciliationTests(TestCase):
+    """ The nightly reconciliation finds balances that drifted from the journal and can repair them """
+
+    def setUp(self):
+        user = User.objects.create_user("mona", "mona@example.com", "pass")
+        self.member = Member.objects.create(user=user, phone="0700000022")
+        posting.deposit(self.member, Decimal("100"))
+        posting.transfer(self.member, "wallet", "savings", Decimal("40"))
+        self.loan = Loan.objects.create(member=self.member, amount=Decimal("300"), interest_rate=Decimal("1"), duration_months=6, status="approved")
+
+    def test_clean_ledger_has_no_drift(self):
+        self.assertEqual(journal.reconcile("wallet", self.member.pk, self.member.pk), [])
+        call_command("reconcile_balances", stdout=io.StringIO())
+        self.assertFalse(BalanceDrift.objects.exists())
+
+    def test_drift_is_reported_then_repaired(self):
+        Member.objects.filter(pk=self.member.pk).update(balance=Decimal("75"))
+        Loan.objects.filter(pk=self.loan.pk).update(remaining_balance=Decimal("250"))
+
+        with self.assertRaises(CommandError):
+            call_command("reconcile_balances", stdout=io.StringIO())
+        drift = BalanceDrift.objects.order_by("kind").values_list("kind", "owner_id", "recorded", "expected", "repaired")
+        self.assertEqual(list(drift), [
+            ("loan", self.loan.pk, Decimal("250"), Decimal("300"), False),
+            ("wallet", self.member.pk, Decimal("75"), Decimal("60"), False),
+        ])
+
+        with tempfile.NamedTemporaryFile("r", suffix=".csv") as report:
+            call_command("reconcile_balances", "--repair", "--report", report.name, stdout=io.StringIO())
+            self.assertIn("wallet,%d,75.00,60.00,-15.00,True" % self.member.pk, report.read())
+        self.member.refresh_from_db()
+        self.loan.refresh_from_db()
+        self.assertEqual((self.member.balance, self.member.savings_balance, self.loan.remaining_balance), (Decimal("60"), Decimal("40"), Decimal("300")))
+        self.assertTrue(all(BalanceDrift.objects.values_list("repaired", flat=True)))
+
+    def test_rerun_clears_drift_fixed_since(self):
+        Member.objects.filter(pk=self.member.pk).update(balance=Decimal("75"))
+        with self.assertRaises(CommandError):
+            call_command("reconcile_balances", stdout=io.StringIO())
+
+        Member.objects.filter(pk=self.member.pk).update(balance=Decimal("60"))
+        call_command("reconcile_balances", stdout=io.StringIO())
+        self.assertFalse(BalanceDrift.objects.exists())
+
+    def test_repair_skips_a_balance_that_moved(self):
+        Member.objects.filter(pk=self.member.pk).update(balance=Decimal("75"))
+        drift = journal.reconcile("wallet", self.member.pk, self.member.pk)
+        Member.objects.filter(pk=self.member.pk).update(balance=Decimal("80"))
+        self.assertEqual(journal.repair("wallet", drift), [])
+
+
+class BulkLoanDecisionTests(TestCase):
+    """ Many loans are approved (funded through the journal) or rejected in one request """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser("sam", "sam@example.com", "pass")
+        cls.member = Member.objects.create(user=User.objects.create(username="tess"), phone="0700000026")
+
+    def loans(self, count):
+        return [
+            Loan.objects.create(member=self.member, amount=Decimal("100"), interest_rate=Decimal("1"), duration_months=6)
+            for _ in range(count)
+        ]
+
+    def test_outcomes_and_funding(self):
+        first, second, third = self.loans(3)
+        outcomes = posting.decide_loans([
+            (first.id, "approve", "250.50"), (second.id, "reject", None), (third.id, "approve", "0"),
+            (first.id, "reject", None), (999999, "approve", "10"), (third.id, "hold", None),
+        ], self.admin)
+        self.assertEqual([outcome["status"] for outcome in outcomes], ["approved", "rejected", "skipped", "skipped", "skipped", "skipped"])
+        self.assertEqual(outcomes[3]["message"], "Loan already decided in this batch.")
+
+        loans = dict(Loan.objects.values_list("id", "status"))
+        self.assertEqual((loans[first.id], loans[second.id], loans[third.id]), ("approved", "rejected", "pending"))
+        first.refresh_from_db()
+        self.assertEqual((first.amount, first.remaining_balance, first.reviewed_by), (Decimal("250.50"), Decimal("250.50"), self.admin))
+        self.assertEqual(list(journal.projection_drift("loan")), [])
+        self.assertEqual(list(journal.unbalanced_journals()), [])
+
+    def test_decided_loans_are_skipped(self):
+        approved, rejected = self.loans(2)
+        posting.decide_loans([(approved.id, "approve", "100"), (rejected.id, "reject", None)], self.admin)
+        posting.withdraw_loan(approved, Decimal("60"))
+
+        # Neither re-funds the 60 already withdrawn nor strands the 40 left on the loan
+        outcomes = posting.decide_loans([(approved.id, "approve", "100"), (approved.id, "reject", None), (rejected.id, "approve", "50")], self.admin)
+        self.assertEqual([(o["status"], o.get("message")) for o in outcomes], [
+            ("skipped", "Loan already decided."), ("skipped", "Loan already decided."), ("skipped", "Loan already decided."),
+        ])
+        approved.refresh_from_db()
+        self.assertEqual((approved.status, approved.remaining_balance), ("approved", Decimal("40")))
+        self.assertEqual(Loan.objects.get(pk=rejected.pk).status, "rejected")
+
+    def test_queries_do_not_grow_with_the_batch(self):
+        def queries(loans):
+            with CaptureQueriesContext(connection) as captured:
+                posting.decide_loans([(loan.id, "approve" if loan.id % 2 else "reject", "150") for loan in loans], self.admin)
+            return len(captured)
+
+        queries(self.loans(1))  # opens the loan_fund account
+        self.assertEqual(queries(self.loans(5)), queries(self.loans(60)))
+
+    def test_endpoint_and_admin_action(self):
+        first, second = self.loans(2)
+        url = reverse("bulk_loan_decision")
+        body = json.dumps({"decisions": [{"loan": first.id, "action": "approve", "amount": "300"}, {"loan": second.id, "action": "reject"}]})
+
+        self.client.force_login(self.member.user)
+        self.assertEqual(self.client.post(url, body, content_type="application/json").status_code, 302)
+
+        self.client.force_login(self.admin)
+        self.assertEqual(self.client.post(url, "[1]", content_type="application/json").status_code, 400)
+        result = self.client.post(url, body, content_type="application/json").json()
+        self.assertEqual((result["approved"], result["rejected"], result["skipped"]), (1, 1, 0))
+
+        loan = self.loans(1)[0]
+        self.client.post(reverse("admin:sacco_loan_changelist"), {"action": "approve_loans", "_selected_action": [loan.id]})
+        loan.refresh_from_db()
+        self.assertEqual((loan.status, loan.remaining_balance), ("approved", Decimal("100")))
+
+
+class DatasetTests(TestCase):
+    """ Generated data is seeded, covers every loan state and agrees with the journal and rollup """
+
+    def test_generate(self):
+        counts = dataset.generate(40, transactions_per_member=5, loans_per_member=2, seed=7, chunk_size=15)
+        self.assertEqual((counts["sacco.Member"], counts["auth.User"]), (40, 40))
+        self.assertEqual(Transaction.objects.count(), counts["sacco.Transaction"])
+
+        states = set(Loan.objects.values_list("status", "repayment_status"))
+        self.assertEqual(states, {("pending", "ongoing"), ("rejected", "ongoing"), ("approved", "ongoing"), ("approved", "completed")})
+        self.assertFalse(Member.objects.filter(balance__lt=0).exists())
+        self.assertEqual(list(journal.unbalanced_journals()), [])
+        for kind in journal.PROJECTIONS:
+            self.assertEqual(list(journal.projection_drift(kind)), [], kind)
+
+        flows = sorted(DailyFlow.objects.values_list("member_id", "day", "deposits", "withdrawals", "transfers", "repayments"))
+        DailyFlow.rebuild()
+        self.assertEqual(flows, sorted(DailyFlow.objects.values_list("member_id", "day", "deposits", "withdrawals", "transfers", "repayments")))
+
+    def test_same_seed_same_rows(self):
+        options = {"transactions_per_member": 5, "loans_per_member": 1, "share_ratio": 0.5, "days": 30, "until": date(2025, 6, 1)}
+        ids = dict.fromkeys([User, Member, Loan, LoanRepayment, Transaction, Share], 1)
+
+        def amounts(seed):
+            chunk = dataset.Chunk(np.random.default_rng([seed, 0]), ids, 10, options)
+            return (
+                chunk.transaction_amount.tolist(), chunk.loan_status.tolist(), chunk.wallet.tolist(),
+                chunk.joined.tolist(), chunk.loan_created.tolist(), chunk.repayment_time.tolist(), chunk.transaction_time.tolist(),
+            )
+
+        self.assertEqual(amounts(1), amounts(1))
+        self.assertNotEqual(amounts(1), amounts(2))
+        times = amounts(1)[6]
+        self.assertTrue(all(datetime(2025, 5, 2) <= moment < datetime(2025, 6, 1) for moment in times))
+
+
+class ReportExportTests(TestCase):
+    """ The CSV report streams the filtered ledger, whole days included, at a fixed query cost """
+
+    def setUp(self):
+        self.ruth = Member.objects.create(user=User.objects.create(username="ruth"), phone="0700000019")
+        self.saul = Member.objects.create(user=User.objects.create(username="saul"), phone="0700000020")
+        self.add(self.ruth, "5", "deposit", datetime(2025, 2, 28, 23, 59, 59))  # before the range
+        self.add(self.ruth, "10", "deposit", datetime(2025, 3, 1))
+        self.add(self.saul, "20", "withdrawal", datetime(2025, 3, 15, 12))
+        self.add(self.ruth, "30", "transfer", datetime(2025, 3, 31, 23, 59, 59))  # last second of the end date
+        self.add(self.saul, "40", "deposit", datetime(2025, 4, 1))  # after the range
+
+    def add(self, member, amount, transaction_type, moment):
+        transaction, = Transaction.objects.bulk_create([Transaction(member=member, amount=Decimal(amount), transaction_type=transaction_type)])
+        Transaction.objects.filter(pk=transaction.pk).update(created_at=timezone.make_aware(moment))
+
+    def export(self, **filters):
+        response = self.client.get(reverse("generate_report"), filters)
+        self.assertIsInstance(response, StreamingHttpResponse)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        return list(csv.reader(io.StringIO(b"".join(response.streaming_content).decode())))
+
+    def test_header_and_columns(self):
+        rows = self.export(start_date="2025-03-01", end_date="2025-03-01")
+        self.assertEqual(rows, [["Member", "Amount", "Type", "Date"], ["ruth", "10.00", "deposit", "2025-03-01 00:00:00+00:00"]])
+
+    def test_end_date_includes_the_whole_day(self):
+        rows = self.export(start_date="2025-03-01", end_date="2025-03-31")
+        self.assertEqual([(row[0], row[1]) for row in rows[1:]], [("ruth", "10.00"), ("saul", "20.00"), ("ruth", "30.00")])
+
+    def test_member_and_type_filters(self):
+        self.assertEqual([row[1] for row in self.export(member="ruth")[1:]], ["5.00", "10.00", "30.00"])
+        self.assertEqual([row[1] for row in self.export(transaction_type="deposit")[1:]], ["5.00", "10.00", "40.00"])
+        self.assertEqual([row[1] for row in self.export(member="saul", transaction_type="deposit")[1:]], ["40.00"])
+        self.assertEqual(self.export(start_date="not a date", member="nobody"), [["Member", "Amount", "Type", "Date"]])
+
+    def test_query_count_does_not_grow_with_rows(self):
+        def queries():
+            with CaptureQueriesContext(connection) as captured:
+                rows = self.export()
+            return len(rows), len(captured)
+
+        small_rows, small = queries()
+        for index in range(30):
+            self.add(self.saul if index % 2 else self.ruth, "1", "deposit", datetime(2025, 5, 1, index % 24))
+        large_rows, large = queries()
+        self.assertEqual(large_rows, small_rows + 30)
+        self.assertEqual(large, small, "The export runs a query per row")
+
+
+class ArchiveTests(TestCase):
+    """ Closed months move to segment files; reports still read them and re-runs are safe """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.enterContext(override_settings(SACCO_ARCHIVE_DIR=self.directory.name))
+        self.member = Member.objects.create(user=User.objects.create(username="nell"), phone="0700000023")
+        for day, amount in ((date(2024, 3, 10), "100"), (date(2024, 3, 20), "40"), (date(2024, 4, 2), "60")):
+            transaction = posting.deposit(self.member, Decimal(amount))
+            Transaction.objects.filter(pk=transaction.pk).update(created_at=timezone.make_aware(datetime(day.year, day.month, day.day, 9)))
+        posting.deposit(self.member, Decimal("5"))
+        DailyFlow.rebuild()
+
+    def test_archive_and_report_union(self):
+        segments = archive.archive(hot_months=1)
+        self.assertEqual([(s.month, s.rows, s.total_amount) for s in segments], [
+            (date(2024, 3, 1), 2, Decimal("140")), (date(2024, 4, 1), 1, Decimal("60")),
+        ])
+        self.assertEqual(Transaction.objects.count(), 1)
+        self.assertEqual(Journal.objects.filter(transaction__isnull=True).count(), 3)
+        self.assertEqual(list(journal.projection_drift("wallet")), [])
+
+        rows = list(archive.report_rows(start_date=date(2024, 3, 15)))
+        self.assertEqual([row[1] for row in rows], [Decimal("40"), Decimal("60"), Decimal("5")])
+        response = self.client.get(reverse("generate_report"), {"end_date": "2024-03-31"})
+        self.assertEqual(len(b"".join(response.streaming_content).decode().splitlines()), 3)
+
+        # Archived days keep their buckets through a rebuild
+        DailyFlow.rebuild()
+        self.assertEqual(DailyFlow.objects.filter(day__lt=date(2024, 5, 1)).aggregate(total=Sum("deposits"))["total"], Decimal("200"))
+
+    def test_history_and_statement_page_into_the_archive(self):
+        archive.archive(hot_months=1)
+        self.client.force_login(self.member.user)
+        page = self.client.get(reverse("transaction_history")).context["transactions"]
+        self.assertEqual([t.amount for t in page], [Decimal("5"), Decimal("60"), Decimal("40"), Decimal("100")])
+        self.assertTrue(page.total_is_capped)
+
+        paginator = archive.ArchivePaginator(Transaction.objects.all(), 2)
+        second = paginator.get_page(paginator.get_page().next_cursor)
+        self.assertEqual([t.amount for t in second], [Decimal("40"), Decimal("100")])
+        self.assertFalse(second.has_next)
+        self.assertEqual([t.amount for t in paginator.get_page(second.previous_cursor)], [Decimal("5"), Decimal("60")])
+
+        filtered = self.client.get(reverse("transaction_history"), {"transaction_type": "deposit", "search": "user dep"})
+        self.assertEqual(len(filtered.context["transactions"]), 4)
+
+        rows = self.client.get(reverse("api_statement"), {"limit": 3}).json()["transactions"]
+        self.assertEqual([row["amount"] for row in rows], ["5.00", "60.00", "40.00"])
+
+    def test_rerun_finishes_deletes_without_rewriting(self):
+        segment = archive.archive_month(date(2024, 3, 1))
+        # A run that stopped after writing its file left a hot row behind
+        Transaction.objects.bulk_create([Transaction(id=segment.last_id, member=self.member, amount=Decimal("40"), transaction_type="deposit")])
+        Transaction.objects.filter(pk=segment.last_id).update(created_at=timezone.make_aware(datetime(2024, 3, 20, 9)))
+        self.assertIsNone(archive.archive_month(date(2024, 3, 1)))
+        self.assertFalse(Transaction.objects.filter(pk=segment.last_id).exists())
+        self.assertEqual(ArchiveSegment.objects.count(), 1)
+
+    def test_late_rows_go_to_a_further_part(self):
+        archive.archive_month(date(2024, 3, 1))
+        late = Transaction.objects.create(member=self.member, amount=Decimal("7"), transaction_type="deposit")
+        Transaction.objects.filter(pk=late.pk).update(created_at=timezone.make_aware(datetime(2024, 3, 15, 9)))
+
+        call_command("archive_transactions", "--hot-months", "1", stdout=io.StringIO())
+        parts = ArchiveSegment.objects.filter(month=date(2024, 3, 1)).order_by("part")
+        self.assertEqual([(s.part, s.rows, s.first_id) for s in parts], [(1, 2, parts[0].first_id), (2, 1, late.pk)])
+        self.assertFalse(Transaction.objects.filter(created_at__lt=timezone.make_aware(datetime(2024, 5, 1))).exists())
+        # The backdated row is read back in date order
+        amounts = [row[1] for row in archive.report_rows(end_date=date(2024, 3, 31))]
+        self.assertEqual(amounts, [Decimal("100"), Decimal("7"), Decimal("40")])
+
+
+class PostingConcurrencyTests(TransactionTestCase):
+    """ Many workers posting against the same member must never lose an update """
+
+    WORKERS = 8
+    POSTINGS_PER_WORKER = 25
+
+    def setUp(self):
+        user = User.objects.create_user("carol", "carol@example.com", "pass")
+        self.member = Member.objects.create(user=user, phone="0700000003", balance=Decimal("0"))
+
+    def run_workers(self, work):
+        """ Run `work(i)` from several threads at once, each on its own connection """
+        errors = []
+        start = threading.Barrier(self.WORKERS)
+
+        def worker(i):
+            try:
+                start.wait()
+                for _ in range(self.POSTINGS_PER_WORKER):
+                    work(i)
+            except Exception as e:  # surfaced by the assertion below
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(self.WORKERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_concurrent_deposits_and_transfers_are_not_lost(self):
+        def work(i):
+            member = Member.objects.get(pk=self.member.pk)  # every worker holds its own stale copy
+            posting.deposit(member, Decimal("10"))
+            posting.transfer(member, "wallet", "savings", Decimal("4"))
+
+        self.run_workers(work)
+
+        postings = self.WORKERS * self.POSTINGS_PER_WORKER
+        self.member.refresh_from_db()
+        self.assertEqual(self.member.balance, Decimal("6") * postings)
+        self.assertEqual(self.member.savings_balance, Decimal("4") * postings)
+        self.assertEqual(Transaction.objects.filter(member=self.member).count(), 2 * postings)
+
+    def test_concurrent_withdrawals_never_overdraw(self):
+        posting.deposit(self.member, Decimal("100"))
+        rejected = []
+
+        def work(i):
+            try:
+                Transaction.objects.create(member=Member.objects.get(pk=self.member.pk), amount=Decimal("1"), transaction_type="withdrawal")
+            except posting.InsufficientFunds:
+                rejected.append(i)
+
+        self.run_workers(work)
+
+        attempts = self.WORKERS * self.POSTINGS_PER_WORKER
+        self.member.refresh_from_db()
+        self.assertEqual(self.member.balance, Decimal("0"))
+        self.assertEqual(len(rejected), attempts - 100)
+        self.assertEqual(Transaction.objects.filter(member=self.member, transaction_type="withdrawal").count(), 100)
+
+
+class BenchmarkTests(TransactionTestCase):
+    """ The benchmark's synthetic data is consistent and its scenarios run from several threads """
+
+    def test_populate_and_run(self):
+        actors = benchmark.populate(members=3, transactions=2, seed=1)
+        self.assertEqual(list(journal.unbalanced_journals()), [])
+        for kind in journal.PROJECTIONS:
+            self.assertEqual(list(journal.projection_drift(kind)), [], kind)
+
+        results = benchmark.run(actors, ["dashboard", "transfer_funds", "repayment_save"], concurrency=[1, 2], requests=4)
+        self.assertEqual(list(results), [f"{name}@{level}" for name in ("dashboard", "transfer_funds", "repayment_save") for level in (1, 2)])
+        for stats in results.values():
+            self.assertEqual((stats["requests"], stats["errors"]), (4, 0))
+            self.assertGreater(stats["queries_mean"], 0)
+            self.assertLessEqual(stats["p50_ms"], stats["p99_ms"])
+
+    def test_compare_flags_regressions(self):
+        stats = {"p95_ms": 10.0, "queries_max": 8, "errors": 0}
+        baseline = {"dashboard@1": stats, "repay_loan@1": stats}
+        results = {
+            "dashboard@1": {**stats, "p95_ms": 11.0},  # within tolerance
+            "repay_loan@1": {**stats, "p95_ms": 30.0, "queries_max": 9},
+            "withdraw_loan@1": {**stats, "p95_ms": 99.0},  # not in the baseline
+        }
+        self.assertEqual(benchmark.compare(results, baseline), [
+            ("repay_loan@1", "p95_ms", 10.0, 30.0),
+            ("repay_loan@1", "queries_max", 8, 9),
+        ])
@@ -0,0 +1,78 @@
+"""
+Structured tracing for the sacco models and views.
+
+trace() logs an event with named fields (loan_id, member_id, amounts...) on the
+"sacco.trace" logger at DEBUG. While that level is off it returns after one
+isEnabledFor() check. When it is on, BackgroundHandler only puts the record on
+a queue; a listener thread formats it as a JSON line and writes it, so hot
+write paths and batch runs never wait on stdout or disk.
+
+Enable it with the SACCO_TRACE_LEVEL environment variable (see LOGGING in settings).
+"""
+import atexit
+import json
+import logging
+import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+
+logger = logging.getLogger("sacco.trace")
+
+
+def enabled():
+    return logger.isEnabledFor(logging.DEBUG)
+
+
+def trace(event, **fields):
+    """ Log one event with structured fields; no formatting or I/O happens on the caller's thread """
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(event, extra={"fields": fields})
+
+
+class StructuredFormatter(logging.Formatter):
+    """ One JSON object per line: time, level, logger, event and the record's fields """
+
+    def format(self, record):
+        payload = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "event": record.getMessage(),
+            **getattr(record, "fields", {}),
+        }
+        return json.dumps(payload, default=str)
+
+
+class BackgroundHandler(QueueHandler):
+    """ Queue records for a listener thread that writes them to a file or stderr.
+
+    The thread is started by the first record, so a disabled logger costs nothing.
+    """
+
+    def __init__(self, filename=None):
+        super().__init__(SimpleQueue())
+        self.filename = filename
+        self.listener = None
+        self.start_lock = threading.Lock()
+
+    def _start(self):
+        with self.start_lock:
+            if self.listener is None:
+                target = logging.FileHandler(self.filename) if self.filename else logging.StreamHandler(sys.stderr)
+                target.setFormatter(StructuredFormatter())
+                self.listener = QueueListener(self.queue, target, respect_handler_level=True)
+                self.listener.start()
+                atexit.register(self.stop)  # flush what is still queued on shutdown
+
+    def stop(self):
+        """ Write out everything queued and stop the listener thread """
+        with self.start_lock:
+            if self.listener is not None:
+                self.listener.stop()
+                self.listener = None
+
+    def enqueue(self, record):
+        if self.listener is None:
+            self._start()
+        super().enqueue(record)
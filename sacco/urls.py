@@ -1,5 +1,6 @@
+from django.contrib.auth import views as auth_views
 from django.urls import path
-from . import views
+from . import api, views
 
 urlpatterns = [
     path('', views.home, name='home'),
@@ -12,6 +13,7 @@ urlpatterns = [
     path('repay-loan/', views.repay_loan, name='repay_loan'),
     path('loan-approval/', views.loan_approval, name='loan_approval'),
     path('process-loan/<int:loan_id>/<str:action>/', views.process_loan, name='process_loan'),
+    path('process-loans/', views.bulk_loan_decision, name='bulk_loan_decision'),
     path('repay-loan/', views.repay_loan, name='repay_loan'),
     path("transfer-funds/", views.transfer_funds, name="transfer_funds"),
     path("withdraw-loan/<int:loan_id>/", views.withdraw_loan, name="withdraw_loan"),
@@ -23,5 +25,17 @@ urlpatterns = [
     path('about/', views.about_us, name='about_us'),
     path('services/', views.services, name='services'),
     path('generate-report/', views.generate_report, name='generate_report'),
+    path('statement/', views.member_statement, name='member_statement'),
+    path('portfolio-report/', views.portfolio_report, name='portfolio_report'),
+    path('admin-metrics/', views.instrumentation_stats, name='instrumentation_stats'),
+    # Set-password links issued by the bulk member import
+    path('reset/<uidb64>/<token>/', auth_views.PasswordResetConfirmView.as_view(), name='password_reset_confirm'),
+    path('reset/done/', auth_views.PasswordResetCompleteView.as_view(), name='password_reset_complete'),
+    # JSON API for mobile clients (async views, served through sacco_management/asgi.py)
+    path('api/v1/balance/', api.balance, name='api_balance'),
+    path('api/v1/statement/', api.statement, name='api_statement'),
+    path('api/v1/transfer/', api.transfer, name='api_transfer'),
+    path('api/v1/loans/', api.loans, name='api_loans'),
+    path('api/v1/loans/<int:loan_id>/', api.loan_status, name='api_loan_status'),
 
 ]
@@ -1,20 +1,26 @@
 import json
-import csv
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.forms import AuthenticationForm
 from django.contrib import messages
-from django.core.paginator import Paginator
-from django.utils.timezone import now, timedelta
-from django.http import HttpResponse
+from django.utils.timezone import now, localdate, timedelta
+from django.http import HttpResponse, StreamingHttpResponse
 from decimal import Decimal
 from django.db.models import Count, Sum,F
 from .forms import *
 from .models import * 
+from . import archive, dashboard_cache, dividends, instrumentation, portfolio, posting, statements, summary
+from .search import search_transactions
+from .reports import report_filters, iter_report_rows
+from .tracing import trace
 from django.http import JsonResponse
 
 
+DASHBOARD_ROWS = 10
+MAX_LOAN_DECISIONS = 10000
+
+
 # ✅ Function to check if the user is an admin
 def is_admin(user):
     return user.is_superuser or user.groups.filter(name="Admin").exists()
@@ -25,30 +31,42 @@ def is_admin(user):
 @login_required(login_url='/login/')
 @user_passes_test(is_admin, login_url='/login/')
 def loan_approval(request):
-    # Summary Data
-    total_members = Member.objects.count()
-    total_savings = Member.objects.aggregate(total_savings=models.Sum('savings_balance'))['total_savings'] or Decimal(0)
-    active_loans = Loan.objects.filter(status="approved").count()
-    
-    # Pending loans
-    pending_loans = Loan.objects.filter(status="pending")
-    pending_loans_count = pending_loans.count()  # Ensure query evaluation in the view
+    # Summary Data (SACCO-wide KPIs and recent transactions, cached; see sacco/summary.py)
+    kpis = summary.get_summary()
 
-    # Recent Transactions (Latest 10)
-    transactions = Transaction.objects.order_by('-created_at')[:10] or None
+    # Pending loans (member and user joined in, since every row shows the username)
+    pending_loans = Loan.objects.filter(status="pending").select_related("member__user")
 
     context = {
-        "total_members": total_members,
-        "total_savings": total_savings,
-        "active_loans": active_loans,
+        "total_members": kpis["total_members"],
+        "total_savings": kpis["total_savings"],
+        "active_loans": kpis["active_loans"],
         "pending_loans": pending_loans,
-        "pending_loans_count": pending_loans_count,  # Now available in the template
-        "transactions": transactions,
+        "pending_loans_count": kpis["pending_loans_count"],
+        "transactions": kpis["transactions"] or None,  # Recent Transactions (Latest 10)
     }
     
     return render(request, "sacco/admin_loan_approval.html", context)
 
 
+# ✅ Admin Loan Portfolio Report (PAR, aging, cohorts; computed once a day, see sacco/portfolio.py)
+@login_required(login_url='/login/')
+@user_passes_test(is_admin, login_url='/login/')
+def portfolio_report(request):
+    analytics = portfolio.get_analytics(refresh=request.method == "POST")
+    return render(request, "sacco/portfolio_report.html", {"analytics": analytics})
+
+
+# ✅ Admin Request Metrics (JSON from the instrumentation middleware's collector)
+@login_required(login_url='/login/')
+@user_passes_test(is_admin, login_url='/login/')
+def instrumentation_stats(request):
+    if request.method == "POST" and request.POST.get("reset"):
+        instrumentation.collector.reset()
+        dashboard_cache.counters.reset()
+    return JsonResponse({**instrumentation.collector.snapshot(), "dashboard_cache": dashboard_cache.counters.snapshot()})
+
+
 # ✅ Admin Processing Loan Requests
 @login_required(login_url='/login/')
 @user_passes_test(is_admin, login_url='/login/')
@@ -61,11 +79,8 @@ def process_loan(request, loan_id, action):
         if amount <= 0:
             messages.error(request, "Loan amount must be greater than zero.")
         else:
-            loan.amount = amount
-            loan.remaining_balance = amount  # Set remaining balance
-            loan.status = "approved"
-            loan.reviewed_by = request.user
-            loan.save()
+            # Sets the amount and funds the remaining balance through the journal
+            loan = posting.approve_loan(loan, amount, request.user)
 
             messages.success(request, f"Loan of {amount} approved for {loan.member.user.username}.")
 
@@ -78,6 +93,27 @@ def process_loan(request, loan_id, action):
     return redirect("loan_approval")
 
 
+# ✅ Admin Bulk Loan Decisions (JSON: {"decisions": [{"loan": <id>, "action": "approve"|"reject", "amount": "<amount>"}, ...]})
+@login_required(login_url='/login/')
+@user_passes_test(is_admin, login_url='/login/')
+def bulk_loan_decision(request):
+    if request.method != "POST":
+        return JsonResponse({"success": False, "message": "POST a list of decisions."}, status=405)
+    try:
+        decisions = [
+            (int(item["loan"]), item.get("action"), item.get("amount"))
+            for item in json.loads(request.body)["decisions"]
+        ]
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return JsonResponse({"success": False, "message": "Invalid decisions."}, status=400)
+    if len(decisions) > MAX_LOAN_DECISIONS:
+        return JsonResponse({"success": False, "message": f"At most {MAX_LOAN_DECISIONS} decisions per request."}, status=400)
+
+    outcomes = posting.decide_loans(decisions, request.user)
+    counts = {status: sum(outcome["status"] == status for outcome in outcomes) for status in ("approved", "rejected", "skipped")}
+    return JsonResponse({"success": True, **counts, "outcomes": outcomes})
+
+
 # ✅ Home Page
 def home(request):
     is_admin = request.user.is_authenticated and request.user.is_staff  # Check if user is admin
@@ -90,9 +126,7 @@ def register(request):
         user_form = UserRegistrationForm(request.POST)
         member_form = MemberForm(request.POST)
         if user_form.is_valid() and member_form.is_valid():
-            user = user_form.save(commit=False)
-            user.set_password(user_form.cleaned_data['password'])
-            user.save()
+            user = user_form.save()  # UserRegistrationForm.save hashes the password once
             member = member_form.save(commit=False)
             member.user = user
             member.save()
@@ -155,16 +189,8 @@ def make_transaction(request):
         if amount <= 0:
             messages.error(request, "Amount must be greater than zero.")
         else:
-            # Ensure balance and loan amounts are properly handled as Decimal
-            member.balance += amount  # Ensure `balance` is Decimal in your model
-            member.save()
-
-            Transaction.objects.create(
-                member=member,
-                amount=amount,
-                transaction_type="deposit",  # Or "withdrawal" based on logic
-                description="User deposit",
-            )
+            # The posting engine credits the wallet and records the deposit atomically
+            posting.deposit(member, amount, description="User deposit")
 
             messages.success(request, "Transaction successful.")
             return redirect("dashboard")  # Adjust based on your routing
@@ -174,72 +200,47 @@ def make_transaction(request):
 
 
 
-@login_required(login_url='/login/')
-def dashboard(request):
-    user = request.user
-    
+def _dashboard_context(user, today):
+    """ Everything the dashboard shows for one member, built from the database """
     # Ensure member exists
     member, created = Member.objects.get_or_create(user=user, defaults={'phone': 'Not Provided'})
 
     # Fetch all relevant data
-    loans = Loan.objects.filter(member=member, status="approved")
-    transactions = Transaction.objects.filter(member=member)
-    loan_repayment_history = LoanRepayment.objects.filter(loan__member=member).order_by("-date_paid")
-    transfers = transactions.filter(transaction_type="transfer")
+    # Latest rows only: the full history is on the transaction history page and in statements
+    loans = list(Loan.objects.filter(member=member, status="approved").order_by("id"))
+    transactions = list(Transaction.objects.filter(member=member).order_by("-created_at")[:DASHBOARD_ROWS])
+    loan_repayment_history = list(LoanRepayment.objects.filter(loan__member=member).select_related("loan").order_by("-date_paid")[:DASHBOARD_ROWS])
+    transfers = list(Transaction.objects.filter(member=member, transaction_type="transfer").order_by("-created_at")[:DASHBOARD_ROWS])
 
     # Wallet & Savings Balances
     wallet_balance = float(member.balance or 0)  # Convert Decimal to float
     savings_balance = float(member.savings_balance or 0)  # Convert Decimal to float
     total_account_balance = wallet_balance + savings_balance  # Wallet + Savings (No Loans Included)
 
-    # Get first approved loan and refresh it
-    loan = loans.filter(remaining_balance__gt=0).first()
-    if loan:
-        loan.refresh_from_db()  # Ensure latest data
-
+    # First approved loan with money left on it, and the total left across them (all from the one loans query)
+    open_loans = [loan for loan in loans if loan.remaining_balance > 0]
+    loan = open_loans[0] if open_loans else None
     loan_remaining_balance = float(loan.remaining_balance) if loan else 0.0
-    # print(f"Debug Loan Remaining Balance: {loan_remaining_balance}")
-
-    # Calculate Total Remaining Loan Balance
-    total_loan_balance = loans.filter(remaining_balance__gt=0).aggregate(
-        total=Sum(F("remaining_balance"))
-    )["total"] or Decimal(0)
-    total_loan_balance = float(total_loan_balance)  # Convert Decimal to float
-
-    # print(f"Total Loan Balance Debug: {total_loan_balance}")
+    total_loan_balance = float(sum((loan.remaining_balance for loan in open_loans), Decimal(0)))
 
     # Loan Status Breakdown
-    loan_status = loans.values("status").annotate(count=Count("status"))
     loan_counts = {"pending": 0, "approved": 0, "rejected": 0}
-    for loan_status_item in loan_status:
-        loan_counts[loan_status_item["status"]] = loan_status_item["count"]
-
-    # Transaction Data for Chart.js (Last 7 Days)
-    last_week = now() - timedelta(days=7)
-    daily_totals = {}
-
-    for i in range(7):
-        day = (last_week + timedelta(days=i)).strftime("%b %d")
-        daily_totals[day] = {"deposit": 0.0, "withdrawal": 0.0}
-
-    last_week_transactions = transactions.filter(created_at__gte=last_week).values("created_at", "transaction_type", "amount")
-
-    for txn in last_week_transactions:
-        date_key = txn["created_at"].strftime("%b %d")
-        if date_key in daily_totals:
-            amount = float(txn["amount"])  # Convert Decimal to float
-            if txn["transaction_type"] == "deposit":
-                daily_totals[date_key]["deposit"] += amount
-            elif txn["transaction_type"] == "withdrawal":
-                daily_totals[date_key]["withdrawal"] += amount
-
-    transaction_dates = list(daily_totals.keys())
-    deposit_amounts = [daily_totals[day]["deposit"] for day in transaction_dates]
-    withdrawal_amounts = [daily_totals[day]["withdrawal"] for day in transaction_dates]
-    
+    for approved_loan in loans:
+        loan_counts[approved_loan.status] += 1
+
+    # Transaction Data for Chart.js (Last 7 Days, today included) from the daily rollup
+    chart_days = [today - timedelta(days=offset) for offset in range(6, -1, -1)]
+    daily_flows = {
+        flow["day"]: flow
+        for flow in DailyFlow.objects.filter(member=member, day__gte=chart_days[0]).values("day", "deposits", "withdrawals")
+    }
+
+    transaction_dates = [day.strftime("%b %d") for day in chart_days]
+    deposit_amounts = [float(daily_flows[day]["deposits"]) if day in daily_flows else 0.0 for day in chart_days]
+    withdrawal_amounts = [float(daily_flows[day]["withdrawals"]) if day in daily_flows else 0.0 for day in chart_days]
+
     # Convert lists to JSON for frontend use
-    context = {
-        'user': user,
+    return {
         'member': member,
         'loans': loans,
         'loan': loan,
@@ -258,15 +259,30 @@ def dashboard(request):
         'deposit_amounts': json.dumps(deposit_amounts),
         'withdrawal_amounts': json.dumps(withdrawal_amounts),
     }
-    print(f"Final Context Loan Balance Debug: {context['total_loan_balance']}")
 
-    return render(request, 'sacco/dashboard.html', context)
+
+@login_required(login_url='/login/')
+def dashboard(request):
+    user = request.user
+    today = localdate()
+
+    # Served from the per-member cache (sacco/dashboard_cache.py) until a posting touches the member
+    member_id = Member.objects.filter(user=user).values_list("id", flat=True).first()
+    if member_id is None:
+        context = _dashboard_context(user, today)
+    else:
+        context = dashboard_cache.get(member_id, today, lambda: _dashboard_context(user, today))
+
+    loan = context['loan']
+    trace("dashboard", member_id=context['member'].id, loan_id=loan.id if loan else None, total_loan_balance=context['total_loan_balance'])
+
+    return render(request, 'sacco/dashboard.html', {'user': user, **context})
 
 
 @login_required(login_url='/login/')
 def repay_loan(request):
     member = request.user.member  # Get logged-in user's member profile
-    loans = Loan.objects.filter(member=member, status="approved", amount__gt=0)  # Show only active loans
+    loans = Loan.objects.filter(member=member, status="approved", remaining_balance__gt=0)  # Show only active loans
 
     if request.method == "POST":
         form = LoanRepaymentForm(request.POST)
@@ -277,7 +293,7 @@ def repay_loan(request):
             amount_to_pay = repayment.amount_paid
 
             # ✅ Ensure the loan belongs to the logged-in user
-            if loan.member != member:
+            if loan.member_id != member.id:
                 messages.error(request, "You can only repay your own loan!")
                 return redirect("dashboard")
 
@@ -286,35 +302,14 @@ def repay_loan(request):
                 messages.error(request, "Repayment amount must be positive!")
                 return redirect("dashboard")
 
-            # ✅ Check available balance in the selected account
-            if selected_account == "wallet":
-                if member.balance < amount_to_pay:
-                    messages.error(request, "Insufficient funds in your Wallet!")
-                    return redirect("dashboard")
-                member.balance -= amount_to_pay  # Deduct from wallet
-
-            elif selected_account == "savings":
-                if member.savings_balance < amount_to_pay:
-                    messages.error(request, "Insufficient funds in your Savings Account!")
-                    return redirect("dashboard")
-                member.savings_balance -= amount_to_pay  # Deduct from savings
-
-            # ✅ Prevent overpayment
-            if loan.amount >= amount_to_pay:
-                loan.amount -= amount_to_pay
-                loan.save()
-                member.save()  # Save updated balances
-                repayment.save()
-
-                # ✅ Record the transaction
-                Transaction.objects.create(
-                    member=member,
-                    amount=amount_to_pay,
-                    transaction_type="withdrawal"
-                )
-
+            # ✅ Debit the selected account and reduce the loan in one atomic posting
+            try:
+                posting.repay_loan(member, loan, amount_to_pay, selected_account)
                 messages.success(request, "Loan repayment successful.")
-            else:
+            except posting.InsufficientFunds as e:
+                messages.error(request, str(e))
+            except ValueError:
+                # ✅ Prevent overpayment
                 messages.error(request, "Repayment amount exceeds loan balance!")
 
             return redirect("dashboard")
@@ -346,30 +341,12 @@ def transfer_funds(request):
             if from_account == to_account:
                 return JsonResponse({"success": False, "message": "Cannot transfer between the same account."})
 
-            if from_account == "wallet" and to_account == "savings":
-                if wallet_balance < amount:
-                    return JsonResponse({"success": False, "message": "Insufficient funds in Wallet!"})
-                member.balance -= amount
-                member.savings_balance += amount
-                description = "Transferred from Wallet to Savings"
-
-            elif from_account == "savings" and to_account == "wallet":
-                if savings_balance < amount:
-                    return JsonResponse({"success": False, "message": "Insufficient funds in Savings!"})
-                member.savings_balance -= amount
-                member.balance += amount
-                description = "Transferred from Savings to Wallet"
-
-            # ✅ Save updated balances
-            member.save()
-
-            # ✅ Log the transaction
-            transaction = Transaction.objects.create(
-                member=member,
-                amount=amount,
-                transaction_type="transfer",
-                description=description,
-            )
+            # ✅ Move the funds with a guarded, atomic posting
+            try:
+                transaction = posting.transfer(member, from_account, to_account, amount)
+            except ValueError as e:
+                return JsonResponse({"success": False, "message": str(e)})
+            description = transaction.description
 
             # ✅ Ensure balances are updated correctly
             wallet_balance = float(member.balance)
@@ -406,24 +383,8 @@ def withdraw_loan(request, loan_id):
             if amount < 1 or amount > loan.remaining_balance:
                 messages.error(request, "Invalid withdrawal amount.")
             else:
-                # Deduct from loan
-                loan.remaining_balance -= amount
-                loan.total_withdrawn += amount
-                loan.save()
-
-                # Update wallet balance
-                # print(f"Wallet Balance Before Withdrawal: {member.balance}")
-                member = loan.member
-                member.balance += amount
-                member.save()
-
-                # Log transaction
-                Transaction.objects.create(
-                    member=member,
-                    amount=amount,
-                    transaction_type="withdrawal",
-                    description=f"Loan withdrawal from Loan ID {loan.id}",
-                )
+                # Deduct from loan, credit the wallet and log the transaction atomically
+                posting.withdraw_loan(loan, amount)
 
                 messages.success(request, "Loan withdrawal successful.")
                 return redirect("dashboard")
@@ -451,20 +412,12 @@ def buy_shares(request):
         amount = Decimal(request.POST.get("amount", 0))
         price_per_share = Decimal(100)  # Set your share price here
 
-        if member.balance >= amount and amount > 0:
-            member.balance -= amount
-            member.save()
-            share.buy_shares(amount, price_per_share)
-
-            Transaction.objects.create(
-                member=member,
-                amount=amount,
-                transaction_type="share_purchase",
-                description=f"Purchased {amount / price_per_share} shares"
-            )
-
+        try:
+            if amount <= 0:
+                raise ValueError("Invalid amount")
+            posting.buy_shares(member, share, amount, price_per_share)
             messages.success(request, "Shares purchased successfully.")
-        else:
+        except ValueError:
             messages.error(request, "Insufficient balance or invalid amount.")
     
     return render(request, "sacco/buy_shares.html", {"member": member, "share": share})
@@ -495,27 +448,13 @@ def transfer_shares(request):
 
 
 def distribute_dividends():
-    total_shares = Share.objects.aggregate(total=models.Sum("shares_owned"))["total"] or 0
     total_dividends = Decimal(50000)  # Example: Total dividends for distribution
-
-    if total_shares > 0:
-        dividend_per_share = total_dividends / Decimal(total_shares)
-        for share in Share.objects.all():
-            payout = share.shares_owned * dividend_per_share
-            share.member.balance += payout
-            share.member.save()
-
-            Transaction.objects.create(
-                member=share.member,
-                amount=payout,
-                transaction_type="dividend",
-                description="Dividend payout"
-            )
+    return dividends.distribute_dividends(total_dividends)
 
 
 def transaction_history(request):
-    transactions = Transaction.objects.all().order_by('-created_at')  # Get latest first
-    
+    transactions = Transaction.objects.all()
+
     # Filtering logic (if user applies filters)
     transaction_type = request.GET.get('transaction_type')
     if transaction_type:
@@ -523,14 +462,24 @@ def transaction_history(request):
     
     search_query = request.GET.get('search')
     if search_query:
-        transactions = transactions.filter(description__icontains=search_query)
-
-    # Pagination (10 transactions per page)
-    paginator = Paginator(transactions, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-
-    return render(request, 'sacco/transaction_history.html', {'transactions': page_obj})
+        transactions = search_transactions(search_query, transactions)
+
+    # Keyset pagination (10 transactions per page, latest first); total is capped so it never counts the whole ledger.
+    # Once the hot rows run out, pages carry on into the archived months.
+    paginator = archive.ArchivePaginator(transactions, 10, count_limit=1000, transaction_type=transaction_type, search=search_query)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
+
+    # Keep the active filters on the next/previous links
+    filters = request.GET.copy()
+    filters.pop('cursor', None)
+    filters.pop('page', None)
+
+    return render(request, 'sacco/transaction_history.html', {
+        'transactions': page_obj,
+        'filter_query': filters.urlencode(),
+        'transaction_type': transaction_type or '',
+        'search_query': search_query or '',
+    })
 
 def about_us(request):
     return render(request, 'sacco/about_us.html')
@@ -539,15 +488,29 @@ def services(request):
     return render(request, 'sacco/services_page.html') 
 
 def generate_report(request):
-    # Create a CSV response
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="sacco_report.csv"'
+    # Stream the CSV so memory stays flat no matter how large the ledger is.
+    # Optional filters: ?start_date=YYYY-MM-DD&end_date=YYYY-MM-DD&member=<username>&transaction_type=<type>
+    # Archived months are read from their segment files ahead of the hot table
+    transactions = archive.report_rows(**report_filters(request.GET))
 
-    writer = csv.writer(response)
-    writer.writerow(['Member', 'Amount', 'Type', 'Date'])
+    response = StreamingHttpResponse(iter_report_rows(transactions), content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename="sacco_report.csv"'
+    return response
 
-    transactions = Transaction.objects.all()
-    for transaction in transactions:
-        writer.writerow([transaction.member.user.username, transaction.amount, transaction.transaction_type, transaction.created_at])
 
-    return response
\ No newline at end of file
+# ✅ Member Statement (streamed; ?account=wallet|savings&start_date=YYYY-MM-DD&end_date=YYYY-MM-DD&format=pdf|csv)
+@login_required(login_url='/login/')
+def member_statement(request):
+    member = get_object_or_404(Member.objects.select_related("user"), user=request.user)
+    today = localdate()
+    kind = request.GET.get("account") if request.GET.get("account") in statements.STATEMENT_ACCOUNTS else "wallet"
+    format = request.GET.get("format") if request.GET.get("format") in statements.FORMATS else "pdf"
+    filters = report_filters(request.GET)
+    end = min(filters["end_date"] or today, today)
+    start = min(filters["start_date"] or end.replace(day=1), end)
+
+    statement = statements.Statement(member, kind, start, end)
+    iterate, content_type = statements.FORMATS[format]
+    response = StreamingHttpResponse(iterate(statement), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{kind}_statement_{start:%Y%m%d}_{end:%Y%m%d}.{format}"'
+    return response
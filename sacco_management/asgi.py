@@ -3,6 +3,10 @@ ASGI config for sacco_management project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve it with an ASGI server (e.g. `uvicorn sacco_management.asgi:application`)
+so the async JSON API in sacco.api runs on the event loop; the rest of the site's
+views are sync and Django runs them in a thread pool.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 """
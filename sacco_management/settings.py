@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,6 +42,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so sampled wall and SQL time cover every other middleware (see SACCO_INSTRUMENTATION)
+    'sacco.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -50,6 +53,14 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Request instrumentation: a sampled fraction of requests is measured and aggregated in memory,
+# per process, and served as JSON at /admin-metrics/ (admins only)
+SACCO_INSTRUMENTATION = {
+    'ENABLED': True,
+    'SAMPLE_RATE': 0.1,
+    'SLOW_STATEMENTS': 5,
+}
+
 ROOT_URLCONF = 'sacco_management.urls'
 
 TEMPLATES = [
@@ -69,6 +80,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'sacco_management.wsgi.application'
+ASGI_APPLICATION = 'sacco_management.asgi.application'  # Needed for the async /api/v1/ views to run without a thread each
 
 
 # Database
@@ -78,10 +90,86 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Concurrent workers wait for the write lock instead of failing with "database is locked",
+            # and atomic blocks take it up front so two postings can never deadlock on upgrade
+            'timeout': 20,
+            'transaction_mode': 'IMMEDIATE',
+        },
+        'TEST': {
+            # File-backed so the concurrency tests can open one connection per thread
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
     }
 }
 
 
+# Caches
+# The admin summary (sacco/summary.py) uses the SACCO_SUMMARY_CACHE alias. Local memory is per
+# process; with several workers point the alias at a shared backend, for example
+#   'summary': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': BASE_DIR / 'cache'}
+#   'summary': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'sacco_cache'}  # manage.py createcachetable
+# The loan portfolio analytics (sacco/portfolio.py) are cached per day in the same alias. With local
+# memory, manage.py portfolio_analytics only warms its own process and the web workers still compute
+# the report on first view; loan postings only drop the entry in the process that made them.
+#
+# Member dashboards (sacco/dashboard_cache.py) use SACCO_DASHBOARD_CACHE. Local memory evicts the
+# least recently used entries once MAX_ENTRIES is reached and expires them after TIMEOUT seconds.
+# It is per process too, and so are the version counters the bumps move: a posting made by another
+# web worker or by a management command (process_checkoff, dividends, reconcile_balances --repair,
+# batch workers) does not reach this worker's entries, and its members see their old balances for
+# up to TIMEOUT. Local memory only suits a single process; otherwise point the alias at a shared
+# backend like the summary examples above.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'dashboard': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'sacco-dashboard',
+        'TIMEOUT': 300,
+        'OPTIONS': {'MAX_ENTRIES': 20000, 'CULL_FREQUENCY': 4},
+    },
+}
+
+SACCO_SUMMARY_CACHE = 'default'
+SACCO_DASHBOARD_CACHE = 'dashboard'
+
+
+# Ledger archive
+# manage.py archive_transactions moves months older than SACCO_HOT_MONTHS out of the transaction
+# table into one gzip CSV per month under SACCO_ARCHIVE_DIR (see sacco/archive.py). Back the
+# directory up with the database: reports read archived months from it.
+
+SACCO_ARCHIVE_DIR = BASE_DIR / 'archive'
+SACCO_HOT_MONTHS = 12
+
+
+# Logging
+# sacco.trace carries structured model/view events (loan_id, member_id, balances). It is off unless
+# SACCO_TRACE_LEVEL=DEBUG; records are then written as JSON lines by a background thread, to
+# SACCO_TRACE_FILE if set, otherwise stderr.
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'sacco_trace': {
+            'class': 'sacco.tracing.BackgroundHandler',
+            'filename': os.environ.get('SACCO_TRACE_FILE'),
+        },
+    },
+    'loggers': {
+        'sacco.trace': {
+            'handlers': ['sacco_trace'],
+            'level': os.environ.get('SACCO_TRACE_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 